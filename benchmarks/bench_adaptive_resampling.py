@@ -0,0 +1,65 @@
+"""
+.. module:: bench_adaptive_resampling
+   :synopsis: compares vertex counts of uniform and adaptive contour resampling.
+
+Run from the home directory of ZFBrain with
+`python -m benchmarks.bench_adaptive_resampling`.
+"""
+
+import os
+import time
+
+import numpy as np
+from scipy import interpolate
+
+import zfbrain.surface_plotting as sp
+
+INPUT_FILE = os.path.join(os.path.dirname(__file__), "..", "zfbrain", "data",
+                          "songbird_brain.xml")
+MAX_ERRORS = [5.0, 2.0, 1.0, 0.5]
+
+
+def uniform_points(tck, max_error, u_dense, x, y):
+    """Smallest number of evenly spaced points within max_error of tck,
+    up to the limit of adaptive resampling."""
+    lo, hi = sp.ADAPTIVE_MIN_POINTS, sp.ADAPTIVE_MAX_POINTS
+    while lo < hi:
+        mid = (lo + hi)//2
+        u = np.linspace(0, 1, mid, endpoint=False)
+        if sp._max_deviation(tck, u, u_dense, x, y) <= max_error:
+            hi = mid
+        else:
+            lo = mid + 1
+    return lo
+
+
+def main():
+    contours = sp.read_contours(INPUT_FILE)
+    u_dense = np.linspace(0, 1, sp.ADAPTIVE_SAMPLES, endpoint=False)
+
+    print(f"{'region':>20} {'error (um)':>11} {'uniform':>8} {'adaptive':>9} "
+          f"{'ratio':>6} {'time (ms)':>10}")
+    for name, (points, nodes) in contours.items():
+        offsets = np.concatenate(([0], np.cumsum(points)))
+        tcks = [sp._fit_contour(nodes[offsets[ti]:offsets[ti+1], 0],
+                                nodes[offsets[ti]:offsets[ti+1], 1])
+                for ti in range(len(points))]
+        dense = [interpolate.splev(u_dense, tck) for tck in tcks]
+
+        for max_error in MAX_ERRORS:
+            n_uniform = sum(uniform_points(tck, max_error, u_dense, x, y)
+                            for tck, (x, y) in zip(tcks, dense))
+            start = time.perf_counter()
+            # as `python -m zfbrain generate --max-error` does
+            xi, _ = sp.get_interpolants(nodes, points,
+                                        sp.REGION_TABLE[name]['N_interp'],
+                                        max_error=max_error)
+            elapsed = time.perf_counter() - start
+            n_adaptive = sum(len(x) for x in xi)
+            print(f"{name:>20} {max_error:>11.1f} {n_uniform:>8} "
+                  f"{n_adaptive:>9} {n_uniform/n_adaptive:>6.2f} "
+                  f"{1000*elapsed:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
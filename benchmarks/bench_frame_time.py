@@ -0,0 +1,60 @@
+"""
+.. module:: bench_frame_time
+   :synopsis: compares frame times of batched atlas and per-item drawing.
+
+Run from the home directory of ZFBrain with
+`python -m benchmarks.bench_frame_time`. This opens a window, so it needs
+a display with OpenGL.
+"""
+
+import statistics
+import time
+
+from pyqtgraph.Qt import QtWidgets
+
+from zfbrain import gui
+
+FRAMES = 200
+
+
+def frame_times(app, batched):
+    """Frame times (s) while orbiting around all regions."""
+    window = gui.MainWindow(batched=batched)
+    window.show()
+    window.sl.brc.set_all_checked(True)
+    view = window.brv
+
+    swapped = []
+    view.frameSwapped.connect(lambda: swapped.append(time.perf_counter()))
+
+    # let every region load and upload before timing
+    for _ in range(20):
+        app.processEvents()
+
+    times = []
+    for _ in range(FRAMES):
+        del swapped[:]
+        start = time.perf_counter()
+        view.orbit(2, 0)
+        while not swapped:
+            app.processEvents()
+        times.append(swapped[0] - start)
+
+    window.close()
+    return times
+
+
+def main():
+    app = QtWidgets.QApplication([])
+
+    print(f"{'mode':>10} {'median (ms)':>12} {'p95 (ms)':>9} {'fps':>6}")
+    for label, batched in [("per-item", False), ("atlas", True)]:
+        times = sorted(frame_times(app, batched))
+        median = statistics.median(times)
+        p95 = times[int(0.95*len(times))]
+        print(f"{label:>10} {1000*median:>12.2f} {1000*p95:>9.2f} "
+              f"{1/median:>6.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""
+.. module:: bench_normals
+   :synopsis: times vertex normals of pyqtgraph against surface_plotting.
+
+Run from the home directory of ZFBrain with
+`python -m benchmarks.bench_normals`.
+"""
+
+import os
+import tempfile
+
+import pyqtgraph.opengl as gl
+
+import zfbrain.surface_plotting as sp
+from benchmarks.bench_read_surface import best_of, make_surface
+
+SHAPES = [(18, 100), (100, 500), (300, 1000)]
+
+
+def meshdata_normals(verts, faces):
+    """Normals as computed by GLMeshItem(smooth=True) at startup."""
+    return gl.MeshData(vertexes=verts, faces=faces).vertexNormals()
+
+
+def main():
+    print(f"{'L':>6} {'N':>6} {'MeshData (s)':>13} {'faces (s)':>10} "
+          f"{'grid (s)':>9} {'surfb (s)':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for L, N in SHAPES:
+            out = os.path.join(tmp, f"bench_{L}_{N}")
+            verts, faces = sp.read_surface(make_surface(L, N, out))
+            surfb_file = sp.convert_surf(out + ".surf")
+
+            t_md = best_of(meshdata_normals, verts, faces, repeat=1)
+            t_faces = best_of(sp.surface_normals, verts, faces)
+            t_grid = best_of(sp.grid_normals, verts, L, N)
+            # reading the stored normals back, as the viewer does
+            t_surfb = best_of(lambda: sp.read_surface_binary(
+                surfb_file, with_normals=True)[2].sum())
+            print(f"{L:>6} {N:>6} {t_md:>13.4f} {t_faces:>10.4f} "
+                  f"{t_grid:>9.4f} {t_surfb:>10.4f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+.. module:: bench_picking
+   :synopsis: times ray queries against a BVH and against every face.
+
+Run from the home directory of ZFBrain with
+`python -m benchmarks.bench_picking`.
+"""
+
+import os
+import tempfile
+import time
+
+import numpy as np
+
+import zfbrain.surface_plotting as sp
+from zfbrain.bvh import BVH
+from zfbrain.resources import surface_path
+from benchmarks.bench_read_surface import best_of
+
+SHAPES = [(100, 500), (200, 1000)]
+BATCH = 10000
+SINGLE = 200
+# rays tested against every face, which is slow for the large surfaces
+BRUTE = 20
+
+
+def make_tube(L, N, out_filename):
+    """Writes a round tube of L slices by N points per slice, about as wide
+    as it is long."""
+    theta = np.linspace(0, 2*np.pi, N, endpoint=False)
+    A = np.zeros((L*N, 3))
+    A[:, 0] = np.tile(np.cos(theta), L)*L*20
+    A[:, 1] = np.tile(np.sin(theta), L)*L*20
+    A[:, 2] = np.repeat(np.arange(L), N)*40.0
+    return sp.write_surf(A, L, N, out_filename)
+
+
+def random_rays(verts, count, rng):
+    """Rays from around the surface at points near it, as from a camera
+    orbiting it."""
+    centre = verts.mean(axis=0)
+    size = np.ptp(verts, axis=0).max()
+    origins = centre + rng.normal(size=(count, 3))*size
+    targets = (verts[rng.integers(len(verts), size=count)]
+               + rng.normal(size=(count, 3))*size/20)
+    return origins, targets - origins
+
+
+def main():
+    rng = np.random.default_rng(0)
+    surfaces = [(name, surface_path(name))
+                for name in ["whole_brain_L", "HVC_L"]]
+
+    print(f"{'surface':>15} {'faces':>8} {'build (s)':>10} "
+          f"{'all faces':>10} {'BVH, 1 ray':>11} {'BVH, batch':>11} "
+          f"(rays/s)")
+    with tempfile.TemporaryDirectory() as tmp:
+        for L, N in SHAPES:
+            out = os.path.join(tmp, f"bench_{L}_{N}")
+            surfaces.append((f"{L}x{N}", make_tube(L, N, out)))
+
+        for label, path in surfaces:
+            verts, faces = sp.read_surface(path)
+            t_build = best_of(BVH, verts, faces)
+            bvh = BVH(verts, faces)
+            # one leaf holding every face tests each ray against all of them
+            brute = BVH(verts, faces, leaf_size=len(faces))
+
+            origins, directions = random_rays(verts, BATCH, rng)
+            start = time.perf_counter()
+            for ti in range(BRUTE):
+                brute.intersect(origins[ti], directions[ti])
+            r_brute = BRUTE/(time.perf_counter() - start)
+            start = time.perf_counter()
+            for ti in range(SINGLE):
+                bvh.intersect(origins[ti], directions[ti])
+            r_single = SINGLE/(time.perf_counter() - start)
+            r_batch = BATCH/best_of(bvh.intersect, origins, directions)
+
+            print(f"{label:>15} {len(faces):>8} {t_build:>10.4f} "
+                  f"{r_brute:>10.0f} {r_single:>11.0f} {r_batch:>11.0f}")
+
+
+if __name__ == '__main__':
+    main()
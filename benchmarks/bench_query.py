@@ -0,0 +1,46 @@
+"""
+.. module:: bench_query
+   :synopsis: times point-in-region labelling of random points.
+
+Run from the home directory of ZFBrain with
+`python -m benchmarks.bench_query`.
+"""
+
+import os
+import time
+
+import numpy as np
+
+from zfbrain import query
+from benchmarks.bench_read_surface import best_of
+
+SIZES = [10**4, 10**5, 10**6]
+
+
+def main():
+    start = time.perf_counter()
+    indices = query.region_indices()
+    print(f"Built {len(indices)} region indices in "
+          f"{time.perf_counter() - start:.3f} s")
+
+    # random points over the bounding box of the whole brain
+    lo = np.min([indices[name].lo for name in indices], axis=0)
+    hi = np.max([indices[name].hi for name in indices], axis=0)
+    order = np.argsort(query.RAY_AXES)
+    rng = np.random.default_rng(0)
+
+    cpus = os.cpu_count()
+    print(f"{'points':>9} {'1 process (s)':>14} {'points/s':>10} "
+          f"{f'{cpus} processes (s)':>16} {'points/s':>10}")
+    for size in SIZES:
+        points = rng.uniform(lo[order], hi[order], size=(size, 3))
+        t_one = best_of(lambda: query.classify(points, processes=1,
+                                               indices=indices), repeat=1)
+        t_all = best_of(lambda: query.classify(points, processes=cpus,
+                                               indices=indices), repeat=1)
+        print(f"{size:>9} {t_one:>14.3f} {size/t_one:>10.0f} "
+              f"{t_all:>16.3f} {size/t_all:>10.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+.. module:: bench_read_contours
+   :synopsis: compares the streaming contour reader with the two-pass ET reader.
+
+Run from the home directory of ZFBrain with
+`python -m benchmarks.bench_read_contours`.
+"""
+
+import os
+import tempfile
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+import zfbrain.surface_plotting as sp
+
+# (number of contours, points per contour, images in the <image> block)
+SIZES = [(40, 40, 20), (400, 400, 2000), (800, 800, 8000)]
+NAMES = list(sp.REGION_TABLE)
+
+
+def make_xml(n_contours, n_points, n_images, out_file):
+    """Writes a synthetic Neurolucida XML file."""
+    theta = np.linspace(0, 2*np.pi, n_points, endpoint=False)
+    with open(out_file, "w") as f:
+        f.write('<?xml version="1.0" encoding="ISO-8859-1"?>\n')
+        f.write(f'<mbf version="3.0" xmlns="{sp.NEUROLUCIDA_NS[1:-1]}">\n<image>')
+        for ti in range(n_images):
+            f.write(f'<filename>im{ti:05d}.png</filename><channels merge="no">'
+                    '<channel id="red" source="none"/></channels>'
+                    '<scale x="1.470588" y="1.470588"/>'
+                    f'<coord x="-1220.53" y="691.25" z="{ti*10.0:.2f}"/>'
+                    '<zspacing>0.000000</zspacing>')
+        f.write('</image>\n')
+        for ti in range(n_contours):
+            f.write(f'<contour name="{NAMES[ti % len(NAMES)]}" closed="true">\n'
+                    '  <property name="GUID">670DE2D8</property>\n'
+                    '<resolution>2.905409</resolution>')
+            for x, y in zip(1000*np.cos(theta), 1000*np.sin(theta)):
+                f.write(f'  <point x="{x:.2f}" y="{y:.2f}" z="{ti*40.0:.2f}" '
+                        f'd="2.91" sid="S{ti}"></point>\n')
+            f.write('</contour>\n')
+        f.write('</mbf>\n')
+
+
+def read_contours_two_pass(input_file, ATTRIB):
+    """Original reader of generate_*_surf: ET.parse plus two tree walks."""
+    tree = ET.parse(input_file)
+    root = tree.getroot()
+
+    points = []
+    ti = 0
+    contour_str = sp.NEUROLUCIDA_NS + 'contour'
+    point_str = sp.NEUROLUCIDA_NS + 'point'
+    for contour in root.iter(contour_str):
+        if (contour.attrib['name'] == ATTRIB):
+            points.append(0)
+            for point in contour.iter(point_str):
+                points[ti] += 1
+            ti += 1
+
+    nodes = np.zeros((sum(points), 3), dtype=float)
+
+    ti = 0
+    for contour in root.iter(contour_str):
+        if (contour.attrib['name'] == ATTRIB):
+            for point in contour.iter(point_str):
+                nodes[ti, 0] = point.attrib['x']
+                nodes[ti, 1] = point.attrib['y']
+                nodes[ti, 2] = point.attrib['z']
+                ti += 1
+
+    return points, nodes
+
+
+def two_pass_all(input_file):
+    """Reads every region the way the four generate_*_surf functions did."""
+    return {name: read_contours_two_pass(input_file, name) for name in NAMES}
+
+
+def measure(func, *args):
+    """Returns the wall-clock time and peak traced memory of func."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    print(f"{'file (MB)':>10} {'reader':>12} {'time (s)':>9} {'MB/s':>7} "
+          f"{'peak (MB)':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_contours, n_points, n_images in SIZES:
+            input_file = os.path.join(tmp, f"bench_{n_contours}.xml")
+            make_xml(n_contours, n_points, n_images, input_file)
+            size = os.path.getsize(input_file)/2**20
+
+            for label, func in [("two-pass ET", two_pass_all),
+                                ("iterparse", sp.read_contours)]:
+                elapsed, peak = measure(func, input_file)
+                print(f"{size:>10.1f} {label:>12} {elapsed:>9.3f} "
+                      f"{size/elapsed:>7.1f} {peak/2**20:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+.. module:: bench_read_surface
+   :synopsis: times read_surface against the original loop-based loader,
+   and the parallel load of the viewer's regions.
+
+Run from the home directory of ZFBrain with
+`python -m benchmarks.bench_read_surface`.
+"""
+
+import glob
+import os
+import tempfile
+import time
+
+import numpy as np
+
+import zfbrain.surface_plotting as sp
+from test.test_surface_plotting import read_surface_reference
+from zfbrain.resources import surface_path
+
+SHAPES = [(18, 100), (100, 500), (300, 1000), (600, 1500)]
+
+
+def make_surface(L, N, out_filename):
+    """Writes a synthetic tube of L slices by N points per slice."""
+    theta = np.linspace(0, 2*np.pi, N, endpoint=False)
+    z = np.arange(L, dtype=float)
+    A = np.zeros((L*N, 3), dtype=float)
+    A[:, 0] = np.tile(np.cos(theta), L)*(1 + 0.1*np.repeat(z, N))
+    A[:, 1] = np.tile(np.sin(theta), L)
+    A[:, 2] = np.repeat(z, N)*40.0
+    sp.write_surf(A, L, N, out_filename, description="benchmark surface")
+    return out_filename + ".surf"
+
+
+def best_of(func, *args, repeat=3):
+    """Returns the best wall-clock time of `repeat` calls to func(*args)."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    print(f"{'L':>6} {'N':>6} {'vertices':>10} {'loop (s)':>10} "
+          f"{'vectorized (s)':>15} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for L, N in SHAPES:
+            file_name = make_surface(L, N, os.path.join(tmp, f"bench_{L}_{N}"))
+            t_loop = best_of(read_surface_reference, file_name, repeat=1)
+            t_vec = best_of(sp.read_surface, file_name)
+            print(f"{L:>6} {N:>6} {L*N:>10} {t_loop:>10.4f} "
+                  f"{t_vec:>15.4f} {t_loop/t_vec:>7.1f}x")
+
+    # the _L and _R surfaces the viewer loads, through one pool
+    data_dir = os.path.join(os.path.dirname(__file__), "..", "zfbrain",
+                            "data")
+    names = sorted(os.path.basename(path)[:-len(".surf")] for path in
+                   glob.glob(os.path.join(data_dir, "*_[LR].surf")))
+    print()
+    sp.read_surfaces([surface_path(name, data_dir) for name in names],
+                     report=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""
+.. module:: bench_read_surface_memory
+   :synopsis: compares peak memory of the single-pass and streaming readers.
+
+Run from the home directory of ZFBrain with
+`python -m benchmarks.bench_read_surface_memory`.
+"""
+
+import os
+import tempfile
+import time
+import tracemalloc
+
+import zfbrain.surface_plotting as sp
+from benchmarks.bench_read_surface import make_surface
+
+SHAPES = [(100, 500), (300, 1000), (600, 1500)]
+
+
+def peak_memory(func, *args, **kwargs):
+    """Returns the wall-clock time and peak traced memory of func."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    verts, _ = func(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, verts.nbytes
+
+
+def main():
+    print(f"{'L':>6} {'N':>6} {'output (MB)':>12} {'mode':>8} "
+          f"{'peak (MB)':>10} {'peak/output':>12} {'time (s)':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for L, N in SHAPES:
+            file_name = make_surface(L, N, os.path.join(tmp, f"bench_{L}_{N}"))
+            for stream in (False, True):
+                elapsed, peak, nbytes = peak_memory(sp.read_surface, file_name,
+                                                    stream=stream)
+                mode = "stream" if stream else "default"
+                print(f"{L:>6} {N:>6} {nbytes/2**20:>12.1f} {mode:>8} "
+                      f"{peak/2**20:>10.1f} {peak/nbytes:>12.2f} "
+                      f"{elapsed:>9.3f}")
+
+
+if __name__ == '__main__':
+    main()
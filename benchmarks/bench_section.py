@@ -0,0 +1,61 @@
+"""
+.. module:: bench_section
+   :synopsis: times plane cross-sections with and without slice bands.
+
+Run from the home directory of ZFBrain with
+`python -m benchmarks.bench_section`.
+"""
+
+import os
+import tempfile
+
+import numpy as np
+
+import zfbrain.surface_plotting as sp
+from zfbrain.resources import surface_path
+from benchmarks.bench_read_surface import best_of, make_surface
+
+SHAPES = [(100, 500), (300, 1000)]
+# plane positions swept through the surface for each axis
+POSITIONS = 50
+
+
+def sweep(verts, faces, axis, bands=None):
+    """Mean time (ms) of one cut while sweeping the plane along `axis`."""
+    lo, hi = verts.min(axis=0), verts.max(axis=0)
+    normal = np.eye(3)[axis]
+    point = (lo + hi)/2
+
+    def run():
+        for position in np.linspace(lo[axis], hi[axis], POSITIONS):
+            point[axis] = position
+            sp.plane_section(verts, faces, point, normal, bands=bands)
+
+    return 1000*best_of(run)/POSITIONS
+
+
+def main():
+    surfaces = [(name, surface_path(name)) for name in
+                ["whole_brain_L", "HVC_L", "AreaX_L", "RA_L"]]
+
+    print(f"{'surface':>15} {'faces':>8} {'axis':>5} {'all (ms)':>9} "
+          f"{'bands (ms)':>11} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for L, N in SHAPES:
+            out = os.path.join(tmp, f"bench_{L}_{N}")
+            surfaces.append((f"{L}x{N}", make_surface(L, N, out)))
+
+        for label, path in surfaces:
+            _, L, N = sp.read_surface_header(path)
+            verts, faces = sp.read_surface(path)
+            bands = sp.section_bands(verts, L, N)
+            for axis in range(3):
+                t_all = sweep(verts, faces, axis)
+                t_bands = sweep(verts, faces, axis, bands)
+                print(f"{label:>15} {len(faces):>8} {'xyz'[axis]:>5} "
+                      f"{t_all:>9.3f} {t_bands:>11.3f} "
+                      f"{t_all/t_bands:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+.. module:: bench_toggle_latency
+   :synopsis: times region toggles until the next frame is on screen.
+
+Run from the home directory of ZFBrain with
+`python -m benchmarks.bench_toggle_latency`. This opens a window, so it
+needs a display with OpenGL.
+"""
+
+import statistics
+import time
+
+from pyqtgraph.Qt import QtWidgets
+
+from zfbrain import gui
+
+REPEAT = 10
+
+
+def legacy_toggled(window):
+    """Original handler: clear the view and re-add every checked region on
+    each single toggle."""
+    window.sl.brc.get_checked_state()
+    view = window.brv
+    view.clear()
+    for region, isChecked in zip(gui.REGIONS, window.sl.brc.isCheckedList):
+        if isChecked is True:
+            item = view.registry.item(region.name)
+            item.setVisible(True)
+            view.addItem(item)
+
+
+def toggle_latency(app, window, count):
+    """Median time from toggling `count` regions off or on to the end of
+    the next frame."""
+    view = window.brv
+    swapped = []
+    view.frameSwapped.connect(lambda: swapped.append(time.perf_counter()))
+
+    times = []
+    for _ in range(REPEAT):
+        for checked in (False, True):
+            del swapped[:]
+            start = time.perf_counter()
+            for checkBox in window.sl.brc.checkBoxes[:count]:
+                checkBox.setChecked(checked)
+            while not swapped:
+                app.processEvents()
+            times.append(swapped[0] - start)
+
+    view.frameSwapped.disconnect()
+    return statistics.median(times)
+
+
+def main():
+    app = QtWidgets.QApplication([])
+    window = gui.MainWindow()
+    window.show()
+    # build every region first, so that only toggling is timed
+    window.sl.brc.set_all_checked(True)
+    for _ in range(20):
+        app.processEvents()
+
+    n_regions = len(gui.REGIONS)
+    visibility = [toggle_latency(app, window, count)
+                  for count in range(1, n_regions+1)]
+
+    for checkBox in window.sl.brc.checkBoxes:
+        checkBox.toggled.disconnect()
+        checkBox.toggled.connect(lambda _: legacy_toggled(window))
+    legacy = [toggle_latency(app, window, count)
+              for count in range(1, n_regions+1)]
+
+    print(f"{'regions':>8} {'clear+re-add (ms)':>18} {'visibility (ms)':>16} "
+          f"{'speedup':>8}")
+    for count, (t_legacy, t_vis) in enumerate(zip(legacy, visibility), 1):
+        print(f"{count:>8} {1000*t_legacy:>18.2f} {1000*t_vis:>16.2f} "
+              f"{t_legacy/t_vis:>7.1f}x")
+
+    window.close()
+
+
+if __name__ == '__main__':
+    main()
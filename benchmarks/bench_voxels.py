@@ -0,0 +1,69 @@
+"""
+.. module:: bench_voxels
+   :synopsis: times building the voxel atlas, and lookups in it against
+   point-in-region tests on the meshes.
+
+Run from the home directory of ZFBrain with
+`python -m benchmarks.bench_voxels`.
+"""
+
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from zfbrain import query
+from zfbrain import voxels
+from benchmarks.bench_read_surface import best_of
+
+VOXEL_SIZES = [20, 10, 5]
+SIZES = [10**4, 10**5, 10**6]
+
+
+def main():
+    cpus = os.cpu_count()
+    indices = query.region_indices()
+
+    print(f"{'voxel (um)':>10} {'voxels':>10} {'1 process (s)':>14} "
+          f"{f'{cpus} processes (s)':>16} {'MB':>6}")
+    atlases = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for voxel_size in VOXEL_SIZES:
+            out_dir = os.path.join(tmp, f"atlas_{voxel_size}")
+            t_one = best_of(lambda: voxels.build_atlas(
+                voxel_size, out_dir=out_dir, processes=1), repeat=1)
+            t_all = best_of(lambda: voxels.build_atlas(
+                voxel_size, out_dir=out_dir, processes=cpus), repeat=1)
+            atlas = voxels.read_atlas(out_dir)
+            atlases[voxel_size] = atlas
+            size = (atlas.labels.nbytes + atlas.sdf.nbytes)/1e6
+            print(f"{voxel_size:>10} {atlas.labels.size:>10} "
+                  f"{t_one:>14.3f} {t_all:>16.3f} {size:>6.0f}")
+
+        # random points over the grid, which is the bounding box of the
+        # regions with a margin
+        atlas = atlases[min(VOXEL_SIZES)]
+        lo = atlas.origin
+        hi = lo + np.array(atlas.labels.shape)*atlas.voxel_size
+        rng = np.random.default_rng(0)
+
+        print(f"\n{'points':>9} {'mesh (points/s)':>16} "
+              + " ".join(f"{f'{size} um (points/s)':>17} {'agree':>6}"
+                         for size in VOXEL_SIZES))
+        for size in SIZES:
+            points = rng.uniform(lo, hi, size=(size, 3))
+            start = time.perf_counter()
+            expected = query.classify(points, processes=1, indices=indices)
+            t_mesh = time.perf_counter() - start
+            row = f"{size:>9} {size/t_mesh:>16.0f}"
+            for voxel_size in VOXEL_SIZES:
+                labels = atlases[voxel_size].classify(points)
+                t_voxels = best_of(atlases[voxel_size].classify, points)
+                row += (f" {size/t_voxels:>17.0f} "
+                        f"{np.mean(labels == expected):>6.3f}")
+            print(row)
+
+
+if __name__ == '__main__':
+    main()
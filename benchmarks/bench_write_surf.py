@@ -0,0 +1,59 @@
+"""
+.. module:: bench_write_surf
+   :synopsis: times write_surf against the original loop-based writer.
+
+Run from the home directory of ZFBrain with
+`python -m benchmarks.bench_write_surf`.
+"""
+
+import os
+import tempfile
+
+import numpy as np
+
+import zfbrain.surface_plotting as sp
+from benchmarks.bench_read_surface import best_of
+
+SHAPES = [(18, 100), (100, 500), (300, 1000), (600, 1500)]
+
+
+def write_surf_loop(A, L, N, out_filename, description=" "):
+    """Original writer: one f-string per row through a plain open()."""
+    file = open(fr"{out_filename}.surf", "w")
+    file.write(description + "\n")
+    file.write(f"{L} {N}\n")
+    for row in range(A.shape[0]):
+        file.write(f"{A[row,0]} {A[row,1]} {A[row,2]}\n")
+    file.close()
+
+
+def main():
+    rng = np.random.default_rng(0)
+    writers = [
+        ("loop", write_surf_loop, {}),
+        ("vectorized", sp.write_surf, {}),
+        ("gzip", sp.write_surf, dict(compress=True)),
+        ("surfb", sp.write_surf, dict(binary=True)),
+    ]
+
+    print(f"{'L':>6} {'N':>6} {'writer':>11} {'time (s)':>9} {'MB/s':>7} "
+          f"{'size (MB)':>10} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for L, N in SHAPES:
+            A = rng.uniform(-2000, 2000, size=(L*N, 3))
+            out = os.path.join(tmp, f"bench_{L}_{N}")
+            t_loop = None
+            for label, writer, kwds in writers:
+                elapsed = best_of(lambda: writer(A, L, N, out, **kwds),
+                                  repeat=1 if label == "loop" else 3)
+                t_loop = t_loop or elapsed
+                ext = {"gzip": ".surf.gz", "surfb": ".surfb"}.get(label,
+                                                                 ".surf")
+                size = os.path.getsize(out + ext)/2**20
+                print(f"{L:>6} {N:>6} {label:>11} {elapsed:>9.4f} "
+                      f"{size/elapsed:>7.1f} {size:>10.2f} "
+                      f"{t_loop/elapsed:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
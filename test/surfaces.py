@@ -0,0 +1,20 @@
+import os
+import tempfile
+
+import numpy as np
+
+import zfbrain.surface_plotting as sp
+
+
+def cylinder(L, N, r=100):
+    """Surface of a cylinder of radius r around the z axis of the *.surf
+    file, with L slices of N points 40 um apart, as read by read_surface.
+    """
+    theta = np.linspace(0, 2*np.pi, N, endpoint=False)
+    A = np.zeros((L*N, 3))
+    A[:, 0] = np.tile(r*np.cos(theta), L)
+    A[:, 1] = np.tile(r*np.sin(theta), L)
+    A[:, 2] = np.repeat(40.0*np.arange(L), N)
+    with tempfile.TemporaryDirectory() as tmp:
+        return sp.read_surface(
+            sp.write_surf(A, L, N, os.path.join(tmp, "cylinder")))
@@ -0,0 +1,82 @@
+import os
+import unittest
+
+import numpy as np
+
+import zfbrain.surface_plotting as sp
+from zfbrain.bvh import BVH, morton_codes
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "zfbrain", "data")
+
+
+def intersect_reference(verts, faces, origin, direction):
+    """Tests one ray against every face, without a hierarchy."""
+    v0, v1, v2 = (verts[faces[:, tk]] for tk in range(3))
+    e1, e2 = v1 - v0, v2 - v0
+    p = np.cross(direction, e2)
+    det = (e1*p).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        s = origin - v0
+        u = (s*p).sum(axis=1)/det
+        q = np.cross(s, e1)
+        v = (q @ direction)/det
+        t = (e2*q).sum(axis=1)/det
+    hit = (det != 0) & (u >= 0) & (v >= 0) & (u + v <= 1) & (t >= 0)
+    return t[hit].min() if hit.any() else np.inf
+
+
+class TestBVH(unittest.TestCase):
+
+    def test_intersect(self):
+        rng = np.random.default_rng(0)
+        for name in ["HVC_L", "whole_brain_L"]:
+            verts, faces = sp.read_surface(
+                os.path.join(DATA_DIR, name + ".surf"))
+            bvh = BVH(verts, faces)
+            centre = verts.mean(axis=0)
+            size = np.ptp(verts, axis=0).max()
+
+            # rays from all around at points near the surface, and from
+            # inside, many hitting and some missing
+            origins = centre + rng.normal(size=(300, 3))*size
+            origins[:20] = centre
+            targets = (verts[rng.integers(len(verts), size=300)]
+                       + rng.normal(size=(300, 3))*size/10)
+            directions = targets - origins
+
+            t, face = bvh.intersect(origins, directions)
+            with self.subTest(name=name):
+                self.assertTrue(np.isfinite(t).sum() > 100)
+                self.assertTrue(np.isinf(t).sum() > 0)
+                self.assertTrue(np.all(face[np.isfinite(t)] >= 0))
+                self.assertTrue(np.all(face[np.isinf(t)] == -1))
+                for ti in range(300):
+                    expected = intersect_reference(verts, faces, origins[ti],
+                                                   directions[ti])
+                    self.assertTrue(np.isclose(t[ti], expected)
+                                    or t[ti] == expected == np.inf)
+
+                # the same for one ray at a time, nearest first or not
+                for ti in range(0, 300, 30):
+                    t1, face1 = bvh.intersect(origins[ti], directions[ti])
+                    self.assertTrue(np.isclose(t1[0], t[ti])
+                                    or t1[0] == t[ti] == np.inf)
+
+            hit = np.flatnonzero(np.isfinite(t))[0]
+            point = origins[hit] + t[hit]*directions[hit]
+            vertex = bvh.nearest_vertex(face[hit], point)
+            self.assertIn(vertex, faces[face[hit]])
+            self.assertLessEqual(np.linalg.norm(verts[vertex] - point),
+                                 min(np.linalg.norm(verts[faces[face[hit]]]
+                                                    - point, axis=1)))
+
+    def test_morton_codes(self):
+        # corners of a cube sort in Z order: x varies fastest
+        corners = np.array([[x, y, z] for z in (0, 1) for y in (0, 1)
+                            for x in (0, 1)], dtype=float)
+        codes = morton_codes(corners)
+        self.assertTrue(np.all(np.diff(codes.astype(np.int64)) > 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,236 @@
+import os
+import unittest
+
+import numpy as np
+
+# the viewer is tested without a display; nothing here draws, so no GL
+# context is needed either
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from pyqtgraph.Qt import QtWidgets  # noqa: E402
+
+import zfbrain.surface_plotting as sp  # noqa: E402
+from zfbrain import gui  # noqa: E402
+
+app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+
+def make_mesh(name, n_faces, color):
+    """A fan of n_faces triangles, as (name, verts, faces, normals, color)."""
+    theta = np.linspace(0, 2*np.pi, n_faces, endpoint=False)
+    verts = np.column_stack((np.cos(theta), np.sin(theta),
+                             np.zeros(n_faces)))
+    verts = np.vstack((verts, [0, 0, 0]))
+    faces = np.column_stack((np.arange(n_faces),
+                             (np.arange(n_faces) + 1) % n_faces,
+                             np.full(n_faces, n_faces)))
+    normals = np.tile([0, 0, 1.0], (len(verts), 1))
+    return name, verts, faces, normals, color
+
+
+class TestAtlasMeshItem(unittest.TestCase):
+
+    def setUp(self):
+        self.meshes = [make_mesh("a", 4, (1, 0, 0, 1)),
+                       make_mesh("b", 6, (0, 1, 0, 1)),
+                       make_mesh("c", 3, (0, 0, 1, 1))]
+        self.atlas = gui.AtlasMeshItem()
+        self.atlas.set_regions(self.meshes)
+
+    def expected_faces(self, names):
+        """Faces of regions `names`, offset to the packed vertices."""
+        start, faces = 0, {}
+        for name, verts, mesh_faces, _, _ in self.meshes:
+            faces[name] = mesh_faces + start
+            start += len(verts)
+        return np.concatenate([faces[name] for name in names]
+                              + [np.zeros((0, 3), dtype=int)])
+
+    def test_ranges(self):
+        self.assertEqual(self.atlas.names, ["a", "b", "c"])
+        self.assertEqual(self.atlas._ranges, {"a": (0, 4), "b": (4, 10),
+                                              "c": (10, 13)})
+
+        self.atlas.set_shown(["a", "b", "c"])
+        self.atlas.parseMeshData()
+        self.assertEqual(self.atlas.faces.dtype, np.uint32)
+        self.assertTrue(np.array_equal(self.atlas.faces,
+                                       self.expected_faces("abc")))
+        self.assertEqual(len(self.atlas.vertexes), 5 + 7 + 4)
+
+        # each region keeps its colour, per vertex
+        colors = self.atlas.colors
+        self.assertTrue(np.array_equal(colors[:5], [(1, 0, 0, 1)]*5))
+        self.assertTrue(np.array_equal(colors[5:12], [(0, 1, 0, 1)]*7))
+
+    def test_set_shown(self):
+        self.atlas.set_shown(["a", "b", "c"])
+        self.atlas.parseMeshData()
+        vertexes = self.atlas.vertexes
+
+        # hiding regions only drops their range of faces
+        self.atlas.set_shown(["c", "a"])
+        dirty_bits = self.atlas.parseMeshData()
+        self.assertTrue(np.array_equal(self.atlas.faces,
+                                       self.expected_faces("ac")))
+        self.assertIs(self.atlas.vertexes, vertexes)
+        if gui.DirtyFlag is not None:
+            self.assertEqual(dirty_bits, gui.DirtyFlag.FACES)
+
+        # showing the same regions again changes nothing
+        self.atlas.set_shown(["a", "c"])
+        self.assertFalse(self.atlas.parseMeshData())
+
+        self.atlas.set_shown([])
+        self.atlas.parseMeshData()
+        self.assertEqual(self.atlas.faces.shape, (0, 3))
+
+
+class TestMeshData(unittest.TestCase):
+
+    def test_normals(self):
+        _, verts, faces, _, _ = make_mesh("a", 5, None)
+        normals = np.tile([0, 0, -1.0], (len(verts), 1))
+        md = gui.mesh_data(verts, faces, normals)
+        self.assertTrue(np.array_equal(md.vertexNormals(), normals))
+        self.assertEqual(md.vertexNormals().dtype, np.float32)
+
+
+class TestMirroredMeshItem(unittest.TestCase):
+
+    def test_shares_source(self):
+        _, verts, faces, normals, _ = make_mesh("a", 5, None)
+        source = gui.gl.GLMeshItem(
+            meshdata=gui.mesh_data(verts, faces, normals))
+        mirrored = gui.MirroredMeshItem(source)
+        self.assertIs(mirrored.opts['meshdata'], source.opts['meshdata'])
+        matrix = np.array(mirrored.transform().data()).reshape(4, 4).T
+        self.assertTrue(np.allclose(matrix, sp.mirror_matrix()))
+
+
+class TestMirroredAtlasItem(unittest.TestCase):
+
+    def test_shares_source(self):
+        meshes = [make_mesh("a", 4, (1, 0, 0, 1)),
+                  make_mesh("b", 6, (0, 1, 0, 1))]
+        source = gui.AtlasMeshItem()
+        source.set_regions(meshes)
+        mirrored = gui.MirroredAtlasItem(source)
+        mirrored.set_regions({"b": ("b_R", (0, 0, 1, 1))})
+        self.assertEqual(mirrored.names, ["b_R"])
+        self.assertEqual(mirrored._ranges, {"b_R": (4, 10)})
+
+        # only the faces and colours are its own
+        source.parseMeshData()
+        mirrored.set_shown(["b_R"])
+        mirrored.parseMeshData()
+        self.assertIs(mirrored.vertexes, source.vertexes)
+        self.assertIs(mirrored.normals, source.normals)
+        self.assertTrue(np.array_equal(mirrored.faces, source._faces[4:]))
+        self.assertTrue(np.array_equal(mirrored.colors[5:],
+                                       [(0, 0, 1, 1)]*7))
+        matrix = np.array(mirrored.transform().data()).reshape(4, 4).T
+        self.assertTrue(np.allclose(matrix, sp.mirror_matrix()))
+
+
+class TestRedraw(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.window = gui.MainWindow()
+
+    def redraws(self, action):
+        """Counts the redraws of the view after `action`, once the events
+        it queued are handled."""
+        app.processEvents()
+        calls = []
+        brv = self.window.brv
+        redraw_surfaces = brv.redraw_surfaces
+        brv.redraw_surfaces = lambda checked: (calls.append(list(checked)),
+                                               redraw_surfaces(checked))
+        try:
+            action()
+            app.processEvents()
+        finally:
+            del brv.redraw_surfaces
+        return calls
+
+    def test_show_all_redraws_once(self):
+        brc = self.window.sl.brc
+        self.assertEqual(len(self.redraws(brc.hideAllButton.click)), 1)
+        calls = self.redraws(brc.showAllButton.click)
+        self.assertEqual(calls, [[True]*len(gui.REGIONS)])
+
+        # all regions are shown from their atlases
+        shown = set()
+        for atlas in self.window.brv.atlases.values():
+            shown |= atlas._shown
+        self.assertEqual(shown, {region.name for region in gui.REGIONS})
+
+        # mirrored regions are drawn from the vertices of their source,
+        # which are packed once, and no MeshData is built per region
+        brv = self.window.brv
+        packed = [name for (_, mirrored), atlas in brv.atlases.items()
+                  if not mirrored for name in atlas.names]
+        self.assertEqual(sorted(packed), sorted(
+            region.name for region in gui.REGIONS if not region.mirror_of))
+        for name in packed:
+            brv.registry.set_level(name, len(brv.registry.lods[name]) - 1)
+        self.assertEqual(brv.registry._meshdata, {})
+
+    def test_hide_one(self):
+        brc = self.window.sl.brc
+        self.redraws(brc.showAllButton.click)
+        atlases = self.window.brv.atlases.values()
+        before = {atlas: set(atlas._shown) for atlas in atlases}
+
+        # hiding one region only drops it from the atlas that holds it
+        self.redraws(lambda: brc.checkBoxes[2].setChecked(False))
+        name = gui.REGIONS[2].name
+        for atlas in atlases:
+            self.assertEqual(atlas._shown, before[atlas] - {name})
+
+    def test_lod_repack_deferred(self):
+        brc = self.window.sl.brc
+        brv = self.window.brv
+        self.redraws(brc.showAllButton.click)
+        distance = brv.opts['distance']
+        packs = []
+        pack_atlas = brv.pack_atlas
+        brv.pack_atlas = lambda key, names: (packs.append(key),
+                                             pack_atlas(key, names))
+        try:
+            # zooming out switches to coarser levels, but the atlases are
+            # only repacked once the frame (here, update_lods) is done
+            brv.setCameraPosition(distance=100*distance)
+            brv.update_lods()
+            self.assertEqual(packs, [])
+            app.processEvents()
+            self.assertTrue(packs)
+            self.assertTrue(all(not mirrored for _, mirrored in packs))
+        finally:
+            del brv.pack_atlas
+            brv.setCameraPosition(distance=distance)
+            brv.update_lods()
+            app.processEvents()
+
+
+class TestPerItemRedraw(unittest.TestCase):
+
+    def test_visibility(self):
+        brv = gui.brainView(batched=False)
+        brv.redraw_surfaces([True]*len(gui.REGIONS))
+        items = dict(brv.registry.items)
+        self.assertEqual(len(items), len(gui.REGIONS))
+
+        # items stay in the view, and only the hidden one turns invisible
+        checked = [True]*len(gui.REGIONS)
+        checked[3] = False
+        brv.redraw_surfaces(checked)
+        for region, is_checked in zip(gui.REGIONS, checked):
+            self.assertIn(items[region.name], brv.items)
+            self.assertEqual(items[region.name].visible(), is_checked)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import os
+import subprocess
+import sys
+import unittest
+
+ROOT_DIR = os.path.join(os.path.dirname(__file__), "..")
+
+# budget in ms for importing the headless core, on top of numpy itself
+IMPORT_BUDGET_MS = 100
+
+# modules the headless core must not import
+HEAVY_MODULES = ["scipy", "xml.etree.ElementTree", "pyqtgraph", "PyQt5",
+                 "OpenGL", "zfbrain.gui"]
+
+
+def import_time(module):
+    """Imports module in a fresh interpreter with -X importtime.
+
+    Returns the cumulative import time in ms of every imported module, and
+    the HEAVY_MODULES that ended up imported.
+    """
+    code = (f"import sys, {module}; "
+            f"print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))")
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                            cwd=ROOT_DIR, capture_output=True, text=True,
+                            check=True)
+
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative)/1000
+
+    return times, result.stdout.split()
+
+
+class importTimeTest(unittest.TestCase):
+
+    def test_core_import_time(self):
+        best = None
+        for _ in range(3):
+            times, heavy = import_time("zfbrain.surface_plotting")
+            self.assertEqual(heavy, [])
+            own = times["zfbrain.surface_plotting"] - times.get("numpy", 0)
+            best = own if best is None else min(best, own)
+
+        self.assertLess(best, IMPORT_BUDGET_MS,
+                        f"importing zfbrain.surface_plotting took {best:.0f} ms "
+                        f"on top of numpy, budget is {IMPORT_BUDGET_MS} ms")
+
+    def test_main_does_not_import_gui(self):
+        _, heavy = import_time("zfbrain.__main__")
+        self.assertEqual(heavy, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
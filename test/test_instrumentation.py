@@ -0,0 +1,86 @@
+import contextlib
+import csv
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from zfbrain import __main__ as zfbrain_main
+from zfbrain.instrumentation import (FrameStats, HISTOGRAM_EDGES_MS,
+                                     check_stats_file)
+
+
+class TestFrameStats(unittest.TestCase):
+
+    def make_stats(self):
+        stats = FrameStats(history=3)
+        for ti, ms in enumerate([5, 10, 20, 40]):
+            stats.add_item("atlas shaded", ms/2000)
+            if ti % 2:
+                stats.add_item("whole_brain_L", ms/4000)
+            stats.add_frame(ti, ms/1000)
+        stats.set_region("whole_brain_L", 1000, 48000)
+        return stats
+
+    def test_summary(self):
+        stats = self.make_stats()
+        # only the last 3 frames are kept
+        self.assertEqual(list(stats.frame_times()), [10, 20, 40])
+        summary = stats.summary()
+        self.assertEqual(summary['frames'], 3)
+        self.assertAlmostEqual(summary['median_ms'], 20)
+        self.assertAlmostEqual(summary['max_ms'], 40)
+        self.assertAlmostEqual(summary['item_ms']["atlas shaded"],
+                               (5 + 10 + 20)/3)
+        self.assertAlmostEqual(summary['item_ms']["whole_brain_L"],
+                               (2.5 + 10)/2)
+        self.assertEqual(summary['regions']["whole_brain_L"],
+                         dict(triangles=1000, gpu_bytes=48000))
+        self.assertEqual(sum(stats.histogram()), 3)
+        self.assertEqual(len(stats.histogram()), len(HISTOGRAM_EDGES_MS) - 1)
+
+    def test_overlay_text(self):
+        text = self.make_stats().overlay_text()
+        self.assertIn("3 frames", text)
+        self.assertIn("whole_brain_L: 1000 tris", text)
+        self.assertEqual(FrameStats().overlay_text().count("\n"),
+                         len(HISTOGRAM_EDGES_MS) - 1)
+
+    def test_write(self):
+        stats = self.make_stats()
+        with tempfile.TemporaryDirectory() as tmp:
+            json_file = os.path.join(tmp, "stats.json")
+            stats.write(json_file)
+            with open(json_file) as f:
+                data = json.load(f)
+            self.assertEqual(len(data['frame_log']), 3)
+            self.assertAlmostEqual(data['frame_log'][2]['start_s'], 2)
+
+            csv_file = os.path.join(tmp, "stats.csv")
+            stats.write(csv_file)
+            with open(csv_file, newline="") as f:
+                rows = list(csv.reader(f))
+            self.assertEqual(rows[0], ["frame", "start_s", "paint_ms",
+                                       "atlas shaded_ms",
+                                       "whole_brain_L_ms"])
+            self.assertEqual(len(rows), 4)
+            self.assertEqual(rows[2][4], "")
+
+            with self.assertRaises(ValueError):
+                stats.write(os.path.join(tmp, "stats.txt"))
+
+    def test_check_stats_file(self):
+        self.assertEqual(check_stats_file("stats.CSV"), "stats.CSV")
+        with self.assertRaises(ValueError):
+            check_stats_file("stats.jsn")
+
+        # the command line refuses it before the viewer opens
+        with contextlib.redirect_stderr(io.StringIO()) as err:
+            with self.assertRaises(SystemExit):
+                zfbrain_main.main(["--stats-out", "stats.jsn"])
+        self.assertIn("cannot export frame stats as '.jsn'", err.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
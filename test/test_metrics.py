@@ -0,0 +1,114 @@
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import zfbrain.surface_plotting as sp
+from test.surfaces import cylinder
+from zfbrain import metrics
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "zfbrain", "data")
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_box(self):
+        # a 1 x 2 x 3 box with its faces wound counterclockwise from outside
+        verts = np.array([[x, y, z] for z in (0, 3) for y in (0, 2)
+                          for x in (0, 1)], dtype=float) + 10
+        faces = np.array([[0, 2, 1], [1, 2, 3], [4, 5, 6], [5, 7, 6],
+                          [0, 1, 4], [1, 5, 4], [2, 6, 3], [3, 6, 7],
+                          [0, 4, 2], [2, 4, 6], [1, 3, 5], [3, 7, 5]])
+        result = metrics.surface_metrics(verts, faces)
+        self.assertAlmostEqual(result.volume, 6)
+        self.assertAlmostEqual(result.area, 22)
+        self.assertTrue(np.allclose(result.centroid, [10.5, 11, 11.5]))
+        self.assertTrue(np.array_equal(result.lo, [10, 10, 10]))
+        self.assertTrue(np.array_equal(result.hi, [11, 12, 13]))
+
+        # reversing the winding reverses the sign only
+        flipped = metrics.surface_metrics(verts, faces[:, ::-1])
+        self.assertAlmostEqual(flipped.volume, -6)
+        self.assertTrue(np.allclose(flipped.centroid, result.centroid))
+
+    def test_cylinder(self):
+        L, N, r = 10, 64, 100
+        verts, faces = cylinder(L, N, r)
+        result = metrics.surface_metrics(verts, faces)
+
+        polygon = N/2*r**2*np.sin(2*np.pi/N)
+        length = 40*(L - 1)
+        side = N*2*r*np.sin(np.pi/N)
+        self.assertAlmostEqual(abs(result.volume), polygon*length, delta=1e-6)
+        self.assertAlmostEqual(result.area, 2*polygon + side*length,
+                               delta=1e-6)
+        self.assertTrue(np.allclose(result.centroid, [0, length/2, 0],
+                                    atol=1e-9))
+
+    def test_mirror(self):
+        left = metrics.surface_metrics(*sp.read_surface(
+            os.path.join(DATA_DIR, "HVC_L.surf")))
+        right = metrics.surface_metrics(*sp.read_surface(
+            os.path.join(DATA_DIR, "HVC_R.surf")))
+        mirrored = metrics.mirror_metrics(left)
+        self.assertAlmostEqual(mirrored.volume, right.volume, delta=1e-3)
+        self.assertAlmostEqual(mirrored.area, right.area, delta=1e-3)
+        for key in ("centroid", "lo", "hi"):
+            self.assertTrue(np.allclose(getattr(mirrored, key),
+                                        getattr(right, key)))
+
+    def test_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            file_name = os.path.join(tmp, "RA_L.surf")
+            shutil.copy(os.path.join(DATA_DIR, "RA_L.surf"), file_name)
+            self.assertIsNone(metrics.read_metrics(file_name))
+
+            result = metrics.file_metrics(file_name)
+            self.assertTrue(os.path.exists(metrics.metrics_path(file_name)))
+            cached = metrics.read_metrics(file_name)
+            self.assertEqual(cached.volume, result.volume)
+            self.assertTrue(np.array_equal(cached.centroid, result.centroid))
+
+            # readers that must not write compute metrics in memory
+            os.remove(metrics.metrics_path(file_name))
+            unwritten = metrics.file_metrics(file_name, write=False)
+            self.assertEqual(unwritten.volume, result.volume)
+            self.assertFalse(os.path.exists(metrics.metrics_path(file_name)))
+            metrics.file_metrics(file_name)
+
+            # changing the surface file makes the cache out of date
+            with open(file_name, "a") as f:
+                f.write("\n")
+            self.assertIsNone(metrics.read_metrics(file_name))
+
+    def test_print_stats(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            files = []
+            for name in ["HVC_L", "HVC_R"]:
+                files.append(os.path.join(tmp, name + ".surf"))
+                shutil.copy(os.path.join(DATA_DIR, name + ".surf"), files[-1])
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                metrics.print_stats(files)
+
+        # both hemispheres have a positive volume, and points are in *.surf
+        # coordinates, where the hemispheres differ in z
+        verts, faces = sp.read_surface(files[0].replace(tmp, DATA_DIR))
+        surf = verts[faces.ravel()][:, [0, 2, 1]]
+        rows = [line.split() for line in out.getvalue().splitlines()[1:]]
+        self.assertEqual([row[0] for row in rows], ["HVC_L", "HVC_R"])
+        for row in rows:
+            self.assertGreater(float(row[1]), 0)
+            self.assertAlmostEqual(float(row[3]), surf[:, 0].mean(), delta=50)
+            self.assertTrue(np.allclose([float(val) for val in row[6:]],
+                                        np.ptp(surf, axis=0), atol=1))
+        self.assertEqual(rows[0][3:5], rows[1][3:5])
+        self.assertNotEqual(rows[0][5], rows[1][5])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+import zfbrain.surface_plotting as sp
+from test.surfaces import cylinder
+from zfbrain import query
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "zfbrain", "data")
+
+
+def ray_parity_reference(points, verts, faces):
+    """Tests every point against every face, with rays along z instead."""
+    corners = verts[faces][:, :, [0, 2, 1]]
+    inside = []
+    for point in points:
+        rel = corners[:, :, :2] - point[:2]
+        d = [rel[:, tk, 0]*rel[:, (tk+1) % 3, 1]
+             - rel[:, tk, 1]*rel[:, (tk+1) % 3, 0] for tk in range(3)]
+        covered = (((d[0] > 0) & (d[1] > 0) & (d[2] > 0))
+                   | ((d[0] < 0) & (d[1] < 0) & (d[2] < 0)))
+        total = np.where(covered, d[0] + d[1] + d[2], 1)
+        z = (d[1]*corners[:, 0, 2] + d[2]*corners[:, 1, 2]
+             + d[0]*corners[:, 2, 2])/total
+        inside.append(np.sum(covered & (z > point[2])) % 2 == 1)
+    return np.array(inside)
+
+
+class TestQuery(unittest.TestCase):
+
+    def test_cylinder(self):
+        verts, faces = cylinder(10, 64)
+        index = query.RegionIndex(verts, faces)
+
+        rng = np.random.default_rng(0)
+        points = rng.uniform([-120, -120, -20], [120, 120, 380],
+                             size=(20000, 3))
+        radius = np.hypot(points[:, 0], points[:, 1])
+        inside = index.contains(points)
+        self.assertTrue(inside[(radius < 95) & (points[:, 2] > 5)
+                               & (points[:, 2] < 355)].all())
+        self.assertFalse(inside[(radius > 101) | (points[:, 2] < -1)
+                                | (points[:, 2] > 361)].any())
+
+    def test_matches_reference(self):
+        rng = np.random.default_rng(1)
+        for name in ["HVC_L", "RA_R", "whole_brain_L"]:
+            with self.subTest(name=name):
+                verts, faces = sp.read_surface(
+                    os.path.join(DATA_DIR, name + ".surf"))
+                surf = verts[:, [0, 2, 1]]
+                points = rng.uniform(surf.min(axis=0) - 10,
+                                     surf.max(axis=0) + 10, size=(1000, 3))
+                inside = query.RegionIndex(verts, faces).contains(points)
+                self.assertGreater(inside.sum(), 0)
+                self.assertTrue(np.array_equal(
+                    inside, ray_parity_reference(points, verts, faces)))
+
+    def test_classify(self):
+        indices = query.region_indices(data_dir=DATA_DIR)
+        verts, _ = sp.read_surface(os.path.join(DATA_DIR, "HVC_L.surf"))
+        hvc_centre = verts[:, [0, 2, 1]].mean(axis=0)
+        points = np.array([hvc_centre, [1e5, 1e5, 1e5]])
+
+        self.assertEqual(list(query.classify(points, indices=indices)),
+                         ["HVC_L", query.OUTSIDE])
+        inside = query.contains(points, indices=indices)
+        self.assertEqual(inside.shape, (2, len(query.QUERY_REGIONS)))
+        self.assertTrue(inside[0, query.QUERY_REGIONS.index("whole_brain_L")])
+
+    def test_processes(self):
+        indices = query.region_indices(["HVC_L", "whole_brain_L"],
+                                       data_dir=DATA_DIR)
+        rng = np.random.default_rng(2)
+        points = rng.uniform([0, -2200, 0], [2300, -700, 1440],
+                             size=(query.CHUNK_SIZE + 100, 3))
+        regions = list(indices)
+        self.assertTrue(np.array_equal(
+            query.contains(points, regions, processes=2, indices=indices),
+            query.contains(points, regions, processes=1, indices=indices)))
+
+    def test_classify_file(self):
+        verts, _ = sp.read_surface(os.path.join(DATA_DIR, "RA_L.surf"))
+        ra_centre = verts[:, [0, 2, 1]].mean(axis=0)
+        with tempfile.TemporaryDirectory() as tmp:
+            file_name = os.path.join(tmp, "cells.csv")
+            with open(file_name, "w") as f:
+                f.write("x,y,z\n")
+                f.write(",".join(map(repr, ra_centre.tolist())) + "\n")
+                f.write("0,0,0\n")
+
+            out_file = query.classify_file(file_name, data_dir=DATA_DIR)
+            self.assertEqual(out_file, os.path.join(tmp, "cells_labels.csv"))
+            with open(out_file) as f:
+                lines = f.read().splitlines()
+
+        self.assertEqual(lines[0], "x,y,z,label")
+        self.assertTrue(lines[1].endswith(",RA_L"))
+        self.assertEqual(lines[2], "0.0,0.0,0.0,outside")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import json
+import os
+import tempfile
+import unittest
+
+from zfbrain.render_jobs import DEFAULT_CAMERA, expand_job, read_job
+
+
+class TestRenderJobs(unittest.TestCase):
+
+    def test_expand_job(self):
+        job = expand_job({
+            "size": [320, 240],
+            "views": [
+                {"name": "nuclei",
+                 "regions": [["whole_brain_L", "HVC_L"], ["RA_L"]],
+                 "cameras": [{}, {"elevation": 90, "azimuth": 0}]},
+                {"name": "song", "combinations": ["HVC_L", "RA_L", "AreaX_L"],
+                 "cameras": [{"distance": 3000}]},
+                {"name": "turn", "regions": ["whole_brain_L"],
+                 "turntable": 4}]}, out_dir="out")
+
+        self.assertEqual(job.size, (320, 240))
+        self.assertEqual(len(job.frames), 2*2 + 7 + 4)
+
+        first = job.frames[0]
+        self.assertEqual(first.file_name, os.path.join("out",
+                                                       "nuclei_000_00.png"))
+        self.assertEqual(first.regions, ("whole_brain_L", "HVC_L"))
+        self.assertEqual(first.camera, DEFAULT_CAMERA)
+        # frames of the same regions follow each other
+        self.assertEqual([frame.regions for frame in job.frames[:4]],
+                         [("whole_brain_L", "HVC_L")]*2 + [("RA_L",)]*2)
+        self.assertEqual(job.frames[1].camera,
+                         dict(distance=2400, elevation=90, azimuth=0))
+
+        song = job.frames[4:11]
+        self.assertEqual(song[-1].regions, ("HVC_L", "RA_L", "AreaX_L"))
+        self.assertEqual(song[0].camera['distance'], 3000)
+
+        turn = job.frames[11:]
+        self.assertEqual([frame.camera['azimuth'] for frame in turn],
+                         [50, 140, 230, 320])
+        self.assertEqual(os.path.basename(turn[-1].file_name),
+                         "turn_000_00_0003.png")
+
+    def test_read_job(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            file_name = os.path.join(tmp, "job.json")
+            with open(file_name, "w") as f:
+                json.dump({"format": "jpg",
+                           "views": [{"regions": ["HVC_L"]}]}, f)
+            job = read_job(file_name)
+        self.assertEqual(job.frames[0].file_name, "view0_000_00.jpg")
+
+    def test_invalid_jobs(self):
+        for job in [{"size": [0, 100]}, {"format": "gif"},
+                    {"views": [{"name": "empty"}]}]:
+            with self.assertRaises(ValueError):
+                expand_job(job)
+
+
+if __name__ == '__main__':
+    unittest.main()
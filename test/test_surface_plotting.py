@@ -1,5 +1,68 @@
+import os
+import tempfile
 import unittest
-import zfbrain.surface_plotting as sp 
+
+import numpy as np
+from scipy import interpolate
+
+import zfbrain.surface_plotting as sp
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "zfbrain", "data")
+REGION_FILES = ["HVC_L", "HVC_R", "RA_L", "RA_R", "AreaX_L", "AreaX_R",
+                "whole_brain_L", "whole_brain_R"]
+
+
+def read_surface_reference(file_name):
+    """Original element-by-element loader, kept to check read_surface."""
+    with open(file_name) as f:
+        lines = f.readlines()
+
+        L, N = map(int, lines[1].split(' '))
+
+        n_vertex = L*N+2
+        n_faces = 2*N*L
+        verts = np.zeros((n_vertex, 3), float)
+        faces = np.zeros((n_faces, 3), int)
+
+        for ti in range(0, (L*N)):
+            verts[ti, 0], verts[ti, 2], verts[ti, 1] = map(float, lines[ti+2].split(' '))
+
+        first_gp_ind = L*N
+        last_gp_ind = L*N+1
+        for ti in range(3):
+            verts[first_gp_ind, ti] = np.mean(verts[0:N-1, ti])
+            verts[last_gp_ind, ti] = np.mean(verts[(L-1)*N:L*N, ti])
+
+        for tl in range(L-1):
+            for tn in range(N):
+                ind1 = 2*(tn + tl*N)
+                ind2 = ind1 + 1
+
+                val1 = tl*N + tn
+                val2 = (tl+1)*N + (tn+1) % N
+                val3 = (tl+1)*N + tn
+                val4 = tl*N + (tn+1) % N
+
+                faces[ind1, 0] = val1
+                faces[ind1, 1] = val2
+                faces[ind1, 2] = val3
+                faces[ind2, 0] = val1
+                faces[ind2, 1] = val4
+                faces[ind2, 2] = val2
+
+        for tn in range(N):
+            ind = 2*(L-1)*N + tn
+            faces[ind, 0] = tn
+            faces[ind, 1] = first_gp_ind
+            faces[ind, 2] = (tn+1) % N
+
+        for tn in range(N):
+            ind = 2*(L-1)*N + N + tn
+            faces[ind, 0] = (L-1)*N + tn
+            faces[ind, 1] = (L-1)*N + (tn + 1) % N
+            faces[ind, 2] = last_gp_ind
+
+    return verts, faces
 
 
 class surface_plottingTest(unittest.TestCase):
@@ -10,6 +73,450 @@ class surface_plottingTest(unittest.TestCase):
         self.assertEqual(4.31, 4.31)
         self.assertEqual("this is an example test", "this is an example test")
 
+    def test_read_surface_matches_reference(self):
+        for name in REGION_FILES + ["test_surface", "test_surface2"]:
+            file_name = os.path.join(DATA_DIR, name + ".surf")
+            with self.subTest(name=name):
+                verts, faces = sp.read_surface(file_name)
+                ref_verts, ref_faces = read_surface_reference(file_name)
+                self.assertTrue(np.array_equal(verts, ref_verts))
+                self.assertTrue(np.array_equal(faces, ref_faces))
+
+    def test_read_surface_stream(self):
+        for name in ["HVC_L", "whole_brain_R", "test_surface2"]:
+            file_name = os.path.join(DATA_DIR, name + ".surf")
+            with self.subTest(name=name):
+                verts, faces = sp.read_surface(file_name)
+                sverts, sfaces = sp.read_surface(file_name, stream=True)
+                self.assertTrue(np.array_equal(sverts, verts))
+                self.assertIs(sfaces, faces)
+
+        _, L, N = sp.read_surface_header(os.path.join(DATA_DIR, "RA_L.surf"))
+        slices = list(sp.iter_surface_slices(os.path.join(DATA_DIR, "RA_L.surf")))
+        self.assertEqual(len(slices), L)
+        self.assertEqual(slices[0].shape, (N, 3))
+
+    def test_read_surfaces(self):
+        file_names = [os.path.join(DATA_DIR, name + ".surf")
+                      for name in REGION_FILES]
+        for processes in (False, True):
+            with self.subTest(processes=processes):
+                surfaces = sp.read_surfaces(file_names, max_workers=2,
+                                            processes=processes)
+                self.assertEqual(len(surfaces), len(file_names))
+                for file_name, (verts, faces) in zip(file_names, surfaces):
+                    ref_verts, ref_faces = sp.read_surface(file_name)
+                    self.assertTrue(np.array_equal(verts, ref_verts))
+                    self.assertIs(faces, ref_faces)
+
+    def test_surface_faces_shapes(self):
+        for L, N in [(2, 3), (3, 4), (18, 100)]:
+            faces = sp._surface_faces(L, N)
+            self.assertEqual(faces.shape, (2*N*L, 3))
+            self.assertEqual(faces.max(), L*N+1)
+
+    def test_surface_faces_shared(self):
+        verts_L, faces_L = sp.read_surface(os.path.join(DATA_DIR, "HVC_L.surf"))
+        verts_R, faces_R = sp.read_surface(os.path.join(DATA_DIR, "HVC_R.surf"))
+        self.assertIs(faces_L, faces_R)
+        self.assertEqual(faces_L.dtype, np.uint16)
+        self.assertFalse(faces_L.flags.writeable)
+        self.assertEqual(sp.surface_faces(300, 300).dtype, np.uint32)
+
+    def test_iter_contours(self):
+        input_file = os.path.join(DATA_DIR, "songbird_brain.xml")
+        counts = {}
+        for name, points in sp.iter_contours(input_file):
+            self.assertEqual(points.ndim, 2)
+            self.assertEqual(points.shape[1], 3)
+            counts[name] = counts.get(name, 0) + 1
+        self.assertEqual(counts, {'Dendritic extension': 18, 'HVC L': 8,
+                                  'RA': 4, 'Area X': 7})
+
+    def test_generate_surfaces_matches_data(self):
+        input_file = os.path.join(DATA_DIR, "songbird_brain.xml")
+        with tempfile.TemporaryDirectory() as tmp:
+            sp.generate_surfaces(input_file, out_dir=tmp)
+            for name in REGION_FILES:
+                with self.subTest(name=name):
+                    with open(os.path.join(tmp, name + ".surf")) as f:
+                        generated = f.read()
+                    with open(os.path.join(DATA_DIR, name + ".surf")) as f:
+                        self.assertEqual(generated, f.read())
+
+    def test_generate_surfaces_incremental(self):
+        with open(os.path.join(DATA_DIR, "songbird_brain.xml")) as f:
+            xml = f.read()
+        # move the first point of the first HVC contour
+        start = xml.index('<point x="', xml.index('<contour name="HVC L"'))
+        start += len('<point x="')
+        end = xml.index('"', start)
+        edited = xml[:start] + str(float(xml[start:end]) + 5) + xml[end:]
+
+        with tempfile.TemporaryDirectory() as tmp:
+            input_file = os.path.join(tmp, "brain.xml")
+            cache_dir = os.path.join(tmp, "cache")
+            with open(input_file, "w") as f:
+                f.write(xml)
+
+            written = sp.generate_surfaces(input_file, out_dir=tmp,
+                                           cache_dir=cache_dir)
+            self.assertEqual(written, ["whole_brain", "HVC", "RA", "AreaX"])
+            self.assertEqual(sp.generate_surfaces(input_file, out_dir=tmp,
+                                                  cache_dir=cache_dir), [])
+
+            with open(input_file, "w") as f:
+                f.write(edited)
+            self.assertEqual(sp.generate_surfaces(input_file, out_dir=tmp,
+                                                  cache_dir=cache_dir),
+                             ["HVC"])
+
+            # the incremental build matches a full one
+            full_dir = os.path.join(tmp, "full")
+            os.mkdir(full_dir)
+            sp.generate_surfaces(input_file, out_dir=full_dir)
+            for name in REGION_FILES:
+                with self.subTest(name=name):
+                    with open(os.path.join(tmp, name + ".surf")) as f:
+                        incremental = f.read()
+                    with open(os.path.join(full_dir, name + ".surf")) as f:
+                        self.assertEqual(incremental, f.read())
+
+    def test_generate_surfaces_new_out_dir(self):
+        input_file = os.path.join(DATA_DIR, "songbird_brain.xml")
+        regions = {'RA': sp.REGION_TABLE['RA']}
+        with tempfile.TemporaryDirectory() as tmp:
+            for cache_dir in (None, os.path.join(tmp, "cache")):
+                out_dir = os.path.join(tmp, str(cache_dir is None), "out")
+                with self.subTest(cache_dir=cache_dir):
+                    sp.generate_surfaces(input_file, regions=regions,
+                                         out_dir=out_dir, cache_dir=cache_dir)
+                    self.assertEqual(sorted(os.listdir(out_dir)),
+                                     ["RA_L.surf", "RA_R.surf"])
+
+    def test_generate_brainexterior_surf_matches_data(self):
+        input_file = os.path.abspath(os.path.join(DATA_DIR, "songbird_brain.xml"))
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            try:
+                sp.generate_brainexterior_surf(input_file)
+            finally:
+                os.chdir(cwd)
+            with open(os.path.join(tmp, "whole_brain.surf")) as f:
+                generated = f.read()
+        with open(os.path.join(DATA_DIR, "whole_brain.surf")) as f:
+            self.assertEqual(generated, f.read())
+
+    def test_get_interpolants(self):
+        theta = np.linspace(0, 2*np.pi, 12, endpoint=False)
+        nodes = np.concatenate((np.c_[np.cos(theta), np.sin(theta)],
+                                np.c_[2*np.cos(theta[:9]), np.sin(theta[:9])]))
+        xi, yi = sp.get_interpolants(nodes, [12, 9], 20)
+        self.assertEqual(xi.shape, (2, 20))
+        x1, y1 = sp.get_interpolant(nodes[12:, 0], nodes[12:, 1], 20)
+        self.assertTrue(np.array_equal(xi[1], x1))
+        self.assertTrue(np.array_equal(yi[1], y1))
+
+    def test_get_interpolant_max_error(self):
+        # an ellipse, so that its curvature varies along the contour
+        theta = np.linspace(0, 2*np.pi, 40, endpoint=False)
+        x, y = 400*np.cos(theta), 100*np.sin(theta)
+        tck = sp._fit_contour(x, y)
+        u_dense = np.linspace(0, 1, 4096, endpoint=False)
+        xd, yd = interpolate.splev(u_dense, tck)
+        for max_error in (5.0, 0.5):
+            with self.subTest(max_error=max_error):
+                xi, yi = sp.get_interpolant(x, y, 500, max_error=max_error)
+                self.assertLess(len(xi), 500)
+                u = sp._adaptive_parameters(tck, max_error,
+                                            sp.ADAPTIVE_MAX_POINTS)
+                self.assertEqual(len(u), len(xi))
+                self.assertLessEqual(
+                    sp._max_deviation(tck, u, u_dense, xd, yd), max_error)
+        # uniform resampling needs more points for the same error
+        xi, _ = sp.get_interpolant(x, y, 500, max_error=0.5)
+        u = np.linspace(0, 1, len(xi), endpoint=False)
+        self.assertGreater(sp._max_deviation(tck, u, u_dense, xd, yd), 0.5)
+
+    def test_generate_max_error(self):
+        # circles wide enough to need more than N_interp points per slice
+        theta = np.linspace(0, 2*np.pi, 64, endpoint=False)
+        radius = 5000
+        circle = radius*np.c_[np.cos(theta), np.sin(theta)]
+        nodes = np.concatenate((circle, circle))
+        with tempfile.TemporaryDirectory() as tmp:
+            out = os.path.join(tmp, "circle")
+            for max_error in (1.0, 0.5):
+                with self.subTest(max_error=max_error):
+                    sp.generate_region_surf([64, 64], nodes, 0, 100, out,
+                                            max_error=max_error)
+                    # (slices have y and z switched)
+                    for s in sp.iter_surface_slices(out + "_L.surf"):
+                        self.assertGreater(len(s), 100)
+                        # the edges of the polygon cut inside the circle
+                        # by at most max_error
+                        mid = (s + np.roll(s, -1, axis=0))/2
+                        depth = radius - np.hypot(mid[:, 0], mid[:, 2])
+                        self.assertLessEqual(depth.max(), max_error)
+
+        # a bound that cannot be met is an error, not a coarser outline
+        with self.assertRaises(ValueError):
+            sp.get_interpolant(circle[:, 0], circle[:, 1], 100,
+                               max_error=1e-3)
+
+    def test_variable_surf(self):
+        input_file = os.path.join(DATA_DIR, "songbird_brain.xml")
+        regions = {name: dict(region, max_error=2.0)
+                   for name, region in sp.REGION_TABLE.items()}
+        with tempfile.TemporaryDirectory() as tmp:
+            sp.generate_surfaces(input_file, regions=regions, out_dir=tmp)
+            for name in REGION_FILES:
+                file_name = os.path.join(tmp, name + ".surf")
+                with self.subTest(name=name):
+                    _, L, N = sp.read_surface_header(file_name)
+                    self.assertEqual(len(N), L)
+                    verts, faces = sp.read_surface(file_name)
+                    self.assertEqual(verts.shape, (N.sum()+2, 3))
+                    self.assertEqual(len(faces), 2*N.sum())
+                    self.assertEqual(faces.max(), N.sum()+1)
+
+                    # closed and consistently oriented: every directed edge
+                    # appears once, together with its reverse
+                    faces = faces.astype(int)
+                    edges = np.concatenate((faces[:, [0, 1]], faces[:, [1, 2]],
+                                            faces[:, [2, 0]]))
+                    edge_set = set(map(tuple, edges))
+                    self.assertEqual(len(edge_set), len(edges))
+                    self.assertTrue(all((b, a) in edge_set
+                                        for a, b in edge_set))
+
+                    slices = list(sp.iter_surface_slices(file_name))
+                    self.assertEqual([len(s) for s in slices], list(N))
+
+                    # the cap of the last slice, around the last ghost
+                    # point, is left open
+                    _, left = sp.read_surface_left(file_name)
+                    self.assertEqual(len(left), len(faces) - N[-1])
+                    self.assertNotIn(N.sum()+1, left)
+
+                    with self.assertRaises(ValueError):
+                        sp.convert_surf(file_name)
+
+    def test_surface_lods(self):
+        file_name = os.path.join(DATA_DIR, "whole_brain_L.surf")
+        verts, faces = sp.read_surface(file_name)
+        _, L, N = sp.read_surface_header(file_name)
+        lods = sp.surface_lods(verts, L, N)
+        self.assertEqual(len(lods), len(sp.LOD_STEPS))
+        self.assertTrue(np.array_equal(lods[0][0], verts))
+        self.assertIs(lods[0][1], faces)
+        for lod_verts, lod_faces in lods:
+            # same caps, and faces only index the level's own vertices
+            self.assertTrue(np.array_equal(lod_verts[-2:], verts[-2:]))
+            self.assertEqual(lod_faces.max(), len(lod_verts)-1)
+        self.assertEqual(lods[-1][0].shape, (10*13+2, 3))
+        edges = [sp.edge_length(*lod) for lod in lods]
+        self.assertEqual(edges, sorted(edges))
+
+    def test_select_lod(self):
+        edge_pixels = np.array([2.0, 4.0, 8.0, 16.0])
+        self.assertEqual(sp.select_lod(edge_pixels, 0, target=6.0), 1)
+        self.assertEqual(sp.select_lod(edge_pixels, 3, target=6.0), 1)
+        # within the hysteresis band the level is kept
+        self.assertEqual(sp.select_lod(edge_pixels, 2, target=7.0), 2)
+        self.assertEqual(sp.select_lod(edge_pixels, 1, target=7.0), 1)
+        self.assertEqual(sp.select_lod(edge_pixels, 2, target=6.0), 1)
+
+    def test_plane_section(self):
+        for name in ["whole_brain_L", "AreaX_L"]:
+            file_name = os.path.join(DATA_DIR, name + ".surf")
+            _, L, N = sp.read_surface_header(file_name)
+            verts, faces = sp.read_surface(file_name)
+            bands = sp.section_bands(verts, L, N)
+            self.assertEqual(bands[3][-1], len(faces))
+            for axis in range(3):
+                with self.subTest(name=name, axis=axis):
+                    point = verts.mean(axis=0) + 1e-3
+                    normal = np.eye(3)[axis]
+                    segments = sp.plane_section(verts, faces, point, normal)
+                    self.assertGreater(len(segments), 0)
+                    self.assertTrue(np.allclose((segments - point) @ normal,
+                                                0))
+                    # the section of a closed surface is closed: each
+                    # segment starts where another one ends
+                    starts = np.round(segments[:, 0], 6)
+                    ends = np.round(segments[:, 1], 6)
+                    self.assertTrue(np.array_equal(
+                        starts[np.lexsort(starts.T)],
+                        ends[np.lexsort(ends.T)]))
+
+                    near = sp.plane_section(verts, faces, point, normal,
+                                            bands=bands)
+                    self.assertTrue(np.array_equal(
+                        np.sort(near.reshape(-1, 6), axis=0),
+                        np.sort(segments.reshape(-1, 6), axis=0)))
+
+            far = verts.max(axis=0) + 1
+            self.assertEqual(sp.plane_section(verts, faces, far, [1, 0, 0],
+                                              bands=bands).shape, (0, 2, 3))
+
+    def test_mirror_verts(self):
+        for name in ["HVC", "RA", "AreaX", "whole_brain"]:
+            with self.subTest(name=name):
+                verts_L, faces_L = sp.read_surface(
+                    os.path.join(DATA_DIR, name + "_L.surf"))
+                verts_R, faces_R = sp.read_surface(
+                    os.path.join(DATA_DIR, name + "_R.surf"))
+                self.assertTrue(np.array_equal(sp.mirror_verts(verts_L),
+                                               verts_R))
+                self.assertIs(faces_L, faces_R)
+
+                homogeneous = np.c_[verts_L, np.ones(len(verts_L))]
+                transformed = homogeneous @ sp.mirror_matrix().T
+                self.assertTrue(np.array_equal(transformed[:, :3], verts_R))
+
+    def test_write_surf(self):
+        file_name = os.path.join(DATA_DIR, "RA_L.surf")
+        description, L, N = sp.read_surface_header(file_name)
+        verts, faces = sp.read_surface(file_name)
+        A = verts[:-2][:, [0, 2, 1]]
+        with open(file_name) as f:
+            original = f.read()
+
+        with tempfile.TemporaryDirectory() as tmp:
+            out = os.path.join(tmp, "RA_L")
+            self.assertEqual(sp.write_surf(A, L, N, out, description),
+                             out + ".surf")
+            with open(out + ".surf") as f:
+                self.assertEqual(f.read(), original)
+
+            gz_file = sp.write_surf(A, L, N, out, description, compress=True)
+            gverts, gfaces = sp.read_surface(gz_file)
+            self.assertTrue(np.array_equal(gverts, verts))
+            self.assertIs(gfaces, faces)
+            self.assertEqual(sp.read_surface_header(gz_file),
+                             (description, L, N))
+
+            bverts, bfaces = sp.read_surface(
+                sp.write_surf(A, L, N, out, description, binary=True))
+            self.assertTrue(np.array_equal(bverts, verts))
+            self.assertTrue(np.array_equal(bfaces, faces))
+            del bverts, bfaces
+
+            # inconsistent shapes are refused, and leave the file alone
+            with self.assertRaises(ValueError):
+                sp.write_surf(A[:-1], L, N, out, description)
+            with self.assertRaises(ValueError):
+                sp.write_surf(A, L, N + 1, out, description)
+            with self.assertRaisesRegex(ValueError, "len\\(N\\) != L"):
+                sp.write_surf(A, L, [N]*(L - 1), out, description)
+            with open(out + ".surf") as f:
+                self.assertEqual(f.read(), original)
+            self.assertEqual(sorted(os.listdir(tmp)),
+                             ["RA_L.surf", "RA_L.surf.gz", "RA_L.surfb"])
+
+    def test_read_surface_left(self):
+        file_name = os.path.join(DATA_DIR, "RA_L.surf")
+        _, L, N = sp.read_surface_header(file_name)
+        verts, faces = sp.read_surface(file_name)
+        lverts, lfaces = sp.read_surface_left(file_name)
+        self.assertTrue(np.array_equal(lverts, verts))
+        self.assertTrue(np.array_equal(lfaces, faces[:-N]))
+        self.assertNotIn(L*N + 1, lfaces)
+
+    def test_write_surf_mode(self):
+        # atomic writes give new files mode 0o644, or keep the existing one
+        A = np.random.default_rng(0).normal(size=(20, 3))
+        with tempfile.TemporaryDirectory() as tmp:
+            out = os.path.join(tmp, "modes")
+            for kwds in ({}, {"compress": True}, {"binary": True}):
+                file_name = sp.write_surf(A, 4, 5, out, **kwds)
+                self.assertEqual(os.stat(file_name).st_mode & 0o777, 0o644)
+
+            os.chmod(out + ".surf", 0o640)
+            sp.write_surf(A, 4, 5, out)
+            self.assertEqual(os.stat(out + ".surf").st_mode & 0o777, 0o640)
+
+    def test_normals(self):
+        for name in ["whole_brain_L", "RA_R", "AreaX_L"]:
+            file_name = os.path.join(DATA_DIR, name + ".surf")
+            with self.subTest(name=name):
+                verts, faces = sp.read_surface(file_name)
+                _, L, N = sp.read_surface_header(file_name)
+                normals = sp.surface_normals(verts, faces)
+                self.assertEqual(normals.dtype, np.float32)
+                np.testing.assert_allclose(sp.grid_normals(verts, L, N),
+                                           normals, atol=1e-6)
+
+                # sum of the face normals of each vertex, made unit length
+                ref = np.zeros_like(verts)
+                for face in faces.astype(int):
+                    a, b, c = verts[face]
+                    ref[face] += np.cross(b - a, c - a)
+                ref /= np.linalg.norm(ref, axis=1, keepdims=True)
+                np.testing.assert_allclose(normals, ref, atol=1e-6)
+
+    def test_surfb_normals(self):
+        file_name = os.path.join(DATA_DIR, "HVC_L.surf")
+        verts, faces = sp.read_surface(file_name)
+        _, L, N = sp.read_surface_header(file_name)
+        with tempfile.TemporaryDirectory() as tmp:
+            out_file = sp.convert_surf(file_name, os.path.join(tmp, "HVC_L"))
+            _, _, normals, _ = sp.read_surface_binary(out_file,
+                                                      with_normals=True)
+            self.assertTrue(np.array_equal(normals,
+                                           sp.grid_normals(verts, L, N)))
+            del normals
+
+            sp.write_surfb(verts, faces, L, N, os.path.join(tmp, "plain"))
+            _, _, normals, _ = sp.read_surface_binary(
+                os.path.join(tmp, "plain.surfb"), with_normals=True)
+            self.assertIsNone(normals)
+
+            # files of version 1 have no normals header
+            v1_file = os.path.join(tmp, "v1.surfb")
+            desc = b"version 1"
+            vert_offset = sp._surfb_align(sp._SURFB_HEADER.size + len(desc))
+            face_offset = sp._surfb_align(vert_offset + verts.nbytes)
+            with open(v1_file, "wb") as f:
+                f.write(sp._SURFB_HEADER.pack(
+                    sp.SURFB_MAGIC, 1, L, N, len(desc), vert_offset,
+                    face_offset, b"<f8", faces.dtype.str.encode("ascii")))
+                f.write(desc)
+                f.write(bytes(vert_offset - f.tell()))
+                f.write(verts.astype("<f8").tobytes())
+                f.write(bytes(face_offset - f.tell()))
+                f.write(faces.tobytes())
+            bverts, bfaces, normals, description = sp.read_surface_binary(
+                v1_file, with_normals=True)
+            self.assertTrue(np.array_equal(bverts, verts))
+            self.assertTrue(np.array_equal(bfaces, faces))
+            self.assertIsNone(normals)
+            self.assertEqual(description, "version 1")
+            del bverts, bfaces
+
+    def test_surfb_round_trip(self):
+        file_name = os.path.join(DATA_DIR, "HVC_L.surf")
+        verts, faces = sp.read_surface(file_name)
+        with tempfile.TemporaryDirectory() as tmp:
+            out_file = sp.convert_surf(file_name, os.path.join(tmp, "HVC_L"))
+            bverts, bfaces = sp.read_surface(out_file)
+            self.assertIsInstance(bverts, np.memmap)
+            self.assertFalse(bverts.flags.writeable)
+            self.assertTrue(np.array_equal(bverts, verts))
+            self.assertTrue(np.array_equal(bfaces, faces))
+            _, _, description = sp.read_surface_binary(out_file)
+            self.assertEqual(description, "This is the HVC_L")
+            self.assertEqual(sp.read_surface_header(out_file),
+                             sp.read_surface_header(file_name))
+            del bverts, bfaces
+
+    def test_surfb_rejects_other_files(self):
+        file_name = os.path.join(DATA_DIR, "HVC_L.surf")
+        with self.assertRaises(ValueError):
+            sp.read_surface_binary(file_name)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,93 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+import zfbrain.surface_plotting as sp
+from test.surfaces import cylinder
+from zfbrain import query
+from zfbrain import voxels
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "zfbrain", "data")
+
+
+def grid_points(origin, voxel_size, shape):
+    """Centres of all voxels of a grid, in [x, y, z] order."""
+    index = np.indices(shape).reshape(3, -1).T
+    return origin + index*voxel_size
+
+
+class TestVoxels(unittest.TestCase):
+
+    def test_rasterize_matches_query(self):
+        # voxel centres are exactly the points query tests, so both agree
+        # also on the surface
+        for name in ["HVC_L", "RA_R"]:
+            with self.subTest(name=name):
+                verts, faces = sp.read_surface(
+                    os.path.join(DATA_DIR, name + ".surf"))
+                surf = verts[:, [0, 2, 1]]
+                origin = surf.min(axis=0) - 13.7
+                shape = tuple((np.ptp(surf, axis=0)//7 + 5).astype(int))
+                inside = voxels.rasterize(verts, faces, origin, 7, shape)
+                expected = query.RegionIndex(verts, faces).contains(
+                    grid_points(origin, 7, shape))
+                self.assertGreater(inside.sum(), 1000)
+                self.assertTrue(np.array_equal(inside.ravel(), expected))
+
+    def test_cylinder_distance(self):
+        r = 100
+        verts, faces = cylinder(12, 256, r)
+        # a grid off the vertices, rays exactly through which are as
+        # ambiguous for rasterize as for query
+        origin, shape = np.array([-150.3, -150.7, -100.1]), (61, 61, 121)
+        inside = voxels.rasterize(verts, faces, origin, 5, shape)
+
+        sdf = voxels.signed_distance_field(inside, 5)
+        atlas = voxels.VoxelAtlas(inside.astype(np.uint8), sdf, origin, 5,
+                                  ["cylinder"])
+
+        # away from the caps, the distance is to the round side
+        rng = np.random.default_rng(0)
+        points = np.column_stack((rng.uniform(-140, 140, (2000, 2)),
+                                  rng.uniform(150, 300, 2000)))
+        radius = np.hypot(points[:, 0], points[:, 1])
+        self.assertTrue(np.allclose(atlas.signed_distance(points),
+                                    radius - r, atol=7.5))
+        labels = atlas.classify(points)
+        clear = np.abs(radius - r) > 5
+        self.assertTrue(np.array_equal(labels[clear] == "cylinder",
+                                       radius[clear] < r))
+        self.assertTrue(np.isnan(atlas.signed_distance([[1e5, 0, 0]])[0]))
+
+    def test_build_atlas(self):
+        regions = ["HVC_L", "whole_brain_L"]
+        indices = query.region_indices(regions, data_dir=DATA_DIR)
+        data_files = sorted(os.listdir(DATA_DIR))
+        with tempfile.TemporaryDirectory() as tmp:
+            atlas = voxels.build_atlas(20, regions, out_dir=tmp, processes=2,
+                                       data_dir=DATA_DIR)
+            self.assertIsInstance(atlas.labels, np.memmap)
+            self.assertIs(voxels.load_atlas(20, regions, out_dir=tmp,
+                                            data_dir=DATA_DIR).__class__,
+                          voxels.VoxelAtlas)
+            # nothing is written next to the surfaces
+            self.assertEqual(sorted(os.listdir(DATA_DIR)), data_files)
+
+            # voxel centres get the labels of query
+            points = grid_points(atlas.origin, 20, atlas.labels.shape)
+            expected = query.classify(points, regions, indices=indices)
+            self.assertTrue(np.array_equal(atlas.classify(points),
+                                           expected))
+            self.assertTrue(np.all(
+                (atlas.sdf.ravel() < 0) == (expected != query.OUTSIDE)))
+
+            # rasterizing in this process gives the same atlas
+            serial = voxels.build_atlas(20, regions, out_dir=tmp,
+                                        processes=1, data_dir=DATA_DIR)
+            self.assertTrue(np.array_equal(serial.labels, atlas.labels))
+
+
+if __name__ == '__main__':
+    unittest.main()
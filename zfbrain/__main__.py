@@ -3,289 +3,215 @@
    :synopsis: main entry point to app.
 """
 
-import os
-import sys
-
-import numpy as np
-
-import pyqtgraph as pg
-import pyqtgraph.opengl as gl
-from pyqtgraph.Qt import QtGui, QtWidgets, QtCore
-
-import surface_plotting as sp
-
-# Enable antialiasing for prettier plots
-pg.setConfigOptions(antialias=True)
-
-
-# taken from https://stackoverflow.com/questions/7674790/bundling-data-files-with-pyinstaller-onefile
-def resource_path(relative_path):
-    """ Get absolute path to resource, works for dev and for PyInstaller """
+import argparse
+import glob
+
+try:
+    from zfbrain.instrumentation import check_stats_file
+    from zfbrain import metrics as mt
+    from zfbrain import query as qr
+    from zfbrain import surface_plotting as sp
+    from zfbrain import voxels as vx
+    from zfbrain.resources import resource_path
+except ImportError:
+    # run as a script or from a PyInstaller bundle with --paths zfbrain
+    from instrumentation import check_stats_file
+    import metrics as mt
+    import query as qr
+    import surface_plotting as sp
+    import voxels as vx
+    from resources import resource_path
+
+
+def convert(files):
+    """ Convert *.surf files (default: all in zfbrain/data) to *.surfb """
+    if not files:
+        files = sorted(glob.glob(resource_path("zfbrain/data/*.surf")))
+
+    for file_name in files:
+        try:
+            out_file = sp.convert_surf(file_name)
+        except ValueError as err:
+            print(f"Skipping {file_name}: {err}")
+            continue
+        print(f"Output file {out_file}")
+
+
+def generate(input_file, out_dir, cache_dir=None, max_error=None):
+    """ Generate the surf files of every region in sp.REGION_TABLE """
+    if input_file is None:
+        input_file = resource_path("zfbrain/data/songbird_brain.xml")
+
+    regions = None
+    if max_error is not None:
+        regions = {name: dict(region, max_error=max_error)
+                   for name, region in sp.REGION_TABLE.items()}
+
+    sp.generate_surfaces(input_file, regions=regions, out_dir=out_dir,
+                         cache_dir=cache_dir)
+
+
+def query(points_file, out_file=None, regions=None, processes=None):
+    """ Label the points of a CSV file with the region they lie in """
+    out_file = qr.classify_file(points_file, out_file,
+                                regions=regions or qr.QUERY_REGIONS,
+                                processes=processes)
+    print(f"Output file {out_file}")
+
+
+def stats(files):
+    """ Print the volume, area, centroid and size of surface files
+    (default: all in zfbrain/data) """
+    mt.print_stats(files)
+
+
+def voxelize(voxel_size, out_dir=None, processes=None):
+    """ Rasterize the regions into a label volume and signed distance
+    field """
+    vx.build_atlas(voxel_size, out_dir=out_dir, processes=processes,
+                   report=True)
+
+
+def view(qt_args=(), preload=False, batched=True, stats=False,
+         stats_out=None):
+    # the GUI layer is only imported here, so that the other commands do
+    # not pay for importing Qt and OpenGL
     try:
-        # PyInstaller creates a temp folder and stores path in _MEIPASS
-        base_path = sys._MEIPASS
-    except AttributeError:
-        base_path = os.path.abspath(".")
-
-    return os.path.join(base_path, relative_path)
-
-
-class brainView(gl.GLViewWidget):
-    """ main class for viewing brain regions """
-    def __init__(self, parent=None):
-        super(brainView, self).__init__(parent)
-
-        HVC_L_file = resource_path("zfbrain/data/HVC_L.surf")
-        HVC_R_file = resource_path("zfbrain/data/HVC_R.surf")
-        RA_L_file = resource_path("zfbrain/data/RA_L.surf")
-        RA_R_file = resource_path("zfbrain/data/RA_R.surf")
-        X_L_file = resource_path("zfbrain/data/AreaX_L.surf")
-        X_R_file = resource_path("zfbrain/data/AreaX_R.surf")
-        brain_L_file = resource_path("zfbrain/data/whole_brain_L.surf")
-        brain_R_file = resource_path("zfbrain/data/whole_brain_R.surf")
-
-        verts_HVC_L, faces_HVC_L = sp.read_surface(HVC_L_file)
-        verts_HVC_R, faces_HVC_R = sp.read_surface(HVC_R_file)
-        verts_RA_L, faces_RA_L = sp.read_surface(RA_L_file)
-        verts_RA_R, faces_RA_R = sp.read_surface(RA_R_file)
-        verts_X_L, faces_X_L = sp.read_surface(X_L_file)
-        verts_X_R, faces_X_R = sp.read_surface(X_R_file)
-        verts_brain_L, faces_brain_L = sp.read_surface(brain_L_file)
-        verts_brain_R, faces_brain_R = sp.read_surface(brain_R_file)
-
-        self.hvc_L = gl.GLMeshItem(vertexes=verts_HVC_L, faces=faces_HVC_L,
-                                   color=(1, 0, 0, 0.2), smooth=True,
-                                   drawEdges=False, shader='balloon',
-                                   glOptions='additive')
-
-        self.hvc_R = gl.GLMeshItem(vertexes=verts_HVC_R, faces=faces_HVC_R,
-                                   color=(0.5, 0.5, 0, 0.2), smooth=True,
-                                   drawEdges=False, shader='balloon',
-                                   glOptions='additive')
-
-        self.ra_L = gl.GLMeshItem(vertexes=verts_RA_L, faces=faces_RA_L,
-                                  color=(0, 1, 0, 0.2), smooth=True,
-                                  drawEdges=False, shader='balloon',
-                                  glOptions='additive')
-
-        self.ra_R = gl.GLMeshItem(vertexes=verts_RA_R, faces=faces_RA_R,
-                                  color=(0.5, 1, 0.5, 0.2), smooth=True,
-                                  drawEdges=False, shader='balloon',
-                                  glOptions='additive')
-
-        self.areaX_L = gl.GLMeshItem(vertexes=verts_X_L, faces=faces_X_L,
-                                     color=(0, 0.5, 0.5, 0.2), smooth=True,
-                                     drawEdges=False, shader='balloon',
-                                     glOptions='additive')
-
-        self.areaX_R = gl.GLMeshItem(vertexes=verts_X_R, faces=faces_X_R,
-                                     color=(1, 0.5, 1, 0.2), smooth=True,
-                                     drawEdges=False, shader='balloon',
-                                     glOptions='additive')
-
-        self.outer_L = gl.GLMeshItem(vertexes=verts_brain_L, faces=faces_brain_L,
-                                   color=(200/255, 100/255, 100/255, 0.5),
-                                   drawEdges=False, drawFaces=True,
-                                   shader='shaded', glOptions='opaque')
-
-        self.outer_R = gl.GLMeshItem(vertexes=verts_brain_R, faces=faces_brain_R,
-                                   color=(200/255, 100/255, 100/255, 0.5),
-                                   drawEdges=False, drawFaces=True,
-                                   shader='shaded', glOptions='opaque')
-
-        self.addItem(self.outer_L)
-        self.addItem(self.outer_R)
-        self.addItem(self.hvc_L)
-        self.addItem(self.hvc_R)
-        self.addItem(self.ra_L)
-        self.addItem(self.ra_R)
-        self.addItem(self.areaX_L)
-        self.addItem(self.areaX_R)
-
-        self.setBackgroundColor(50, 50, 50)
-
-        # choose center of whole-brain
-        x_center = np.average(np.concatenate((verts_brain_L[:, 0], verts_brain_R[:, 0])))
-        y_center = np.average(np.concatenate((verts_brain_L[:, 1], verts_brain_R[:, 1])))
-        z_center = np.average(np.concatenate((verts_brain_L[:, 2], verts_brain_R[:, 2])))
-
-        # set camera settings
-        # sets center of rotation for field
-        new_center = np.array([x_center, y_center, z_center])
-        self.opts['center'] = pg.Vector(new_center)
-        self.setCameraPosition(distance=2400, elevation=20, azimuth=50)
-
-    def redraw_surfaces(self, isCheckedList):
-        self.clear()
-
-        if isCheckedList[0] is True:
-            self.addItem(self.outer_L)
-        if isCheckedList[1] is True:
-            self.addItem(self.outer_R)
-        if isCheckedList[2] is True:
-            self.addItem(self.hvc_L)
-        if isCheckedList[3] is True:
-            self.addItem(self.hvc_R)
-        if isCheckedList[4] is True:
-            self.addItem(self.areaX_L)
-        if isCheckedList[5] is True:
-            self.addItem(self.areaX_R)
-        if isCheckedList[6] is True:
-            self.addItem(self.ra_L)
-        if isCheckedList[7] is True:
-            self.addItem(self.ra_R)
-
-
-class BrainRegionChooser(QtWidgets.QWidget):
-    """ main settings class for which brain regions to show """
-    def __init__(self, parent=None):
-        super(BrainRegionChooser, self).__init__(parent)
-
-        layout = QtWidgets.QVBoxLayout()
-        region_label = QtGui.QLabel("Choose which regions to show")
-        self.viewBrainLCB = QtGui.QCheckBox("Outer Brain (L)")
-        self.viewBrainRCB = QtGui.QCheckBox("Outer Brain (R)")
-        self.viewHVCLCB = QtGui.QCheckBox("HVC (L)")
-        self.viewHVCRCB = QtGui.QCheckBox("HVC (R)")
-        self.viewAreaXLCB = QtGui.QCheckBox("Area X (L)")
-        self.viewAreaXRCB = QtGui.QCheckBox("Area X (R)")
-        self.viewRALCB = QtGui.QCheckBox("RA (L)")
-        self.viewRARCB = QtGui.QCheckBox("RA (R)")
+        from zfbrain import gui
+    except ImportError:
+        import gui
 
-        self.viewBrainLCB.setChecked(True)
-        self.viewBrainRCB.setChecked(True)
-        self.viewHVCLCB.setChecked(True)
-        self.viewHVCRCB.setChecked(True)
-        self.viewAreaXLCB.setChecked(True)
-        self.viewAreaXRCB.setChecked(True)
-        self.viewRALCB.setChecked(True)
-        self.viewRARCB.setChecked(True)
+    gui.view(qt_args, preload=preload, batched=batched, stats=stats,
+             stats_out=stats_out)
 
-        self.isCheckedList = [True, True, True, True, True, True, True, True]
-
-        layout.addWidget(region_label)
-        layout.addWidget(self.viewBrainLCB)
-        layout.addWidget(self.viewBrainRCB)
-        layout.addWidget(self.viewHVCLCB)
-        layout.addWidget(self.viewHVCRCB)
-        layout.addWidget(self.viewAreaXLCB)
-        layout.addWidget(self.viewAreaXRCB)
-        layout.addWidget(self.viewRALCB)
-        layout.addWidget(self.viewRARCB)
-
-        self.setLayout(layout)
-
-    def get_checked_state(self):
-        # Outer Brain
-        if self.viewBrainLCB.isChecked():
-            self.isCheckedList[0] = True
-        else:
-            self.isCheckedList[0] = False
-
-        if self.viewBrainRCB.isChecked():
-            self.isCheckedList[1] = True
-        else:
-            self.isCheckedList[1] = False
-
-        # HVC L
-        if self.viewHVCLCB.isChecked():
-            self.isCheckedList[2] = True
-        else:
-            self.isCheckedList[2] = False
-
-        # HVC R
-        if self.viewHVCRCB.isChecked():
-            self.isCheckedList[3] = True
-        else:
-            self.isCheckedList[3] = False
-
-        # Area X L
-        if self.viewAreaXLCB.isChecked():
-            self.isCheckedList[4] = True
-        else:
-            self.isCheckedList[4] = False
-
-        # Area X R
-        if self.viewAreaXRCB.isChecked():
-            self.isCheckedList[5] = True
-        else:
-            self.isCheckedList[5] = False
-
-        # RA L
-        if self.viewRALCB.isChecked():
-            self.isCheckedList[6] = True
-        else:
-            self.isCheckedList[6] = False
-
-        # RA R
-        if self.viewRARCB.isChecked():
-            self.isCheckedList[7] = True
-        else:
-            self.isCheckedList[7] = False
-
-
-class Settings(QtWidgets.QWidget):
-    """ main settings class """
-    def __init__(self, parent=None):
-        super(Settings, self).__init__(parent)
-
-        layout = QtWidgets.QVBoxLayout()
-
-        self.brc = BrainRegionChooser()
-
-        layout.addWidget(self.brc)
-        layout.addStretch(1)
-
-        self.setLayout(layout)
-
-
-class MainWindow(QtWidgets.QMainWindow):
-    """ main class for ZFBrain """
-    def __init__(self):
-        super(MainWindow, self).__init__()
-
-        self.setWindowTitle('ZFBrain')
-        self.resize(1000, 600)
-        self.setWindowIcon(QtGui.QIcon(resource_path("images/zfbrain_logo_small.png")))
-
-        main_layout = QtWidgets.QHBoxLayout()
-
-        self.brv = brainView()
-        self.sl = Settings()
-
-        main_layout.addWidget(self.brv, stretch=4)
-        main_layout.addWidget(self.sl, stretch=1)
-
-        # checkboxes
-        self.sl.brc.viewBrainLCB.toggled.connect(self.something_toggled)
-        self.sl.brc.viewBrainRCB.toggled.connect(self.something_toggled)
-        self.sl.brc.viewHVCLCB.toggled.connect(self.something_toggled)
-        self.sl.brc.viewHVCRCB.toggled.connect(self.something_toggled)
-        self.sl.brc.viewAreaXLCB.toggled.connect(self.something_toggled)
-        self.sl.brc.viewAreaXRCB.toggled.connect(self.something_toggled)
-        self.sl.brc.viewRALCB.toggled.connect(self.something_toggled)
-        self.sl.brc.viewRARCB.toggled.connect(self.something_toggled)
-
-        main_widget = QtWidgets.QWidget()
-        main_widget.setLayout(main_layout)
-        self.setCentralWidget(main_widget)
-
-    def something_toggled(self):
-        # get isCheckedArray
-        self.sl.brc.get_checked_state()
-
-        # redraw everything
-        self.brv.redraw_surfaces(self.sl.brc.isCheckedList)
 
+def render(job_file, out_dir, workers=None, batched=True, qt_args=()):
+    """ Render the frames of a job file offscreen """
+    try:
+        from zfbrain import gui
+    except ImportError:
+        import gui
 
-def main():
-    app = QtGui.QApplication(sys.argv)
-    app.setApplicationName('ZFBrain')
+    gui.render(job_file, out_dir, workers=workers, batched=batched,
+               qt_args=qt_args)
 
-    window = MainWindow()
-    window.show()
 
-    sys.exit(app.exec_())
+def stats_file(file_name):
+    """ argparse type of --stats-out, checked before the viewer opens """
+    try:
+        return check_stats_file(file_name)
+    except ValueError as err:
+        raise argparse.ArgumentTypeError(str(err))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="zfbrain")
+    parser.add_argument(
+        "--preload", action="store_true",
+        help="read hidden regions in the background after the first frame")
+    parser.add_argument(
+        "--per-item", action="store_true",
+        help="draw each region as its own mesh item instead of batching "
+             "regions into one draw call")
+    parser.add_argument(
+        "--stats", action="store_true",
+        help="show frame times, draw times and region sizes in an overlay")
+    parser.add_argument(
+        "--stats-out", metavar="FILE", type=stats_file,
+        help="record frame stats and write them to FILE (*.csv or *.json) "
+             "on exit")
+    subparsers = parser.add_subparsers(dest="command")
+    convert_parser = subparsers.add_parser(
+        "convert", help="convert *.surf files to the binary *.surfb format")
+    convert_parser.add_argument(
+        "files", nargs="*",
+        help="*.surf files to convert (default: all in zfbrain/data)")
+    generate_parser = subparsers.add_parser(
+        "generate", help="generate region *.surf files from Neurolucida XML")
+    generate_parser.add_argument(
+        "input_file", nargs="?",
+        help="Neurolucida XML file (default: zfbrain/data/songbird_brain.xml)")
+    generate_parser.add_argument(
+        "--out-dir", default="",
+        help="directory to write the *.surf files to (default: current)")
+    generate_parser.add_argument(
+        "--cache-dir",
+        help="rebuild incrementally, caching resampled contours in this "
+             "directory")
+    generate_parser.add_argument(
+        "--max-error", type=float,
+        help="resample each slice adaptively to stay within this distance "
+             "(um) of its contour, writing the variable *.surf format")
+    render_parser = subparsers.add_parser(
+        "render", help="render views and turntables of a job file to "
+                       "images, offscreen")
+    render_parser.add_argument(
+        "job_file", help="JSON job file (see zfbrain.render_jobs)")
+    render_parser.add_argument(
+        "--out-dir", default="",
+        help="directory to write the images to (default: current)")
+    render_parser.add_argument(
+        "--workers", type=int,
+        help="threads writing images (default: one per CPU)")
+    query_parser = subparsers.add_parser(
+        "query", help="label points of a CSV file with the brain region "
+                      "they lie in")
+    query_parser.add_argument(
+        "points_file", help="CSV file of x, y, z columns in *.surf "
+                            "coordinates, with or without a header")
+    query_parser.add_argument(
+        "--out", help="CSV file to write the labelled points to (default: "
+                      "points_file with _labels added)")
+    query_parser.add_argument(
+        "--regions", nargs="+", metavar="REGION",
+        help="regions to test, the first containing a point labelling it "
+             "(default: nuclei, then the whole brain)")
+    query_parser.add_argument(
+        "--processes", type=int,
+        help="worker processes (default: one per CPU for large inputs)")
+
+    stats_parser = subparsers.add_parser(
+        "stats", help="print the volume, area, centroid and size of "
+                      "surfaces, cached next to each file")
+    stats_parser.add_argument(
+        "files", nargs="*",
+        help="surface files to measure (default: all in zfbrain/data)")
+    voxelize_parser = subparsers.add_parser(
+        "voxelize", help="rasterize the regions into a label volume and a "
+                         "signed distance field, for lookups by indexing")
+    voxelize_parser.add_argument(
+        "--voxel-size", type=float, default=vx.VOXEL_SIZE,
+        help=f"edge of a voxel in um (default: {vx.VOXEL_SIZE:g})")
+    voxelize_parser.add_argument(
+        "--out-dir",
+        help="directory to save the *.npy files to (default: "
+             "~/.cache/zfbrain/atlas_<size>um)")
+    voxelize_parser.add_argument(
+        "--processes", type=int,
+        help="worker processes rasterizing regions (default: one per CPU)")
+
+    # anything not understood here is left for Qt, e.g. -style
+    args, qt_args = parser.parse_known_args(argv)
+
+    if args.command == "convert":
+        convert(args.files)
+    elif args.command == "generate":
+        generate(args.input_file, args.out_dir, cache_dir=args.cache_dir,
+                 max_error=args.max_error)
+    elif args.command == "query":
+        query(args.points_file, args.out, regions=args.regions,
+              processes=args.processes)
+    elif args.command == "stats":
+        stats(args.files)
+    elif args.command == "voxelize":
+        voxelize(args.voxel_size, out_dir=args.out_dir,
+                 processes=args.processes)
+    elif args.command == "render":
+        render(args.job_file, args.out_dir, workers=args.workers,
+               batched=not args.per_item, qt_args=qt_args)
+    else:
+        view(qt_args, preload=args.preload, batched=not args.per_item,
+             stats=args.stats, stats_out=args.stats_out)
 
 
 if __name__ == '__main__':
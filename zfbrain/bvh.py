@@ -0,0 +1,215 @@
+"""
+.. module:: bvh
+   :synopsis: bounding volume hierarchy for casting rays at surfaces.
+
+A BVH holds the faces of one surface in a complete binary tree of
+axis-aligned boxes. The faces are sorted along a Morton (Z-order) curve of
+their centres and cut into leaves of LEAF_SIZE faces, so the tree is built
+without recursion and stored implicitly, with the children of node j at
+2*j+1 and 2*j+2. Rays are traversed all at once, one level of the tree per
+step, and the leaves they pass through are then tested nearest first, in
+rounds of 1, 2, 4, ... leaves per ray, so that the faces of a leaf are
+mostly only tested if it could hold a nearer hit.
+
+This module is headless like surface_plotting.
+"""
+
+import numpy as np
+
+# faces per leaf of a BVH
+LEAF_SIZE = 8
+# bits per axis of the Morton codes of face centres
+MORTON_BITS = 10
+# below this many (ray, leaf) pairs, all leaves are tested at once rather
+# than nearest first, which only pays off for many rays
+ORDERED_MIN_PAIRS = 1024
+# rays traversed together, which bounds the memory held by the (ray, node)
+# pairs of long faces such as those of the caps, whose boxes overlap a lot
+RAY_CHUNK = 1024
+
+
+class BVH(object):
+    """ bounding volume hierarchy over the faces of a triangle mesh
+
+    Parameters
+    ----------
+    verts : ndarray(dtype=float, ndim=2)
+        Vertex matrix with shape (n, 3).
+    faces : ndarray(dtype=int, ndim=2)
+        Face indices matrix with shape (m, 3).
+    """
+    def __init__(self, verts, faces, leaf_size=LEAF_SIZE):
+        self.verts = np.asarray(verts, dtype=float)
+        self.faces = np.asarray(faces, dtype=np.intp)
+        self.leaf_size = leaf_size
+        corners = self.verts[self.faces]
+
+        # faces in Morton order of their centres, leaves padded up to a
+        # power of two; a partly filled leaf repeats its first face, and
+        # empty leaves get empty boxes
+        order = np.argsort(morton_codes(corners.mean(axis=1)), kind='stable')
+        n_faces = len(order)
+        n_leaves = 1 << max(int(np.ceil(np.log2(max(
+            -(-n_faces // leaf_size), 1)))), 0)
+        slots = np.arange(n_leaves*leaf_size)
+        first = np.minimum(slots - slots % leaf_size, max(n_faces - 1, 0))
+        self.slot_faces = order[np.where(slots < n_faces, slots, first)]
+        self.n_leaves = n_leaves
+
+        # Moller-Trumbore needs a corner, 2 edges and the normal of each
+        # face, kept side by side so that they are gathered at once
+        slot_corners = corners[self.slot_faces]
+        e1 = slot_corners[:, 1] - slot_corners[:, 0]
+        e2 = slot_corners[:, 2] - slot_corners[:, 0]
+        self.slot_data = np.concatenate((slot_corners[:, 0], e1, e2,
+                                         np.cross(e1, e2)), axis=1)
+
+        # boxes of the leaves, then of each level up to the root
+        leaf_corners = slot_corners.reshape(n_leaves, -1, 3)
+        empty = np.arange(n_leaves)*leaf_size >= n_faces
+        lo = np.where(empty[:, None], np.inf, leaf_corners.min(axis=1))
+        hi = np.where(empty[:, None], -np.inf, leaf_corners.max(axis=1))
+        levels_lo, levels_hi = [lo], [hi]
+        while len(lo) > 1:
+            lo = np.minimum(lo[0::2], lo[1::2])
+            hi = np.maximum(hi[0::2], hi[1::2])
+            levels_lo.append(lo)
+            levels_hi.append(hi)
+        self.lo = np.concatenate(levels_lo[::-1])
+        self.hi = np.concatenate(levels_hi[::-1])
+
+    def intersect(self, origins, directions):
+        """ cast rays at the mesh
+
+        Parameters
+        ----------
+        origins : array_like
+            Origins of the rays with shape (r, 3), or (3,) for one ray.
+        directions : array_like
+            Directions of the rays, of the same shape.
+
+        Returns
+        -------
+        t : ndarray(dtype=float, ndim=1)
+            Distance along each ray to its first hit, in units of its
+            direction, or inf if it misses.
+        face : ndarray(dtype=int, ndim=1)
+            Index of the face hit first by each ray, or -1.
+        """
+        origins = np.asarray(origins, dtype=float).reshape(-1, 3)
+        directions = np.asarray(directions, dtype=float).reshape(-1, 3)
+        if len(origins) > RAY_CHUNK:
+            chunks = [self.intersect(origins[start:start+RAY_CHUNK],
+                                     directions[start:start+RAY_CHUNK])
+                      for start in range(0, len(origins), RAY_CHUNK)]
+            return tuple(np.concatenate(part) for part in zip(*chunks))
+
+        with np.errstate(divide='ignore'):
+            inverse = 1/directions
+
+        n_rays = len(origins)
+        best_t = np.full(n_rays, np.inf)
+        best_slot = np.full(n_rays, -1)
+
+        # (ray, node) pairs still to visit, one level of the tree at a time
+        rays = np.arange(n_rays)
+        nodes = np.zeros(n_rays, dtype=np.intp)
+        first_leaf = self.n_leaves - 1
+        while True:
+            hit, t_near = _slab_test(self.lo[nodes], self.hi[nodes],
+                                     origins[rays], inverse[rays])
+            rays, nodes, t_near = rays[hit], nodes[hit], t_near[hit]
+            if len(nodes) == 0 or nodes[0] >= first_leaf:
+                break
+            rays = np.repeat(rays, 2)
+            nodes = 2*np.repeat(nodes, 2) + 1 + np.tile([0, 1], len(nodes))
+
+        # all leaves are on the last level; visit the leaves of each ray in
+        # the order the ray enters them, in rounds of doubling size
+        order = np.lexsort((t_near, rays))
+        rays, leaves, t_near = (rays[order], nodes[order] - first_leaf,
+                                t_near[order])
+        group_start = np.flatnonzero(np.r_[True, rays[1:] != rays[:-1]])
+        rank = np.arange(len(rays)) - np.repeat(
+            group_start, np.diff(np.r_[group_start, len(rays)]))
+        rank = np.log2(rank + 1).astype(int)
+        if len(rays) < ORDERED_MIN_PAIRS:
+            rank[:] = 0
+        by_rank = np.argsort(rank, kind='stable')
+        rank_start = np.searchsorted(rank[by_rank], np.arange(rank.max()+2)
+                                     if len(rank) else [0])
+
+        for k in range(len(rank_start) - 1):
+            pairs = by_rank[rank_start[k]:rank_start[k+1]]
+            # leaves entered beyond the nearest hit cannot hold a nearer one
+            # (this round may still test some, past a hit found in it)
+            pairs = pairs[t_near[pairs] < best_t[rays[pairs]]]
+            if len(pairs) == 0:
+                break
+            slots = (leaves[pairs, None]*self.leaf_size
+                     + np.arange(self.leaf_size)).ravel()
+            ray = np.repeat(rays[pairs], self.leaf_size)
+            t = self._triangle_test(slots, origins[ray], directions[ray])
+            np.minimum.at(best_t, ray, t)
+            nearest = (t == best_t[ray]) & np.isfinite(t)
+            best_slot[ray[nearest]] = slots[nearest]
+
+        face = np.where(best_slot >= 0, self.slot_faces[best_slot], -1)
+        return best_t, face
+
+    def _triangle_test(self, slots, origins, directions):
+        """ Moller-Trumbore test of each ray against the face in its slot;
+        returns the distance to the hit, or inf
+
+        With the face normal n = e1 x e2 precomputed, the determinant is
+        -d.n and only q = s x d is left to compute per test. """
+        data = self.slot_data[slots]
+        e1, e2, n = data[:, 3:6], data[:, 6:9], data[:, 9:12]
+        s = origins - data[:, 0:3]
+        q = np.stack((s[:, 1]*directions[:, 2] - s[:, 2]*directions[:, 1],
+                      s[:, 2]*directions[:, 0] - s[:, 0]*directions[:, 2],
+                      s[:, 0]*directions[:, 1] - s[:, 1]*directions[:, 0]),
+                     axis=1)
+        det = -np.einsum('ij,ij->i', directions, n)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            inv_det = 1/det
+            u = np.einsum('ij,ij->i', e2, q)*inv_det
+            v = -np.einsum('ij,ij->i', e1, q)*inv_det
+            t = np.einsum('ij,ij->i', s, n)*inv_det
+        hit = ((det != 0) & (u >= 0) & (v >= 0) & (u + v <= 1) & (t >= 0))
+        return np.where(hit, t, np.inf)
+
+    def nearest_vertex(self, face, point):
+        """ get the index of the corner of `face` nearest to `point` """
+        corners = self.faces[face]
+        dist = np.linalg.norm(self.verts[corners] - point, axis=-1)
+        return corners[np.argmin(dist)]
+
+
+def _slab_test(lo, hi, origins, inverse):
+    """ whether each ray passes through its box, ahead of its origin, and
+    the distance at which it enters the box """
+    with np.errstate(invalid='ignore'):
+        t0 = (lo - origins)*inverse
+        t1 = (hi - origins)*inverse
+    # a ray parallel to a slab and starting on its plane gives nan, which
+    # fmin and fmax leave out
+    t_near = np.fmax.reduce(np.fmin(t0, t1), axis=1)
+    t_far = np.fmin.reduce(np.fmax(t0, t1), axis=1)
+    return (t_near <= t_far) & (t_far >= 0), t_near
+
+
+def morton_codes(points, bits=MORTON_BITS):
+    """ interleave the bits of `points` (n, 3), scaled to their bounding
+    box, into Morton codes """
+    points = np.asarray(points, dtype=float)
+    lo = points.min(axis=0)
+    extent = np.maximum(points.max(axis=0) - lo, np.finfo(float).tiny)
+    cells = ((points - lo)/extent*((1 << bits) - 1)).astype(np.uint64)
+
+    codes = np.zeros(len(points), dtype=np.uint64)
+    for bit in range(bits):
+        for axis in range(3):
+            codes |= (((cells[:, axis] >> np.uint64(bit)) & np.uint64(1))
+                      << np.uint64(3*bit + axis))
+    return codes
@@ -0,0 +1,1206 @@
+"""
+.. module:: gui
+   :synopsis: Qt/OpenGL viewer for brain regions.
+"""
+
+import collections
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+from OpenGL import GL
+
+import pyqtgraph as pg
+import pyqtgraph.opengl as gl
+from pyqtgraph.Qt import QtGui, QtWidgets, QtCore
+
+try:
+    from pyqtgraph.opengl.items.GLMeshItem import DirtyFlag
+except ImportError:
+    # pyqtgraph < 0.13 draws from client-side arrays, with nothing to upload
+    DirtyFlag = None
+
+try:
+    from zfbrain import surface_plotting as sp
+    from zfbrain.bvh import BVH
+    from zfbrain.instrumentation import FrameStats, check_stats_file
+    from zfbrain import metrics as mt
+    from zfbrain.render_jobs import read_job
+    from zfbrain.resources import resource_path, surface_path
+except ImportError:
+    # run as a script or from a PyInstaller bundle with --paths zfbrain
+    import surface_plotting as sp
+    from bvh import BVH
+    from instrumentation import FrameStats, check_stats_file
+    import metrics as mt
+    from render_jobs import read_job
+    from resources import resource_path, surface_path
+
+# Enable antialiasing for prettier plots
+pg.setConfigOptions(antialias=True)
+
+
+class Region(object):
+    """ describes one brain region shown in brainView """
+    def __init__(self, name, label, color, options, checked=True,
+                 mirror_of=None, shell=False):
+        # name of the surface file in zfbrain/data, without extension
+        self.name = name
+        # label of the region's checkbox in BrainRegionChooser
+        self.label = label
+        self.color = color
+        # other keyword arguments of the region's GLMeshItem
+        self.options = options
+        # whether the region is shown at startup
+        self.checked = checked
+        # name of the region of the other hemisphere that this one is
+        # drawn from, reflected across the midline, instead of its own file
+        self.mirror_of = mirror_of
+        # whether the region is a see-through shell around other regions,
+        # which picking passes through when it hits a region inside
+        self.shell = shell
+
+
+OUTER_OPTIONS = dict(drawEdges=False, drawFaces=True, shader='shaded',
+                     glOptions='opaque')
+NUCLEUS_OPTIONS = dict(smooth=True, drawEdges=False, shader='balloon',
+                       glOptions='additive')
+
+# all brain regions, in the order of their checkboxes
+REGIONS = [
+    Region("whole_brain_L", "Outer Brain (L)",
+           (200/255, 100/255, 100/255, 0.5), OUTER_OPTIONS, shell=True),
+    Region("whole_brain_R", "Outer Brain (R)",
+           (200/255, 100/255, 100/255, 0.5), OUTER_OPTIONS,
+           mirror_of="whole_brain_L", shell=True),
+    Region("HVC_L", "HVC (L)", (1, 0, 0, 0.2), NUCLEUS_OPTIONS),
+    Region("HVC_R", "HVC (R)", (0.5, 0.5, 0, 0.2), NUCLEUS_OPTIONS,
+           mirror_of="HVC_L"),
+    Region("AreaX_L", "Area X (L)", (0, 0.5, 0.5, 0.2), NUCLEUS_OPTIONS),
+    Region("AreaX_R", "Area X (R)", (1, 0.5, 1, 0.2), NUCLEUS_OPTIONS,
+           mirror_of="AreaX_L"),
+    Region("RA_L", "RA (L)", (0, 1, 0, 0.2), NUCLEUS_OPTIONS),
+    Region("RA_R", "RA (R)", (0.5, 1, 0.5, 0.2), NUCLEUS_OPTIONS,
+           mirror_of="RA_L"),
+]
+
+# result of picking a region in brainView: the region name, the point hit
+# and the nearest vertex of the region (index, and its point), with points
+# in the coordinates of the *.surf files (um)
+Pick = collections.namedtuple("Pick", ["name", "point", "vertex",
+                                       "vertex_point"])
+
+
+def mesh_data(verts, faces, normals, **kwds):
+    """ build a MeshData with precomputed vertex normals, so that it does
+    not compute its own the first time it is drawn
+
+    MeshData has no public setter for them up to pyqtgraph 0.14, which
+    only computes them while its `_vertexNormals` is unset. Without either
+    the setter or that attribute, `normals` are dropped and pyqtgraph
+    computes its own instead, more slowly but correctly. """
+    md = gl.MeshData(vertexes=verts, faces=faces, **kwds)
+    normals = np.ascontiguousarray(normals, dtype=np.float32)
+    if hasattr(md, 'setVertexNormals'):
+        md.setVertexNormals(normals)
+    elif getattr(md, '_vertexNormals', False) is None:
+        md._vertexNormals = normals
+    return md
+
+
+# per-item state of GLMeshItem that MirroredMeshItem takes from its source
+_SHARED_MESH_STATE = ('vertexes', 'normals', 'colors', 'faces', 'edges',
+                      'edgeVerts', 'm_vbo_position', 'm_vbo_normal',
+                      'm_vbo_color', 'm_ibo_faces', 'm_vbo_edgeVerts',
+                      'm_ibo_edges')
+
+
+class MirroredMeshItem(gl.GLMeshItem):
+    """ draws the mesh of another GLMeshItem reflected across the midline
+    between hemispheres (see sp.mirror_matrix)
+
+    The mesh data of the source item is shared, and where pyqtgraph draws
+    from vertex buffers, its buffers on the GPU are shared too. """
+    def __init__(self, source, **kwds):
+        super(MirroredMeshItem, self).__init__(
+            meshdata=source.opts['meshdata'], **kwds)
+        self.source = source
+        self.setTransform(pg.Transform3D(*sp.mirror_matrix().ravel()))
+
+    def paint(self):
+        source = self.source
+        if hasattr(source, 'upload_vertex_buffers'):
+            # let the source upload its buffers if needed, then draw
+            # from them rather than uploading a copy
+            dirty_bits = source.parseMeshData()
+            if dirty_bits:
+                source.upload_vertex_buffers(dirty_bits)
+            for attr in _SHARED_MESH_STATE:
+                setattr(self, attr, getattr(source, attr))
+
+        super(MirroredMeshItem, self).paint()
+
+
+class AtlasMeshItem(gl.GLMeshItem):
+    """ draws several regions that share their shader and GL options from
+    one set of packed buffers, in a single draw call
+
+    Each region keeps its own colour, stored per vertex, and its own range
+    of the packed faces. Hiding a region only drops its range from the
+    index buffer that is drawn, the vertex buffers stay as they are. """
+    def __init__(self, label="atlas", **kwds):
+        super(AtlasMeshItem, self).__init__(**kwds)
+        self.label = label
+        # names of the packed regions, and the range of vertices and of
+        # faces of each
+        self.names = []
+        self._vert_ranges = {}
+        self._ranges = {}
+        self._faces = np.zeros((0, 3), dtype=np.uint32)
+        self._shown = set()
+        self._faces_dirty = False
+
+    def set_regions(self, meshes):
+        """ pack `meshes`, a list of (name, verts, faces, normals, color) """
+        n_verts = [len(mesh[1]) for mesh in meshes]
+        n_faces = [len(mesh[2]) for mesh in meshes]
+        vert_starts = np.concatenate(([0], np.cumsum(n_verts)))
+        face_starts = np.concatenate(([0], np.cumsum(n_faces)))
+
+        verts = np.concatenate([mesh[1] for mesh in meshes])
+        # offset in a wide type, since adding a numpy int64 start would
+        # promote uint32 faces to int64, which the index buffer cannot take
+        self._faces = np.concatenate(
+            [(mesh[2].astype(np.int64) + start).astype(np.uint32)
+             for mesh, start in zip(meshes, vert_starts)])
+        normals = np.concatenate([mesh[3] for mesh in meshes])
+        colors = np.repeat(np.array([mesh[4] for mesh in meshes],
+                                    dtype=np.float32), n_verts, axis=0)
+
+        self.names = [mesh[0] for mesh in meshes]
+        self._vert_ranges = {name: (vert_starts[ti], vert_starts[ti+1])
+                             for ti, name in enumerate(self.names)}
+        self._ranges = {name: (face_starts[ti], face_starts[ti+1])
+                        for ti, name in enumerate(self.names)}
+        self._faces_dirty = True
+        self.setMeshData(meshdata=mesh_data(verts, self._faces, normals,
+                                            vertexColors=colors))
+
+    def set_shown(self, names):
+        """ draw only the packed regions in `names` """
+        shown = set(names)
+        if shown != self._shown:
+            self._shown = shown
+            self._faces_dirty = True
+            self.update()
+
+    def parseMeshData(self):
+        dirty_bits = super(AtlasMeshItem, self).parseMeshData()
+
+        if self._faces_dirty and self.vertexes is not None:
+            self._faces_dirty = False
+            self.faces = np.concatenate(
+                [self._faces[slice(*self._ranges[name])]
+                 for name in self.names if name in self._shown]
+                + [self._faces[:0]])
+            if DirtyFlag is not None:
+                dirty_bits |= DirtyFlag.FACES
+
+        return dirty_bits
+
+
+class MirroredAtlasItem(AtlasMeshItem):
+    """ draws regions mirroring those packed in an AtlasMeshItem, reflected
+    across the midline between hemispheres like MirroredMeshItem
+
+    The vertex positions and normals of the source atlas are shared, and
+    where pyqtgraph draws from vertex buffers, so are those buffers on the
+    GPU. Only the colours, per vertex, and the faces drawn are its own. """
+    def __init__(self, source, **kwds):
+        super(MirroredAtlasItem, self).__init__(
+            label=f"{source.label} mirrored", **kwds)
+        self.source = source
+        self._colors = None
+        self._colors_dirty = False
+        self.setTransform(pg.Transform3D(*sp.mirror_matrix().ravel()))
+
+    def set_regions(self, mirrors):
+        """ draw the regions packed in the source atlas as the regions
+        mirroring them, `mirrors` mapping the name of a packed region to
+        (name, color) of the region mirroring it """
+        source = self.source
+        self.names = [mirrors[name][0] for name in source.names
+                      if name in mirrors]
+        self._ranges = {mirrors[name][0]: source._ranges[name]
+                        for name in source.names if name in mirrors}
+        self._faces = source._faces
+        n_verts = [end - start for start, end in source._vert_ranges.values()]
+        colors = [mirrors[name][1] if name in mirrors else (0, 0, 0, 0)
+                  for name in source.names]
+        self._colors = np.repeat(np.array(colors, dtype=np.float32)
+                                 .reshape(-1, 4), n_verts, axis=0)
+        self._colors_dirty = True
+        self._faces_dirty = True
+        self.update()
+
+    def parseMeshData(self):
+        # the source atlas is parsed (and its buffers uploaded) first, see
+        # paint; its arrays are only taken from it here
+        if self.source.vertexes is None:
+            return DirtyFlag(0) if DirtyFlag is not None else None
+        if self.vertexes is not self.source.vertexes:
+            self.vertexes = self.source.vertexes
+            self.normals = self.source.normals
+
+        dirty_bits = super(MirroredAtlasItem, self).parseMeshData()
+        if self._colors_dirty:
+            self._colors_dirty = False
+            self.colors = self._colors
+            if DirtyFlag is not None:
+                dirty_bits |= DirtyFlag.COLOR
+        return dirty_bits
+
+    def paint(self):
+        source = self.source
+        dirty_bits = source.parseMeshData()
+        if hasattr(source, 'upload_vertex_buffers'):
+            if dirty_bits:
+                source.upload_vertex_buffers(dirty_bits)
+            self.m_vbo_position = source.m_vbo_position
+            self.m_vbo_normal = source.m_vbo_normal
+
+        super(MirroredAtlasItem, self).paint()
+
+
+class RegionRegistry(QtCore.QObject):
+    """ reads brain regions and builds their meshes the first time they
+    are needed, and caches them after that
+
+    Each region also gets a level-of-detail pyramid (see sp.surface_lods)
+    when it is read, and its mesh item draws one level of it at a time.
+    Mirrored regions are never read: their items are MirroredMeshItems
+    drawing the data of the region they mirror. """
+
+    # emitted from the preload thread once its surfaces are read
+    preloaded = QtCore.Signal()
+
+    def __init__(self, regions, parent=None, build_items=True):
+        super(RegionRegistry, self).__init__(parent)
+
+        self.regions = {region.name: region for region in regions}
+        # whether preloading builds the mesh items too, which a view that
+        # draws from atlases does not need
+        self.build_items = build_items
+        self.surfaces = {}
+        self.items = {}
+        # per region read from file: (verts, faces) of each level, their
+        # vertex normals and typical edge length, the metrics of the region
+        # (see zfbrain.metrics), the level drawn now (which its mirror
+        # draws too), the bands of its full resolution faces for cutting
+        # sections and its BVH for picking, built when first needed
+        self.lods = {}
+        self.lod_normals = {}
+        self.lod_edges = {}
+        self.metrics = {}
+        self.levels = {}
+        self.bands = {}
+        self.bvhs = {}
+        self._meshdata = {}
+        self._lock = threading.Lock()
+        self._preload_thread = None
+
+        self.preloaded.connect(self._build_preloaded)
+
+    def source(self, name):
+        """ get the name of the region whose file region `name` is drawn
+        from, which is `name` unless it is mirrored """
+        return self.regions[name].mirror_of or name
+
+    def load(self, names):
+        """ read the surfaces of regions `names` that are not cached yet,
+        reading the region they mirror instead for mirrored regions """
+        sources = list(dict.fromkeys(self.source(name) for name in names))
+        with self._lock:
+            missing = [name for name in sources if name not in self.surfaces]
+        if not missing:
+            return
+
+        paths = [surface_path(name) for name in missing]
+        surfaces = sp.read_surfaces(paths)
+
+        lods = []
+        lod_normals = []
+        bands = []
+        metrics = []
+        for path, (verts, faces) in zip(paths, surfaces):
+            # the viewer only reads cached metrics, and never writes to
+            # its data directory
+            metrics.append(mt.file_metrics(path, (verts, faces),
+                                           write=False))
+            _, L, N = sp.read_surface_header(path)
+            lod = sp.surface_lods(verts, L, N)
+            lods.append(lod)
+            bands.append(sp.section_bands(verts, L, N))
+            # full resolution normals are stored in *.surfb files
+            normals = None
+            if path.endswith(".surfb"):
+                normals = sp.read_surface_binary(path, with_normals=True)[2]
+            if normals is None and np.ndim(N) == 0:
+                normals = sp.grid_normals(verts, L, N)
+            elif normals is None:
+                normals = sp.surface_normals(verts, faces)
+            lod_normals.append([normals] + [sp.surface_normals(*level)
+                                            for level in lod[1:]])
+
+        with self._lock:
+            for name, surface, lod, normals, band, metric in zip(
+                    missing, surfaces, lods, lod_normals, bands, metrics):
+                if name in self.surfaces:
+                    continue
+                self.surfaces[name] = surface
+                self.lods[name] = lod
+                self.lod_normals[name] = normals
+                self.lod_edges[name] = np.array([sp.edge_length(*level)
+                                                 for level in lod])
+                self.metrics[name] = metric
+                self.levels[name] = 0
+                self.bands[name] = band
+
+    def surface(self, name):
+        """ get (verts, faces) of region `name`, reading it if needed
+
+        The vertices of a mirrored region are a reflected copy. """
+        self.load([name])
+        verts, faces = self.surfaces[self.source(name)]
+        if self.regions[name].mirror_of:
+            verts = sp.mirror_verts(verts)
+        return verts, faces
+
+    def region_metrics(self, name):
+        """ get the metrics of region `name`, from the cache next to its
+        file if it is not read yet, or else reading it """
+        source = self.source(name)
+        with self._lock:
+            metrics = self.metrics.get(source)
+        if metrics is None:
+            metrics = mt.read_metrics(surface_path(source))
+        if metrics is None:
+            self.load([name])
+            metrics = self.metrics[source]
+        if self.regions[name].mirror_of:
+            metrics = mt.mirror_metrics(metrics)
+        return metrics
+
+    def centre(self, name):
+        """ get the centroid of region `name` """
+        return self.region_metrics(name).centroid
+
+    def section(self, name, point, normal):
+        """ get the segments (k, 2, 3) where the plane through `point` with
+        `normal` cuts region `name` at full resolution
+
+        A mirrored region is cut by cutting the region it mirrors with the
+        reflected plane. """
+        self.load([name])
+        source = self.source(name)
+        verts, faces = self.surfaces[source]
+        mirrored = self.regions[name].mirror_of is not None
+        if mirrored:
+            point = sp.mirror_verts(np.reshape(point, (1, 3)))[0]
+            normal = sp.mirror_verts(np.reshape(normal, (1, 3)), mid_z=0)[0]
+
+        segments = sp.plane_section(verts, faces, point, normal,
+                                    bands=self.bands[source])
+        if mirrored:
+            segments = sp.mirror_verts(
+                segments.reshape(-1, 3)).reshape(-1, 2, 3)
+        return segments
+
+    def bvh(self, name):
+        """ get the BVH of region `name` at full resolution, building it
+        the first time; mirrored regions share the BVH of their source """
+        source = self.source(name)
+        if source not in self.bvhs:
+            self.load([source])
+            self.bvhs[source] = BVH(*self.surfaces[source])
+        return self.bvhs[source]
+
+    def pick(self, names, origin, direction):
+        """ cast a ray from `origin` along `direction` at regions `names`
+
+        Returns the hits as (t, Pick) sorted by the distance t along the
+        ray. A mirrored region is hit by casting the reflected ray at the
+        region it mirrors. """
+        hits = []
+        for name in names:
+            mirrored = self.regions[name].mirror_of is not None
+            o, d = np.asarray(origin, float), np.asarray(direction, float)
+            if mirrored:
+                o = sp.mirror_verts(o[np.newaxis])[0]
+                d = sp.mirror_verts(d[np.newaxis], mid_z=0)[0]
+
+            bvh = self.bvh(name)
+            t, face = bvh.intersect(o, d)
+            if face[0] < 0:
+                continue
+            point = o + t[0]*d
+            vertex = bvh.nearest_vertex(face[0], point)
+            vertex_point = bvh.verts[vertex]
+            if mirrored:
+                point, vertex_point = sp.mirror_verts(
+                    np.stack((point, vertex_point)))
+            # the columns of verts are x, z, y, see sp.read_surface
+            hits.append((t[0], Pick(name, point[[0, 2, 1]], int(vertex),
+                                    vertex_point[[0, 2, 1]])))
+        return sorted(hits, key=lambda hit: hit[0])
+
+    def item(self, name):
+        """ get the GLMeshItem of region `name`, building it if needed """
+        if name not in self.items:
+            region = self.regions[name]
+            if region.mirror_of:
+                self.items[name] = MirroredMeshItem(
+                    self.item(region.mirror_of), color=region.color,
+                    **region.options)
+            else:
+                self.load([name])
+                self.items[name] = gl.GLMeshItem(
+                    meshdata=self.meshdata(name, 0), color=region.color,
+                    **region.options)
+        return self.items[name]
+
+    def meshdata(self, name, level):
+        """ get the MeshData of level `level` of region `name`, with its
+        precomputed normals """
+        key = (name, level)
+        if key not in self._meshdata:
+            verts, faces = self.lods[name][level]
+            self._meshdata[key] = mesh_data(verts, faces,
+                                            self.lod_normals[name][level])
+        return self._meshdata[key]
+
+    def lod(self, name):
+        """ get (verts, faces, normals) of region `name` at its current
+        level of detail, that of the region it mirrors for a mirrored
+        region, which is drawn reflected """
+        self.load([name])
+        source = self.source(name)
+        level = self.levels[source]
+        verts, faces = self.lods[source][level]
+        return verts, faces, self.lod_normals[source][level]
+
+    def set_level(self, name, level):
+        """ draw region `name`, and any region mirroring it, at level of
+        detail `level`; returns whether the level changed """
+        if self.levels[name] == level:
+            return False
+
+        self.levels[name] = level
+        # (a view drawing from atlases has no items, and repacks them)
+        items = [item for other, item in self.items.items()
+                 if self.source(other) == name]
+        if items:
+            meshdata = self.meshdata(name, level)
+            for item in items:
+                item.setMeshData(meshdata=meshdata)
+        return True
+
+    def preload(self):
+        """ read all remaining regions in a background thread, then build
+        their meshes on the GUI thread """
+        if self._preload_thread is not None:
+            return
+
+        def run():
+            self.load(list(self.regions))
+            self.preloaded.emit()
+
+        self._preload_thread = threading.Thread(target=run, daemon=True)
+        self._preload_thread.start()
+
+    def _build_preloaded(self):
+        if not self.build_items:
+            return
+        for name in self.regions:
+            self.item(name)
+
+
+class brainView(gl.GLViewWidget):
+    """ main class for viewing brain regions
+
+    By default, regions that share their shader and GL options are drawn
+    together by one AtlasMeshItem. With `batched=False` each region is
+    drawn by its own item instead.
+
+    If a FrameStats is given as `stats`, the paint time of every frame and
+    the draw time of every item are recorded into it and shown in an
+    overlay. Without it, none of this runs.
+
+    The view also has a section plane perpendicular to one axis, hidden
+    until shown with set_section, which shift-drag moves along its axis.
+
+    Hovering over or clicking on a region picks it, see pick. """
+
+    # emitted with the axis and position of the section plane when it moves
+    sectionChanged = QtCore.Signal(int, float)
+    # emitted with the Pick under the mouse (or None) when it moves, and
+    # with the Pick clicked on
+    hovered = QtCore.Signal(object)
+    clicked = QtCore.Signal(object)
+
+    def __init__(self, parent=None, preload=False, batched=True, stats=None):
+        super(brainView, self).__init__(parent)
+
+        self.stats = stats
+        if stats is not None:
+            self._overlay = QtWidgets.QLabel(self)
+            self._overlay.setStyleSheet(
+                "background-color: rgba(0, 0, 0, 160); color: white; "
+                "font-family: monospace; padding: 4px;")
+            self._overlay.setAttribute(
+                QtCore.Qt.WA_TransparentForMouseEvents)
+            self._overlay.move(10, 10)
+            self._overlay_timer = QtCore.QTimer(self)
+            self._overlay_timer.timeout.connect(self.update_overlay)
+            self._overlay_timer.start(500)
+
+        self.registry = RegionRegistry(REGIONS, parent=self,
+                                       build_items=not batched)
+
+        # regions shown now, and the atlas item of each group of regions
+        # drawn with the same options (when batched)
+        self.batched = batched
+        self.shown = []
+        self.atlases = {}
+        # regions whose level of detail changed since their atlas was
+        # packed, repacked after the frame that changed it
+        self._lod_changed = set()
+        self._repack_timer = QtCore.QTimer(self)
+        self._repack_timer.setSingleShot(True)
+        self._repack_timer.setInterval(0)
+        self._repack_timer.timeout.connect(self.repack_lods)
+
+        # only regions shown at startup are read now, the others are read
+        # when their checkbox is first turned on (or by preloading)
+        self.registry.load([region.name for region in REGIONS
+                            if region.checked])
+        self.redraw_surfaces([region.checked for region in REGIONS])
+
+        # preload the other regions once the first frame is drawn
+        self._preload_pending = preload
+
+        self.setBackgroundColor(50, 50, 50)
+
+        # choose center of whole-brain (the hemispheres mirror each other,
+        # so it lies halfway between their centroids)
+        brain = [self.registry.region_metrics(name)
+                 for name in ("whole_brain_L", "whole_brain_R")]
+        new_center = (brain[0].centroid + brain[1].centroid)/2
+
+        # set camera settings
+        # sets center of rotation for field
+        self.opts['center'] = pg.Vector(new_center)
+        self.setCameraPosition(distance=2400, elevation=20, azimuth=50)
+
+        # the section plane spans the bounding box of the whole brain
+        self.section_bounds = (np.minimum(brain[0].lo, brain[1].lo),
+                               np.maximum(brain[0].hi, brain[1].hi))
+        self.section_axis = 0
+        self.section_position = float(new_center[0])
+        self.section_item = gl.GLMeshItem(color=(1, 1, 1, 0.25),
+                                          glOptions='translucent')
+        self.section_item.setDepthValue(len(REGIONS))
+        self.section_item.setVisible(False)
+        self.addItem(self.section_item)
+        self.set_section()
+
+        # hovering picks once per batch of mouse moves, at the last one
+        self.setMouseTracking(True)
+        self._hover_pos = None
+        self._press_pos = None
+        self._hover_timer = QtCore.QTimer(self)
+        self._hover_timer.setSingleShot(True)
+        self._hover_timer.setInterval(0)
+        self._hover_timer.timeout.connect(
+            lambda: self.hovered.emit(self.pick(self._hover_pos)))
+
+    def paintGL(self, *args, **kwds):
+        if self.stats is not None:
+            start = time.perf_counter()
+
+        self.update_lods()
+        super(brainView, self).paintGL(*args, **kwds)
+
+        if self.stats is not None:
+            # wait for the GPU, so that the frame time includes drawing
+            GL.glFinish()
+            self.stats.add_frame(start, time.perf_counter() - start)
+
+        if self._preload_pending:
+            self._preload_pending = False
+            QtCore.QTimer.singleShot(0, self.registry.preload)
+
+    def addItem(self, item):
+        if self.stats is not None:
+            self._time_item(item)
+        super(brainView, self).addItem(item)
+
+    def _time_item(self, item):
+        """ record the draw time of `item` into self.stats """
+        paint = item.paint
+        stats = self.stats
+
+        if isinstance(item, AtlasMeshItem):
+            label = item.label
+        else:
+            label = next((name for name, region_item
+                          in self.registry.items.items()
+                          if region_item is item), type(item).__name__)
+
+        def timed_paint():
+            start = time.perf_counter()
+            paint()
+            stats.add_item(label, time.perf_counter() - start)
+
+        item.paint = timed_paint
+
+    def update_overlay(self):
+        """ refresh the region sizes in self.stats and the overlay """
+        self.stats.regions.clear()
+        for name in self.shown:
+            self.registry.load([name])
+            source = self.registry.source(name)
+            verts, faces = self.registry.lods[source][
+                self.registry.levels[source]]
+            # float32 positions and normals, and uint32 indices, plus
+            # float32 colours in an atlas; a mirrored item shares the
+            # buffers of its source, all but the colours and indices of a
+            # mirrored atlas
+            mirrored = self.registry.regions[name].mirror_of is not None
+            if self.batched:
+                gpu_bytes = (16 + 24*(not mirrored))*len(verts) + 12*len(faces)
+            elif mirrored:
+                gpu_bytes = 0
+            else:
+                gpu_bytes = 24*len(verts) + 12*len(faces)
+            self.stats.set_region(name, len(faces), gpu_bytes)
+
+        self._overlay.setText(self.stats.overlay_text())
+        self._overlay.adjustSize()
+
+    def mousePressEvent(self, ev):
+        super(brainView, self).mousePressEvent(ev)
+        self._press_pos = self.mousePos
+
+    def mouseReleaseEvent(self, ev):
+        # a click is a press and release without dragging in between
+        lpos = ev.position() if hasattr(ev, 'position') else ev.localPos()
+        if (self._press_pos is not None
+                and (lpos - self._press_pos).manhattanLength() < 4):
+            self.clicked.emit(self.pick(lpos))
+        self._press_pos = None
+
+    def mouseMoveEvent(self, ev):
+        if ev.buttons() == QtCore.Qt.NoButton:
+            self._hover_pos = (ev.position() if hasattr(ev, 'position')
+                               else ev.localPos())
+            self._hover_timer.start()
+            return
+
+        # shift-drag moves the section plane along its axis, by as much as
+        # the mouse moves at the plane
+        if (self.section_item.visible()
+                and ev.buttons() == QtCore.Qt.LeftButton
+                and ev.modifiers() & QtCore.Qt.ShiftModifier):
+            lpos = ev.position() if hasattr(ev, 'position') else ev.localPos()
+            diff = lpos - self.mousePos
+            self.mousePos = lpos
+            point, _ = self.section_plane()
+            self.set_section(position=self.section_position
+                             - diff.y()*self.pixelSize(pg.Vector(point)))
+            return
+        super(brainView, self).mouseMoveEvent(ev)
+
+    def mouse_ray(self, pos):
+        """ get the origin and direction of the ray through the widget
+        position `pos`, in the coordinates of the items """
+        viewport = self.getViewport()
+        matrix = self.projectionMatrix(viewport, viewport)*self.viewMatrix()
+        inverse = np.linalg.inv(np.array(matrix.data()).reshape(4, 4).T)
+        x = 2*pos.x()/viewport[2] - 1
+        y = 1 - 2*pos.y()/viewport[3]
+        # the points at the near and far clipping planes
+        ends = inverse @ np.array([[x, y, -1, 1], [x, y, 1, 1]]).T
+        near, far = (ends[:3]/ends[3]).T
+        return near, far - near
+
+    def pick(self, pos):
+        """ get the Pick of the shown region under the widget position
+        `pos`, or None
+
+        Regions inside a shell region (the outer brain) are picked through
+        it. """
+        if pos is None:
+            return None
+        hits = self.registry.pick(self.shown, *self.mouse_ray(pos))
+        inside = [pick for _, pick in hits
+                  if not self.registry.regions[pick.name].shell]
+        if inside:
+            return inside[0]
+        return hits[0][1] if hits else None
+
+    def set_section(self, axis=None, position=None, visible=None):
+        """ move the section plane to `position` along axis `axis` (0, 1 or
+        2, kept within the brain), and show or hide it """
+        lo, hi = self.section_bounds
+        if axis is not None:
+            self.section_axis = axis
+        if position is not None:
+            self.section_position = float(position)
+        self.section_position = float(np.clip(self.section_position,
+                                              lo[self.section_axis],
+                                              hi[self.section_axis]))
+        if visible is not None:
+            self.section_item.setVisible(visible)
+
+        # corners of the bounding box in the plane, a little beyond it
+        tu, tv = [ti for ti in range(3) if ti != self.section_axis]
+        margin = 0.05*(hi - lo)
+        corners = np.zeros((4, 3))
+        corners[:, self.section_axis] = self.section_position
+        corners[:, tu] = [lo[tu] - margin[tu], hi[tu] + margin[tu],
+                          hi[tu] + margin[tu], lo[tu] - margin[tu]]
+        corners[:, tv] = [lo[tv] - margin[tv], lo[tv] - margin[tv],
+                          hi[tv] + margin[tv], hi[tv] + margin[tv]]
+        self.section_item.setMeshData(vertexes=corners,
+                                      faces=np.array([[0, 1, 2], [0, 2, 3]]))
+
+        self.sectionChanged.emit(self.section_axis, self.section_position)
+
+    def section_plane(self):
+        """ get a point and the normal of the section plane """
+        point = (self.section_bounds[0] + self.section_bounds[1])/2
+        point[self.section_axis] = self.section_position
+        return point, np.eye(3)[self.section_axis]
+
+    def section_contours(self):
+        """ get the segments (k, 2, 3) where the section plane cuts each
+        shown region, as (name, segments) """
+        point, normal = self.section_plane()
+        return [(name, self.registry.section(name, point, normal))
+                for name in self.shown]
+
+    def update_lods(self):
+        """ switch each shown region to the level of detail that suits its
+        projected size at the current camera distance """
+        # a region and its mirror share one level, that of the nearer one
+        pixel_sizes = {}
+        for name in self.shown:
+            pixel_size = self.pixelSize(pg.Vector(self.registry.centre(name)))
+            source = self.registry.source(name)
+            pixel_sizes[source] = min(pixel_size,
+                                      pixel_sizes.get(source, np.inf))
+
+        for name, pixel_size in pixel_sizes.items():
+            level = sp.select_lod(self.registry.lod_edges[name]/pixel_size,
+                                  self.registry.levels[name])
+            if self.registry.set_level(name, level) and self.batched:
+                self._lod_changed.add(name)
+
+        # atlases hold a copy of each level, which is repacked outside of
+        # painting, so that a frame does not wait for it
+        if self._lod_changed:
+            self._repack_timer.start()
+
+    def repack_lods(self):
+        """ repack the atlases holding regions whose level of detail
+        changed, and draw them again """
+        changed, self._lod_changed = self._lod_changed, set()
+        for key, atlas in self.atlases.items():
+            if not key[1] and changed.intersection(atlas.names):
+                self.pack_atlas(key, atlas.names)
+        self.update()
+
+    def redraw_surfaces(self, isCheckedList):
+        """ show the regions that are checked and hide the others
+
+        Items stay in the view once added and are only made visible or
+        invisible (or, when batched, have their faces left out of the
+        atlas draw), which does not touch their GL state. Each change asks
+        for a repaint, and Qt merges those into one frame. """
+        self.shown = [region.name
+                      for region, isChecked in zip(REGIONS, isCheckedList)
+                      if isChecked is True]
+        if self.batched:
+            self._redraw_atlases()
+            return
+
+        for ti, (region, isChecked) in enumerate(zip(REGIONS, isCheckedList)):
+            if isChecked is True:
+                item = self.registry.item(region.name)
+                if item not in self.items:
+                    # draw in the order of REGIONS, as before
+                    item.setDepthValue(ti)
+                    self.addItem(item)
+                item.setVisible(True)
+            elif region.name in self.registry.items:
+                self.registry.items[region.name].setVisible(False)
+
+    def _redraw_atlases(self):
+        self.registry.load(self.shown)
+
+        # regions drawn with the same options share one atlas, packing the
+        # regions they draw from, every one read so far so that showing a
+        # region does not repack; mirrored regions are drawn from the same
+        # vertices by a MirroredAtlasItem, keyed (options, True)
+        groups = {}
+        for ti, region in enumerate(REGIONS):
+            key = tuple(sorted(region.options.items()))
+            groups.setdefault(key, (ti, region.options, []))[2].append(region)
+
+        for options_key, (ti, options, regions) in groups.items():
+            key, mirrored_key = (options_key, False), (options_key, True)
+            if key not in self.atlases:
+                atlas = AtlasMeshItem(label=f"atlas {options.get('shader')}",
+                                      **options)
+                # draw in the order of REGIONS, as before
+                atlas.setDepthValue(ti)
+                self.addItem(atlas)
+                self.atlases[key] = atlas
+                if any(region.mirror_of for region in regions):
+                    mirrored = MirroredAtlasItem(atlas, **options)
+                    mirrored.setDepthValue(ti)
+                    self.addItem(mirrored)
+                    self.atlases[mirrored_key] = mirrored
+
+            sources = list(dict.fromkeys(
+                self.registry.source(region.name) for region in regions
+                if self.registry.source(region.name)
+                in self.registry.surfaces))
+            if sources != self.atlases[key].names:
+                self.pack_atlas(key, sources)
+
+            for is_mirrored in (False, True):
+                atlas = self.atlases.get((options_key, is_mirrored))
+                if atlas is None:
+                    continue
+                shown = [region.name for region in regions
+                         if (region.mirror_of is not None) == is_mirrored
+                         and region.name in self.shown]
+                atlas.set_shown(shown)
+                atlas.setVisible(len(shown) > 0)
+
+    def pack_atlas(self, key, names):
+        """ pack regions `names`, at their current level of detail, into
+        the atlas of `key`, and draw the regions of its group mirroring
+        them from it """
+        meshes = []
+        for name in names:
+            verts, faces, normals = self.registry.lod(name)
+            color = self.registry.regions[name].color
+            meshes.append((name, verts, faces, normals, color))
+        self.atlases[key].set_regions(meshes)
+
+        mirrored = self.atlases.get((key[0], True))
+        if mirrored is not None:
+            mirrors = {region.mirror_of: (region.name, region.color)
+                       for region in REGIONS
+                       if region.mirror_of in names
+                       and tuple(sorted(region.options.items())) == key[0]}
+            mirrored.set_regions(mirrors)
+
+
+class BrainRegionChooser(QtWidgets.QWidget):
+    """ main settings class for which brain regions to show """
+    def __init__(self, parent=None):
+        super(BrainRegionChooser, self).__init__(parent)
+
+        layout = QtWidgets.QVBoxLayout()
+        region_label = QtWidgets.QLabel("Choose which regions to show")
+        layout.addWidget(region_label)
+
+        # one checkbox per region, in the order of REGIONS
+        self.checkBoxes = []
+        for region in REGIONS:
+            checkBox = QtWidgets.QCheckBox(region.label)
+            checkBox.setChecked(region.checked)
+            layout.addWidget(checkBox)
+            self.checkBoxes.append(checkBox)
+
+        # show or hide all regions at once
+        button_layout = QtWidgets.QHBoxLayout()
+        self.showAllButton = QtWidgets.QPushButton("Show all")
+        self.showAllButton.clicked.connect(lambda: self.set_all_checked(True))
+        button_layout.addWidget(self.showAllButton)
+        self.hideAllButton = QtWidgets.QPushButton("Hide all")
+        self.hideAllButton.clicked.connect(lambda: self.set_all_checked(False))
+        button_layout.addWidget(self.hideAllButton)
+        layout.addLayout(button_layout)
+
+        self.isCheckedList = [region.checked for region in REGIONS]
+
+        self.setLayout(layout)
+
+    def set_all_checked(self, checked):
+        for checkBox in self.checkBoxes:
+            checkBox.setChecked(checked)
+
+    def get_checked_state(self):
+        for ti, checkBox in enumerate(self.checkBoxes):
+            self.isCheckedList[ti] = checkBox.isChecked()
+
+
+class SectionPanel(QtWidgets.QWidget):
+    """ 2D view of where the section plane of a brainView cuts the shown
+    regions, with controls for the plane """
+    def __init__(self, brv, parent=None):
+        super(SectionPanel, self).__init__(parent)
+
+        self.brv = brv
+        layout = QtWidgets.QVBoxLayout()
+
+        self.showBox = QtWidgets.QCheckBox("Section (shift-drag to move)")
+        self.showBox.toggled.connect(self.show_toggled)
+        layout.addWidget(self.showBox)
+
+        self.axisBox = QtWidgets.QComboBox()
+        self.axisBox.addItems(["x axis", "y axis", "z axis"])
+        self.axisBox.currentIndexChanged.connect(self.axis_changed)
+        layout.addWidget(self.axisBox)
+
+        self.slider = QtWidgets.QSlider(QtCore.Qt.Horizontal)
+        self.slider.valueChanged.connect(
+            lambda value: self.brv.set_section(position=value))
+        layout.addWidget(self.slider)
+
+        self.plot = pg.PlotWidget()
+        self.plot.setAspectLocked(True)
+        layout.addWidget(self.plot, stretch=1)
+        # one curve of segments per region, made when first cut
+        self.curves = {}
+
+        self.setLayout(layout)
+
+        self.brv.sectionChanged.connect(self.section_changed)
+        self.section_changed(self.brv.section_axis, self.brv.section_position)
+
+    def show_toggled(self, checked):
+        self.brv.set_section(visible=checked)
+
+    def axis_changed(self, axis):
+        # start from the middle of the brain along the new axis
+        lo, hi = self.brv.section_bounds
+        self.brv.set_section(axis=axis, position=(lo[axis] + hi[axis])/2)
+
+    def section_changed(self, axis, position):
+        lo, hi = self.brv.section_bounds
+        for widget in (self.axisBox, self.slider):
+            widget.blockSignals(True)
+        self.axisBox.setCurrentIndex(axis)
+        self.slider.setRange(int(np.floor(lo[axis])), int(np.ceil(hi[axis])))
+        self.slider.setValue(int(round(position)))
+        for widget in (self.axisBox, self.slider):
+            widget.blockSignals(False)
+
+        self.update_contours()
+
+    def update_contours(self):
+        """ redraw the cross-sections of the shown regions """
+        contours = []
+        if self.showBox.isChecked():
+            contours = self.brv.section_contours()
+
+        tu, tv = [ti for ti in range(3) if ti != self.brv.section_axis]
+        drawn = set()
+        for name, segments in contours:
+            if name not in self.curves:
+                color = QtGui.QColor.fromRgbF(
+                    *self.brv.registry.regions[name].color[:3])
+                self.curves[name] = pg.PlotCurveItem(pen=pg.mkPen(color))
+                self.plot.addItem(self.curves[name])
+            self.curves[name].setData(segments[:, :, tu].ravel(),
+                                      segments[:, :, tv].ravel(),
+                                      connect='pairs')
+            drawn.add(name)
+
+        for name, curve in self.curves.items():
+            curve.setVisible(name in drawn)
+
+
+class Settings(QtWidgets.QWidget):
+    """ main settings class """
+    def __init__(self, parent=None):
+        super(Settings, self).__init__(parent)
+
+        layout = QtWidgets.QVBoxLayout()
+
+        self.brc = BrainRegionChooser()
+
+        layout.addWidget(self.brc)
+        layout.addStretch(1)
+
+        self.setLayout(layout)
+
+
+class MainWindow(QtWidgets.QMainWindow):
+    """ main class for ZFBrain """
+    def __init__(self, preload=False, batched=True, stats=None):
+        super(MainWindow, self).__init__()
+
+        self.setWindowTitle('ZFBrain')
+        self.resize(1000, 600)
+        self.setWindowIcon(QtGui.QIcon(resource_path("images/zfbrain_logo_small.png")))
+
+        main_layout = QtWidgets.QHBoxLayout()
+
+        self.brv = brainView(preload=preload, batched=batched, stats=stats)
+        self.sl = Settings()
+        self.section = SectionPanel(self.brv)
+
+        side_layout = QtWidgets.QVBoxLayout()
+        side_layout.addWidget(self.sl)
+        side_layout.addWidget(self.section, stretch=1)
+
+        main_layout.addWidget(self.brv, stretch=4)
+        main_layout.addLayout(side_layout, stretch=1)
+
+        # checkboxes
+        self._redraw_timer = QtCore.QTimer(self)
+        self._redraw_timer.setSingleShot(True)
+        self._redraw_timer.setInterval(0)
+        self._redraw_timer.timeout.connect(self.redraw)
+        for checkBox in self.sl.brc.checkBoxes:
+            checkBox.toggled.connect(self.something_toggled)
+
+        main_widget = QtWidgets.QWidget()
+        main_widget.setLayout(main_layout)
+        self.setCentralWidget(main_widget)
+
+        # picking
+        self.brv.hovered.connect(self.show_pick)
+        self.brv.clicked.connect(self.show_pick)
+
+    def something_toggled(self):
+        # toggles arriving together (e.g. from "Show all") are handled
+        # once, after all of them
+        self._redraw_timer.start()
+
+    def pick_text(self, pick):
+        region = self.brv.registry.regions[pick.name]
+        return (f"{region.label}: ({pick.point[0]:.1f}, {pick.point[1]:.1f}, "
+                f"{pick.point[2]:.1f}) um, nearest vertex {pick.vertex} "
+                f"({pick.vertex_point[0]:.1f}, {pick.vertex_point[1]:.1f}, "
+                f"{pick.vertex_point[2]:.1f})")
+
+    def show_pick(self, pick):
+        if pick is None:
+            self.statusBar().clearMessage()
+        else:
+            self.statusBar().showMessage(self.pick_text(pick))
+
+    def redraw(self):
+        # get isCheckedArray
+        self.sl.brc.get_checked_state()
+
+        # show and hide regions
+        self.brv.redraw_surfaces(self.sl.brc.isCheckedList)
+        self.section.update_contours()
+
+
+def view(qt_args=(), preload=False, batched=True, stats=False,
+         stats_out=None):
+    # a file the stats cannot be written to would only fail on exit
+    if stats_out:
+        check_stats_file(stats_out)
+
+    app = QtWidgets.QApplication([sys.argv[0], *qt_args])
+    app.setApplicationName('ZFBrain')
+
+    frame_stats = FrameStats() if stats or stats_out else None
+    window = MainWindow(preload=preload, batched=batched, stats=frame_stats)
+    window.show()
+
+    status = app.exec_()
+    if stats_out:
+        frame_stats.write(stats_out)
+        print(f"Output file {stats_out}")
+    sys.exit(status)
+
+
+def write_image(image, file_name):
+    """ write `image`, as returned by brainView.renderToArray, to
+    `file_name` (format from the extension) """
+    height, width = image.shape[:2]
+    # BGRA bytes are a 32-bit 0xAARRGGBB word on little-endian machines;
+    # the alpha of the framebuffer is ignored
+    qimage = QtGui.QImage(image.data, width, height, 4*width,
+                          QtGui.QImage.Format_RGB32)
+    if not qimage.save(file_name):
+        raise OSError(f"could not write {file_name}")
+    return file_name
+
+
+def render(job_file, out_dir="", workers=None, batched=True, qt_args=()):
+    """ render the frames of the job file `job_file` (see
+    zfbrain.render_jobs) offscreen and write them to `out_dir`
+
+    The scene is the one of brainView, drawn into a framebuffer object.
+    Images are written by a pool of `workers` threads while the next frames
+    render. Needs an OpenGL context, which can be software GL or Xvfb. """
+    from concurrent.futures import ThreadPoolExecutor
+
+    job = read_job(job_file, out_dir)
+    names = [region.name for region in REGIONS]
+    unknown = {name for frame in job.frames for name in frame.regions
+               if name not in names}
+    if unknown:
+        raise ValueError(f"unknown regions in {job_file}: "
+                         f"{', '.join(sorted(unknown))}")
+    if not job.frames:
+        print(f"No frames to render in {job_file}")
+        return
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+
+    app = QtWidgets.QApplication([sys.argv[0], *qt_args])
+    app.setApplicationName('ZFBrain')
+
+    # a widget that is never on screen still gets a GL context
+    brv = brainView(batched=batched)
+    brv.setAttribute(QtCore.Qt.WA_DontShowOnScreen)
+    brv.resize(*job.size)
+    brv.show()
+    app.processEvents()
+    if not brv.isValid():
+        raise RuntimeError("could not create an OpenGL context, try "
+                           "software GL or running under Xvfb")
+
+    # bound the images waiting to be written, should writing fall behind
+    pending = collections.deque()
+    shown = None
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for frame in job.frames:
+            if frame.regions != shown:
+                brv.redraw_surfaces([name in frame.regions
+                                     for name in names])
+                shown = frame.regions
+            brv.setCameraPosition(**frame.camera)
+            brv.update_lods()
+            image = brv.renderToArray(job.size)
+
+            pending.append(pool.submit(write_image, image, frame.file_name))
+            while len(pending) > 2*workers:
+                pending.popleft().result()
+        render_time = time.perf_counter() - start
+        for future in pending:
+            future.result()
+    total_time = time.perf_counter() - start
+
+    n_frames = len(job.frames)
+    print(f"Rendered {n_frames} frames of {job.size[0]}x{job.size[1]} "
+          f"in {render_time:.2f} s ({n_frames/render_time:.1f} fps), "
+          f"written in {total_time:.2f} s ({n_frames/total_time:.1f} fps)")
@@ -0,0 +1,163 @@
+"""
+.. module:: instrumentation
+   :synopsis: collects frame and draw timings of the viewer.
+
+This module is headless: brainView feeds a FrameStats with its timings
+when instrumentation is turned on, and FrameStats keeps, summarizes and
+exports them.
+"""
+
+import collections
+import os
+import time
+
+import numpy as np
+
+# number of frames kept, and bin edges (ms) of the frame time histogram
+FRAME_HISTORY = 1000
+HISTOGRAM_EDGES_MS = (0, 4, 8, 12, 16.7, 25, 33.3, 50, 100, np.inf)
+# file extensions FrameStats.write exports to
+STATS_FORMATS = (".json", ".csv")
+
+
+def check_stats_file(file_name):
+    """ raise ValueError unless FrameStats.write can export to `file_name`,
+    so that a bad name is caught before any frames are recorded """
+    ext = os.path.splitext(file_name)[1].lower()
+    if ext not in STATS_FORMATS:
+        raise ValueError(f"cannot export frame stats as {ext!r}, "
+                         f"use .json or .csv")
+    return file_name
+
+
+class FrameStats(object):
+    """ frame times, per-item draw times and per-region sizes of a view
+
+    Each frame is recorded as its start time, its paint time and the time
+    spent drawing each item during it. Only the last `history` frames are
+    kept. """
+    def __init__(self, history=FRAME_HISTORY):
+        self.frames = collections.deque(maxlen=history)
+        # name -> dict(triangles=..., gpu_bytes=...) of each region
+        self.regions = {}
+        self._items = {}
+
+    def add_item(self, name, seconds):
+        """ record that item `name` took `seconds` to draw in this frame """
+        self._items[name] = self._items.get(name, 0) + seconds
+
+    def add_frame(self, start, seconds):
+        """ record a frame that started at time `start` (time.perf_counter)
+        and took `seconds` to paint, with the items drawn since the last """
+        self.frames.append((start, seconds, self._items))
+        self._items = {}
+
+    def set_region(self, name, triangles, gpu_bytes):
+        """ record the triangles drawn and the GPU buffer bytes of region
+        `name` """
+        self.regions[name] = dict(triangles=int(triangles),
+                                  gpu_bytes=int(gpu_bytes))
+
+    def frame_times(self):
+        """ paint times of the kept frames, in ms """
+        return np.array([seconds for _, seconds, _ in self.frames])*1000
+
+    def fps(self, window=1.0):
+        """ frames started in the last `window` seconds, per second """
+        now = time.perf_counter()
+        recent = sum(1 for start, _, _ in self.frames if now - start <= window)
+        return recent/window
+
+    def histogram(self):
+        """ counts of frame times in the bins of HISTOGRAM_EDGES_MS """
+        counts, _ = np.histogram(self.frame_times(), bins=HISTOGRAM_EDGES_MS)
+        return counts
+
+    def item_names(self):
+        """ names of all items drawn in the kept frames, in order of first
+        appearance """
+        names = {}
+        for _, _, items in self.frames:
+            names.update(dict.fromkeys(items))
+        return list(names)
+
+    def summary(self):
+        """ summary of the kept frames as a dict of plain Python values """
+        times = self.frame_times()
+        item_ms = {}
+        for name in self.item_names():
+            drawn = [items[name] for _, _, items in self.frames
+                     if name in items]
+            item_ms[name] = 1000*float(np.mean(drawn))
+
+        summary = dict(frames=len(times), fps=self.fps(), item_ms=item_ms,
+                       regions=dict(self.regions),
+                       histogram=dict(edges_ms=list(HISTOGRAM_EDGES_MS[:-1]),
+                                      counts=self.histogram().tolist()))
+        if len(times):
+            summary.update(mean_ms=float(times.mean()),
+                           median_ms=float(np.median(times)),
+                           p95_ms=float(np.percentile(times, 95)),
+                           max_ms=float(times.max()))
+        return summary
+
+    def overlay_text(self):
+        """ a few lines of text summarizing the kept frames """
+        summary = self.summary()
+        lines = [f"{summary['fps']:.0f} fps, {summary['frames']} frames"]
+        if summary['frames']:
+            lines.append(f"paint {summary['median_ms']:.2f} ms median, "
+                         f"{summary['p95_ms']:.2f} ms p95")
+
+        # histogram of frame times, one bar per bin
+        counts = summary['histogram']['counts']
+        top = max(max(counts), 1)
+        edges = HISTOGRAM_EDGES_MS
+        for lo, hi, count in zip(edges[:-1], edges[1:], counts):
+            label = f"<{hi:g}" if np.isfinite(hi) else f">{lo:g}"
+            lines.append(f"{label:>6} ms {'#'*int(round(20*count/top)):<20} "
+                         f"{count}")
+
+        for name, ms in summary['item_ms'].items():
+            lines.append(f"{name}: {ms:.3f} ms")
+        for name, region in summary['regions'].items():
+            lines.append(f"{name}: {region['triangles']} tris, "
+                         f"{region['gpu_bytes']/1024:.0f} KiB")
+        return "\n".join(lines)
+
+    def write(self, file_name):
+        """ export to `file_name`: the summary and every kept frame as JSON
+        (*.json), or one row per kept frame as CSV (*.csv) """
+        check_stats_file(file_name)
+        if os.path.splitext(file_name)[1].lower() == ".json":
+            self.write_json(file_name)
+        else:
+            self.write_csv(file_name)
+
+    def write_json(self, file_name):
+        import json
+
+        data = self.summary()
+        t0 = self.frames[0][0] if self.frames else 0
+        data['frame_log'] = [dict(start_s=start - t0, paint_ms=1000*seconds,
+                                  item_ms={name: 1000*t
+                                           for name, t in items.items()})
+                             for start, seconds, items in self.frames]
+        with open(file_name, "w") as f:
+            json.dump(data, f, indent=1)
+
+    def write_csv(self, file_name):
+        import csv
+
+        names = self.item_names()
+        t0 = self.frames[0][0] if self.frames else 0
+        with open(file_name, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["frame", "start_s", "paint_ms"]
+                            + [f"{name}_ms" for name in names])
+            for ti, (start, seconds, items) in enumerate(self.frames):
+                writer.writerow([ti, f"{start - t0:.6f}",
+                                 f"{1000*seconds:.4f}"]
+                                + [f"{1000*items[name]:.4f}"
+                                   if name in items else ""
+                                   for name in names])
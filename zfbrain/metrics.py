@@ -0,0 +1,193 @@
+"""
+.. module:: metrics
+   :synopsis: volume, area, centroid and bounds of region surfaces.
+
+Metrics are computed over all faces of a surface at once, in the
+coordinates of the vertex matrix of read_surface (um), and cached next to
+the surface file as `<file>.metrics.json`. The cache is used as long as the
+size and modification time of the surface file are unchanged.
+
+This module is headless like surface_plotting:
+
+>>> from zfbrain import metrics
+>>> metrics.file_metrics("zfbrain/data/HVC_L.surf").volume
+"""
+
+import collections
+import glob
+import json
+import os
+
+import numpy as np
+
+try:
+    from zfbrain import surface_plotting as sp
+    from zfbrain.resources import resource_path, surface_path
+except ImportError:
+    # run as a script or from a PyInstaller bundle with --paths zfbrain
+    import surface_plotting as sp
+    from resources import resource_path, surface_path
+
+# suffix added to the name of a surface file for its cached metrics
+METRICS_SUFFIX = ".metrics.json"
+# bumped whenever the metrics or their cache change
+METRICS_VERSION = 1
+
+# volume is signed, positive if the faces wind counterclockwise seen from
+# outside; centroid, lo and hi are points of the vertex matrix
+Metrics = collections.namedtuple("Metrics",
+                                 ["volume", "area", "centroid", "lo", "hi"])
+
+
+def surface_metrics(verts, faces):
+    """ compute the metrics of a closed triangle mesh
+
+    Parameters
+    ----------
+    verts : ndarray(dtype=float, ndim=2)
+        Vertex matrix with shape (n, 3).
+    faces : ndarray(dtype=int, ndim=2)
+        Face indices matrix with shape (m, 3).
+
+    Returns
+    -------
+    metrics : Metrics
+        Signed volume (um^3) enclosed by the faces, their area (um^2), the
+        centroid of the enclosed volume and the bounds of the faces. A
+        surface enclosing no volume gets the area-weighted centroid of its
+        faces instead.
+    """
+    corners = np.asarray(verts, dtype=float)[faces]
+    lo, hi = corners.min(axis=(0, 1)), corners.max(axis=(0, 1))
+    # tetrahedra from a point near the surface to each face, whose signed
+    # volumes add up to the enclosed volume (the divergence theorem)
+    origin = (lo + hi)/2
+    v0, v1, v2 = (corners[:, tk] - origin for tk in range(3))
+    normals = np.cross(v1 - v0, v2 - v0)
+    tet_volumes = np.einsum('ij,ij->i', v0, normals)/6
+    areas = np.linalg.norm(normals, axis=1)/2
+
+    volume = tet_volumes.sum()
+    area = areas.sum()
+    # each tetrahedron's centroid is a quarter of its corners' sum, the
+    # origin being zero
+    if volume != 0:
+        centroid = origin + (tet_volumes @ (v0 + v1 + v2))/(4*volume)
+    elif area != 0:
+        centroid = origin + (areas @ (v0 + v1 + v2))/(3*area)
+    else:
+        centroid = origin
+    return Metrics(float(volume), float(area), centroid, lo, hi)
+
+
+def mirror_metrics(metrics, mid_z=sp.MID_Z):
+    """ get the metrics of the reflection of a surface across the midline,
+    see surface_plotting.mirror_verts
+
+    The reflection reverses the winding of the faces, and so the sign of
+    the volume. """
+    centroid, lo, hi = sp.mirror_verts(
+        np.stack((metrics.centroid, metrics.lo, metrics.hi)), mid_z=mid_z)
+    return Metrics(-metrics.volume, metrics.area, centroid,
+                   np.minimum(lo, hi), np.maximum(lo, hi))
+
+
+def metrics_path(file_name):
+    """ get the name of the cached metrics of surface file `file_name` """
+    return os.fspath(file_name) + METRICS_SUFFIX
+
+
+def _file_stamp(file_name):
+    stat = os.stat(file_name)
+    return {"version": METRICS_VERSION, "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns}
+
+
+def read_metrics(file_name):
+    """ read the cached metrics of surface file `file_name`, or None if
+    there are none or they are out of date """
+    try:
+        with open(metrics_path(file_name)) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if cached.get("stamp") != _file_stamp(file_name):
+        return None
+    return Metrics(cached["volume"], cached["area"],
+                   *(np.array(cached[key]) for key in ("centroid", "lo",
+                                                       "hi")))
+
+
+def write_metrics(file_name, metrics):
+    """ cache the metrics of surface file `file_name` next to it """
+    cached = dict(metrics._asdict(), stamp=_file_stamp(file_name))
+    for key in ("centroid", "lo", "hi"):
+        cached[key] = np.asarray(cached[key]).tolist()
+    with sp._atomic_open(metrics_path(file_name), "w") as f:
+        json.dump(cached, f, indent=1)
+
+
+def file_metrics(file_name, surface=None, write=True):
+    """ get the metrics of surface file `file_name`, from its cache if it
+    is up to date
+
+    Parameters
+    ----------
+    file_name : string
+        Surface file in either format read by read_surface.
+    surface : tuple, optional
+        (verts, faces) already read from file_name, if the metrics need
+        computing.
+    write : bool, optional
+        If False, metrics that need computing are not cached.
+
+    Returns
+    -------
+    metrics : Metrics
+        See surface_metrics. They are cached unless `write` is False or
+        the directory of file_name is read-only, as in a bundle.
+    """
+    metrics = read_metrics(file_name)
+    if metrics is not None:
+        return metrics
+
+    if surface is None:
+        surface = sp.read_surface(file_name)
+    metrics = surface_metrics(*surface)
+    if write:
+        try:
+            write_metrics(file_name, metrics)
+        except OSError:
+            pass
+    return metrics
+
+
+def print_stats(files=None):
+    """ print a table of the metrics of surface files (default: the
+    surfaces in zfbrain/data, preferring their *.surfb files)
+
+    Points and sizes are printed in *.surf coordinates, and volumes
+    without the sign given by the winding of the faces, which differs
+    between the hemispheres. """
+    if not files:
+        names = sorted({os.path.splitext(os.path.basename(path))[0]
+                        for path in glob.glob(
+                            resource_path("zfbrain/data/*.surf"))})
+        files = [surface_path(name) for name in names]
+
+    print(f"{'surface':>15} {'volume (mm^3)':>14} {'area (mm^2)':>12} "
+          f"{'centroid x y z (um)':>26} {'size x y z (um)':>22}")
+    for file_name in files:
+        try:
+            metrics = file_metrics(file_name)
+        except ValueError as err:
+            print(f"Skipping {file_name}: {err}")
+            continue
+        name = os.path.splitext(os.path.basename(file_name))[0]
+        # metrics are in vertex matrix coordinates (see sp.read_surface)
+        centroid = " ".join(f"{val:8.1f}"
+                            for val in metrics.centroid[[0, 2, 1]])
+        size = " ".join(f"{val:6.0f}"
+                        for val in (metrics.hi - metrics.lo)[[0, 2, 1]])
+        print(f"{name:>15} {abs(metrics.volume)/1e9:>14.6f} "
+              f"{metrics.area/1e6:>12.4f} {centroid:>26} {size:>22}")
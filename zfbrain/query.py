@@ -0,0 +1,319 @@
+"""
+.. module:: query
+   :synopsis: labels points with the brain region they lie in.
+
+Points are given in the coordinates of the *.surf files (um), as x, y, z
+columns. Each region is a closed surface (its slices plus the 2 caps), and
+a point lies in it if a ray from the point crosses the surface an odd
+number of times. Rays run along the x axis, across the slices, and the
+faces are binned into a grid over the y-z plane beforehand, so that each
+point is only tested against the faces of its grid cell. All points are
+tested at once, in chunks, and large inputs are spread across processes.
+
+This module is headless like surface_plotting, and can be used without Qt:
+
+>>> from zfbrain import query
+>>> labels = query.classify(points)
+"""
+
+import os
+import time
+
+import numpy as np
+
+try:
+    from zfbrain import surface_plotting as sp
+    from zfbrain.resources import surface_path
+except ImportError:
+    # run as a script or from a PyInstaller bundle with --paths zfbrain
+    import surface_plotting as sp
+    from resources import surface_path
+
+# regions a point is labelled with, the first one containing it winning,
+# so that nuclei come before the whole brain they lie in
+QUERY_REGIONS = ["HVC_L", "HVC_R", "RA_L", "RA_R", "AreaX_L", "AreaX_R",
+                 "whole_brain_L", "whole_brain_R"]
+OUTSIDE = "outside"
+
+# points tested at once, and per task of the process pool
+CHUNK_SIZE = 1 << 16
+# inputs smaller than this are not worth starting processes for
+PROCESS_MIN_POINTS = 1 << 18
+# size of the grid cells of RegionIndex, relative to the typical extent of
+# a face along each axis
+CELL_SCALE = 0.25
+# the (u, v, w) axes of RegionIndex in *.surf coordinates: rays run along
+# w = x, across the slices
+RAY_AXES = [1, 2, 0]
+
+
+class RegionIndex(object):
+    """ faces of one closed surface, binned into a grid along the rays, for
+    point-in-region tests
+
+    The surface is projected along the rays onto the (u, v) plane, where
+    each face is a triangle made counter-clockwise. A point projects into
+    exactly one of the triangles a ray crosses at a point, also on shared
+    edges and vertices, by the top-left rule of rasterizers.
+
+    Each face is kept as 4 linear functions of (u, v): how far inside of
+    each of its edges a point is, and the w at which a ray crosses it. """
+    def __init__(self, verts, faces, cell_scale=CELL_SCALE):
+        # (u, v) across the rays and w along them; the columns of verts
+        # are x, z, y (see sp.read_surface)
+        uvw = np.asarray(verts, dtype=float)[:, [0, 2, 1]][:, RAY_AXES]
+        corners = uvw[np.asarray(faces, dtype=np.intp)]
+        a, b, c = corners[:, 0], corners[:, 1], corners[:, 2]
+        area = _cross2(b - a, c - a)
+
+        # faces seen edge-on are never crossed by a ray
+        keep = area != 0
+        a, b, c, area = a[keep], b[keep], c[keep], area[keep]
+        flip = area < 0
+        b, c = np.where(flip[:, None], c, b), np.where(flip[:, None], b, c)
+        self.corners = np.stack((a, b, c), axis=1)
+        area = np.abs(area)
+
+        # coefficients of u, v and 1 of each function; edge k is the one
+        # opposite corner k, its function is the barycentric weight of
+        # corner k (times the area) and is 0 on the edge
+        self.coefs = np.zeros((len(area), 4, 3))
+        self.top_left = np.zeros((len(area), 3), dtype=bool)
+        for tk in range(3):
+            q0 = self.corners[:, (tk+1) % 3]
+            edge = self.corners[:, (tk+2) % 3] - q0
+            self.coefs[:, tk] = np.stack((-edge[:, 1], edge[:, 0],
+                                          _cross2(q0[:, :2], edge[:, :2])),
+                                         axis=-1)
+            self.top_left[:, tk] = ((edge[:, 1] < 0)
+                                    | ((edge[:, 1] == 0) & (edge[:, 0] < 0)))
+            self.coefs[:, 3] += (self.coefs[:, tk]
+                                 * self.corners[:, tk, 2:3]/area[:, None])
+
+        self.lo = uvw.min(axis=0)
+        self.hi = uvw.max(axis=0)
+        self._bin_faces(cell_scale)
+
+    def _bin_faces(self, cell_scale):
+        """ sort the faces into the cells of a grid over their (u, v)
+        bounding box, each face into every cell its bounding box covers """
+        n_faces = len(self.corners)
+        uv_lo = self.corners[:, :, :2].min(axis=1)
+        uv_hi = self.corners[:, :, :2].max(axis=1)
+        extent = np.maximum(self.hi[:2] - self.lo[:2], np.finfo(float).tiny)
+        cell = cell_scale*np.median(uv_hi - uv_lo, axis=0)
+        self.shape = np.ceil(extent/np.maximum(cell, extent/n_faces))
+        self.shape = np.maximum(self.shape, 1).astype(int)
+        self.cell = extent/self.shape
+
+        first = self._cell_of(uv_lo)
+        last = self._cell_of(uv_hi)
+        width = last - first + 1
+        counts = width.prod(axis=1)
+
+        # one entry per face and cell it covers
+        face = np.repeat(np.arange(n_faces), counts)
+        offset = np.arange(counts.sum()) - np.repeat(np.cumsum(counts)
+                                                     - counts, counts)
+        cu = first[face, 0] + offset % width[face, 0]
+        cv = first[face, 1] + offset // width[face, 0]
+        cells = cv*self.shape[0] + cu
+
+        order = np.argsort(cells, kind='stable')
+        self.cell_faces = face[order]
+        self.cell_start = np.searchsorted(cells[order],
+                                          np.arange(self.shape.prod()+1))
+
+    def _cell_of(self, uv):
+        cell = np.floor((uv - self.lo[:2])/self.cell).astype(int)
+        return np.clip(cell, 0, self.shape - 1)
+
+    def contains(self, points):
+        """ test which of `points` (M, 3), in *.surf coordinates, lie inside
+        the surface
+
+        Returns
+        -------
+        inside : ndarray(dtype=bool, ndim=1)
+        """
+        points = np.asarray(points, dtype=float)[:, RAY_AXES]
+        inside = np.zeros(len(points), dtype=bool)
+
+        # only points within the bounding box can be inside
+        near = np.flatnonzero(np.all((points >= self.lo)
+                                     & (points <= self.hi), axis=1))
+        for start in range(0, len(near), CHUNK_SIZE):
+            chunk = near[start:start+CHUNK_SIZE]
+            inside[chunk] = self._parity(points[chunk])
+        return inside
+
+    def _parity(self, points):
+        """ whether a ray from each point along +w crosses the surface an
+        odd number of times """
+        cu, cv = self._cell_of(points[:, :2]).T
+        cells = cv*self.shape[0] + cu
+        counts = self.cell_start[cells+1] - self.cell_start[cells]
+
+        # one pair per point and face of its cell
+        point = np.repeat(np.arange(len(points)), counts)
+        offset = np.arange(counts.sum()) - np.repeat(np.cumsum(counts)
+                                                     - counts, counts)
+        face = self.cell_faces[np.repeat(self.cell_start[cells], counts)
+                               + offset]
+
+        p = points[point]
+        coefs = self.coefs[face]
+        values = (coefs[:, :, 0]*p[:, 0:1] + coefs[:, :, 1]*p[:, 1:2]
+                  + coefs[:, :, 2])
+        weights = values[:, :3]
+        covered = np.all((weights > 0)
+                         | ((weights == 0) & self.top_left[face]), axis=1)
+        crossed = covered & (values[:, 3] > p[:, 2])
+        return np.bincount(point[crossed], minlength=len(points)) % 2 == 1
+
+
+def _cross2(a, b):
+    """ z component of the cross products of 2D vectors (..., 2) """
+    return a[..., 0]*b[..., 1] - a[..., 1]*b[..., 0]
+
+
+def region_indices(regions=QUERY_REGIONS, data_dir=None):
+    """ read regions `regions` from `data_dir` (default: zfbrain/data) and
+    build their RegionIndex, by name """
+    paths = [surface_path(name, data_dir) for name in regions]
+    return {name: RegionIndex(verts, faces)
+            for name, (verts, faces) in zip(regions,
+                                            sp.read_surfaces(paths))}
+
+
+def contains(points, regions=QUERY_REGIONS, processes=None, indices=None,
+             data_dir=None):
+    """ test which of `points` lie in each of `regions`
+
+    Parameters
+    ----------
+    points : array_like
+        Points with shape (M, 3), in *.surf coordinates.
+    regions : list of str, optional
+        Names of the regions to test.
+    processes : int, optional
+        Number of worker processes. By default inputs of at least
+        PROCESS_MIN_POINTS points are spread across all cores, in chunks of
+        CHUNK_SIZE points, and smaller ones are tested in this process.
+    indices : dict, optional
+        RegionIndex of each region, as returned by region_indices.
+    data_dir : str, optional
+        Directory of the surface files, if `indices` are not given
+        (default: zfbrain/data).
+
+    Returns
+    -------
+    inside : ndarray(dtype=bool, ndim=2)
+        Whether each point lies in each region, with shape (M, len(regions)).
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 3)
+    if indices is None:
+        indices = region_indices(regions, data_dir)
+    indices = [indices[name] for name in regions]
+
+    if processes is None:
+        processes = os.cpu_count() if len(points) >= PROCESS_MIN_POINTS else 1
+    if processes <= 1 or len(points) <= CHUNK_SIZE:
+        return _contains(points, indices)
+
+    import concurrent.futures
+
+    chunks = [points[start:start+CHUNK_SIZE]
+              for start in range(0, len(points), CHUNK_SIZE)]
+    with concurrent.futures.ProcessPoolExecutor(
+            processes, initializer=_init_worker,
+            initargs=(indices,)) as executor:
+        return np.concatenate(list(executor.map(_contains_worker, chunks)))
+
+
+def _contains(points, indices):
+    return np.stack([index.contains(points) for index in indices], axis=1)
+
+
+# indices of the regions in each worker process, sent once per process
+_worker_indices = None
+
+
+def _init_worker(indices):
+    global _worker_indices
+    _worker_indices = indices
+
+
+def _contains_worker(points):
+    return _contains(points, _worker_indices)
+
+
+def classify(points, regions=QUERY_REGIONS, processes=None, indices=None,
+             data_dir=None):
+    """ label each of `points` with the first of `regions` it lies in, or
+    OUTSIDE if none
+
+    Parameters and defaults are those of contains.
+
+    Returns
+    -------
+    labels : ndarray(dtype=str, ndim=1)
+        Label of each point.
+    """
+    inside = contains(points, regions, processes=processes, indices=indices,
+                      data_dir=data_dir)
+    names = np.array(list(regions) + [OUTSIDE])
+    # index of the first region containing each point, or of OUTSIDE
+    first = np.where(inside.any(axis=1), inside.argmax(axis=1), len(regions))
+    return names[first]
+
+
+def read_points(file_name):
+    """ read points from a CSV file of x, y, z columns, with or without a
+    header line """
+    with open(file_name) as f:
+        first = f.readline()
+    try:
+        [float(val) for val in first.split(",")]
+        skip = 0
+    except ValueError:
+        skip = 1
+    return np.loadtxt(file_name, delimiter=",", skiprows=skip, ndmin=2,
+                      usecols=(0, 1, 2))
+
+
+def classify_file(file_name, out_filename=None, regions=QUERY_REGIONS,
+                  processes=None, data_dir=None):
+    """ label the points of the CSV file `file_name` (see read_points) and
+    write them with their labels to `out_filename`
+
+    Prints the number of points per label and the throughput.
+
+    Returns
+    -------
+    out_filename : str
+        The CSV file written, by default `file_name` with `_labels` added.
+    """
+    if out_filename is None:
+        out_filename = os.path.splitext(file_name)[0] + "_labels.csv"
+
+    points = read_points(file_name)
+    indices = region_indices(regions, data_dir)
+    start = time.perf_counter()
+    labels = classify(points, regions, processes=processes, indices=indices)
+    elapsed = time.perf_counter() - start
+
+    with open(out_filename, "w") as f:
+        f.write("x,y,z,label\n")
+        for chunk in range(0, len(points), sp.WRITE_CHUNK_ROWS):
+            rows = zip(points[chunk:chunk+sp.WRITE_CHUNK_ROWS].tolist(),
+                       labels[chunk:chunk+sp.WRITE_CHUNK_ROWS].tolist())
+            f.write("".join(f"{x!r},{y!r},{z!r},{label}\n"
+                            for (x, y, z), label in rows))
+
+    names, counts = np.unique(labels, return_counts=True)
+    for name, count in zip(names, counts):
+        print(f"  {name}: {count}")
+    print(f"Labelled {len(points)} points in {elapsed:.3f} s "
+          f"({len(points)/max(elapsed, 1e-9):.0f} points/s)")
+    return out_filename
@@ -0,0 +1,116 @@
+"""
+.. module:: render_jobs
+   :synopsis: reads job files of batch renders into lists of frames.
+
+A job file is JSON, e.g.::
+
+    {
+     "size": [1600, 1200],
+     "format": "png",
+     "views": [
+      {"name": "nuclei",
+       "regions": [["whole_brain_L", "HVC_L"], ["whole_brain_L", "RA_L"]],
+       "cameras": [{"elevation": 20, "azimuth": 50},
+                   {"elevation": 90, "azimuth": 0, "distance": 3000}]},
+      {"name": "song_system",
+       "combinations": ["HVC_L", "RA_L", "AreaX_L"]},
+      {"name": "turntable",
+       "regions": ["whole_brain_L", "whole_brain_R", "HVC_L", "HVC_R"],
+       "turntable": 120}
+     ]
+    }
+
+Each view is rendered for every set of regions in "regions" (a list of
+names, or a list of such lists), or for every non-empty combination of the
+regions in "combinations", times every camera in "cameras". With
+"turntable", each camera is turned through 360 degrees of azimuth in that
+many frames.
+
+This module is headless, so jobs can be read and checked without Qt.
+"""
+
+import collections
+import itertools
+import os
+
+# camera of brainView at startup
+DEFAULT_CAMERA = dict(distance=2400, elevation=20, azimuth=50)
+DEFAULT_SIZE = (1600, 1200)
+IMAGE_FORMATS = ("png", "jpg", "bmp", "tif")
+
+RenderFrame = collections.namedtuple("RenderFrame",
+                                     ["file_name", "regions", "camera"])
+RenderJob = collections.namedtuple("RenderJob", ["frames", "size"])
+
+
+def read_job(file_name, out_dir=""):
+    """ read the job file `file_name` into a RenderJob
+
+    Parameters
+    ----------
+    file_name : str
+        JSON job file, see the module docstring.
+    out_dir : str
+        directory the images are written to.
+
+    Returns
+    -------
+    RenderJob
+        the frames to render, as RenderFrame(file_name, regions, camera),
+        and the (width, height) of the images.
+    """
+    import json
+
+    with open(file_name) as f:
+        job = json.load(f)
+    return expand_job(job, out_dir)
+
+
+def expand_job(job, out_dir=""):
+    """ expand the dict `job` (see read_job) into a RenderJob
+
+    Frames that show the same regions follow each other, so that the scene
+    changes as little as possible between them. """
+    size = tuple(int(s) for s in job.get("size", DEFAULT_SIZE))
+    image_format = job.get("format", "png").lower()
+    if len(size) != 2 or min(size) <= 0:
+        raise ValueError(f"invalid image size {job.get('size')!r}")
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError(f"unsupported image format {image_format!r}, "
+                         f"use one of {', '.join(IMAGE_FORMATS)}")
+
+    frames = []
+    for vi, view in enumerate(job.get("views", [])):
+        name = view.get("name", f"view{vi}")
+        cameras = [dict(DEFAULT_CAMERA, **camera)
+                   for camera in view.get("cameras", [{}])]
+        n_turn = int(view.get("turntable", 0))
+
+        for ri, regions in enumerate(_region_sets(view)):
+            for ci, camera in enumerate(cameras):
+                base = os.path.join(out_dir, f"{name}_{ri:03d}_{ci:02d}")
+                if not n_turn:
+                    frames.append(RenderFrame(f"{base}.{image_format}",
+                                              regions, camera))
+                    continue
+                for fi in range(n_turn):
+                    azimuth = camera["azimuth"] + 360*fi/n_turn
+                    frames.append(RenderFrame(
+                        f"{base}_{fi:04d}.{image_format}", regions,
+                        dict(camera, azimuth=azimuth)))
+    return RenderJob(frames, size)
+
+
+def _region_sets(view):
+    """ the sets of region names a view of a job is rendered for """
+    if "combinations" in view:
+        names = list(view["combinations"])
+        return [combination for n in range(1, len(names)+1)
+                for combination in itertools.combinations(names, n)]
+
+    regions = view.get("regions", [])
+    if not regions:
+        raise ValueError(f"view {view.get('name')!r} has no regions")
+    if isinstance(regions[0], str):
+        regions = [regions]
+    return [tuple(names) for names in regions]
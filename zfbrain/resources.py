@@ -0,0 +1,32 @@
+"""
+.. module:: resources
+   :synopsis: locates data files, both in the source tree and when bundled.
+"""
+
+import os
+import sys
+
+
+# taken from https://stackoverflow.com/questions/7674790/bundling-data-files-with-pyinstaller-onefile
+def resource_path(relative_path):
+    """ Get absolute path to resource, works for dev and for PyInstaller """
+    try:
+        # PyInstaller creates a temp folder and stores path in _MEIPASS
+        base_path = sys._MEIPASS
+    except AttributeError:
+        # the directory holding the zfbrain package, whatever the current
+        # directory is
+        base_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    return os.path.join(base_path, relative_path)
+
+
+def surface_path(name, data_dir=None):
+    """ Get path to surface `name` in `data_dir` (default: zfbrain/data),
+    preferring its binary *.surfb file """
+    if data_dir is None:
+        data_dir = resource_path("zfbrain/data")
+    binary_path = os.path.join(data_dir, f"{name}.surfb")
+    if os.path.exists(binary_path):
+        return binary_path
+    return os.path.join(data_dir, f"{name}.surf")
@@ -1,21 +1,32 @@
 """
 .. module:: surface_plotting
    :synopsis: defines functions and classes for plotting surfaces.
+
+This module is the headless core of ZFBrain and must stay cheap to import:
+SciPy and the XML parser are only imported inside the functions that
+generate surfaces, and nothing here imports Qt or OpenGL (see gui).
 """
 
+import contextlib
+import functools
+import hashlib
+import json
+import os
+import stat
+import struct
+import time
+
 import numpy as np
-from scipy import interpolate
 #from matplotlib import pyplot as plt
-import xml.etree.ElementTree as ET
 
 
-def read_surface(file_name):
+def read_surface(file_name, stream=False):
     """Reads in surface data type in the *.surf format.
 
     Note
     ----
     L is the number of slices of data, N is the number of data points
-    per slice. Each must be constant.
+    per slice. Each must be constant, except in the variable format below.
 
     A typical `*.surf` data file is given by the following:
 
@@ -33,151 +44,1012 @@ def read_surface(file_name):
 
     The total number of lines in file_name is 2+L*N
 
+    In the variable format (version 2), the second line instead holds L
+    followed by the number of data points of each slice, `L N1 N2 ... NL`,
+    and neighbouring slices are stitched together with
+    stitch_surface_faces. Files with 2 numbers on that line are read as
+    before.
+
+    Files ending in `.surfb` are read with read_surface_binary instead,
+    and files ending in `.gz` are decompressed while they are read.
+
     Parameters
     ----------
     file_name : string
         Filename for surface data.
+    stream : bool, optional
+        If True, the file is parsed one slice at a time (see
+        iter_surface_slices) straight into the preallocated vertex matrix,
+        so that peak memory stays close to the size of the output. This is
+        slower than the default single pass, and meant for very large files.
 
     Returns
     -------
     verts : ndarray(dtype=float, ndim=2)
         Vertex matrix with shape (`N`, 3). Each row represents a point in 3D,
         and each column represents the X, Y, Z coordinate.
-    faces : ndarray(dtype=int, ndim=2)
+    faces : ndarray(dtype=uint16 or uint32, ndim=2)
         Face indices matrix with shape (`N`, 3). Each row represents a face
         (triangle), and each column represents the index of the data point
-        for a vertex.
+        for a vertex. It is shared read-only between all surfaces of the
+        same L and N, see surface_faces.
 
     """
-    with open(file_name) as f:
-        lines = f.readlines()
+    if os.fspath(file_name).endswith(".surfb"):
+        verts, faces, _ = read_surface_binary(file_name)
+        return verts, faces
+
+    verts, L, N = _read_surf_verts(file_name, stream=stream)
+    if np.ndim(N) == 0:
+        faces = surface_faces(L, N)
+    else:
+        faces = stitch_surface_faces(verts, N)
 
+    return verts, faces
+
+
+def _parse_counts(line):
+    """Parses the `L N` (or `L N1 ... NL`) line of a *.surf file.
+
+    Returns L and N, where N is an int, or an ndarray of the number of data
+    points of each slice for the variable format.
+    """
+    counts = [int(val) for val in line.split()]
+    L = counts[0]
+    if len(counts) == 2:
+        return L, counts[1]
+    if len(counts) != L+1:
+        raise ValueError(f"expected L={L} slice sizes, got {len(counts)-1}")
+    return L, np.array(counts[1:], dtype=int)
+
+
+def _slice_starts(L, N):
+    """Gets the index of the first point of each slice, followed by the
+    total number of points, for constant or per-slice N."""
+    counts = np.broadcast_to(N, (L,))
+    return np.concatenate(([0], np.cumsum(counts)))
+
+
+def _open_surf(file_name):
+    """Opens an ASCII *.surf file for reading, decompressing it on the fly
+    if it is gzip-compressed (*.surf.gz)."""
+    if os.fspath(file_name).endswith(".gz"):
+        import gzip
+        return gzip.open(file_name, "rt")
+    return open(file_name)
+
+
+def _read_surf_verts(file_name, stream=False):
+    """Reads the vertex matrix, L and N of an ASCII *.surf file."""
+    if stream:
+        _, L, N = read_surface_header(file_name)
+        starts = _slice_starts(L, N)
+        verts = np.zeros((starts[-1]+2, 3), float)
+        for tl, slice_verts in enumerate(iter_surface_slices(file_name)):
+            verts[starts[tl]:starts[tl+1]] = slice_verts
+        _add_ghost_points(verts, L, N)
+
+        return verts, L, N
+
+    with _open_surf(file_name) as f:
         # read in L=number of slices, N=number of data points per slice
-        L, N = map(int, lines[1].split(' '))
+        f.readline()
+        L, N = _parse_counts(f.readline())
 
-        # generate data vertex array
-        n_vertex = L*N+2
-        n_faces = 2*N*L
-        verts = np.zeros((n_vertex, 3), float)
-        faces = np.zeros((n_faces, 3), int)
+        # load in vertices in a single pass
+        data = np.loadtxt(f, dtype=float, max_rows=_slice_starts(L, N)[-1],
+                          ndmin=2)
 
-        # load in vertices
-        for ti in range(0, (L*N)):
-            # switch y and z
-            verts[ti,0], verts[ti,2], verts[ti,1] = map(float, lines[ti+2].split(' '))
-
-        # generate last 2 ''ghost points''
-        first_gp_ind = L*N
-        last_gp_ind = L*N+1
-        for ti in range(3):
-            verts[first_gp_ind, ti] = np.mean(verts[0:N-1, ti])
-            verts[last_gp_ind, ti] = np.mean(verts[(L-1)*N:L*N, ti])
-
-        # generate edges for data in 'middle' slices
-        # for the love of god don't modify the indices here
-        for tl in range(L-1):
-            for tn in range(N):
-                ind1 = 2*(tn + tl*N)
-                ind2 = ind1 + 1
-
-                val1 = tl*N + tn
-                val2 = (tl+1)*N + (tn+1) % N
-                val3 = (tl+1)*N + tn
-                val4 = tl*N + (tn+1) % N
-
-                faces[ind1, 0] = val1
-                faces[ind1, 1] = val2
-                faces[ind1, 2] = val3
-                faces[ind2, 0] = val1
-                faces[ind2, 1] = val4
-                faces[ind2, 2] = val2
-
-        # last 2*N faces are to 'cap off' closed surface
-        # first face
-        for tn in range(N):
-            ind = 2*(L-1)*N + tn
-            faces[ind, 0] = tn
-            faces[ind, 1] = first_gp_ind
-            faces[ind, 2] = (tn+1) % N
-
-        # last face
-        for tn in range(N):
-            ind = 2*(L-1)*N + N + tn
-            faces[ind, 0] = (L-1)*N + tn
-            faces[ind, 1] = (L-1)*N + (tn + 1) % N
-            faces[ind, 2] = last_gp_ind
+    verts = _surface_verts(data, L, N)
 
-    return verts, faces
+    return verts, L, N
 
 
-def read_surface_left(file_name):
-    """Similar to read_surface(file_name) leaves right surface open.
+def read_surfaces(file_names, max_workers=None, processes=False,
+                  report=False):
+    """Reads several surface files at once through a pool of workers.
+
+    Parameters
+    ----------
+    file_names : list of string
+        Filenames for surface data, in either format read by read_surface.
+    max_workers : int, optional
+        Maximum number of workers, see `concurrent.futures`.
+    processes : bool, optional
+        If True, files are parsed in a process pool rather than a thread
+        pool. This only pays off for large ASCII files, since starting the
+        processes is slow and memory-mapped *.surfb files are copied back
+        from the workers.
+    report : bool, optional
+        If True, prints the time spent reading each file and the
+        wall-clock time of the whole load.
+
+    Returns
+    -------
+    surfaces : list of tuple
+        (verts, faces) of each file, in the order of file_names. Faces are
+        shared between surfaces of the same L and N as in read_surface.
 
-    Not currently working as expected.
     """
-    with open(file_name) as f:
-        lines = f.readlines()
+    import concurrent.futures
 
-        # read in L=number of slices, N=number of data points per slice
-        L, N = map(int, lines[1].split(' '))
+    start = time.perf_counter()
+
+    if processes:
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers)
+    else:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers)
+    with executor:
+        results = list(executor.map(_read_surface_timed, file_names))
+
+    wall_time = time.perf_counter() - start
+
+    surfaces = []
+    for verts, faces, shape, _ in results:
+        if faces is None:
+            faces = surface_faces(*shape)
+        surfaces.append((verts, faces))
+
+    if report:
+        read_time = 0
+        for file_name, (_, _, _, elapsed) in zip(file_names, results):
+            print(f"  {os.path.basename(file_name)}: {elapsed:.3f} s")
+            read_time += elapsed
+        print(f"Loaded {len(file_names)} surfaces in {wall_time:.3f} s "
+              f"wall-clock ({read_time:.3f} s read time, "
+              f"{read_time/max(wall_time, 1e-9):.1f}x)")
+
+    return surfaces
+
+
+def _read_surface_timed(file_name):
+    """Reads one surface file for read_surfaces and times it.
+
+    Returns verts, faces, (L, N) and the elapsed time. For ASCII files the
+    faces are left as None and built from (L, N) by the caller, so that
+    results from worker processes still share the cached face arrays.
+    """
+    start = time.perf_counter()
+    if os.fspath(file_name).endswith(".surfb"):
+        verts, faces = read_surface(file_name)
+        shape = None
+    else:
+        verts, L, N = _read_surf_verts(file_name)
+        faces = None
+        shape = (L, N)
+        if np.ndim(N) != 0:
+            faces = stitch_surface_faces(verts, N)
+
+    return verts, faces, shape, time.perf_counter() - start
+
+
+def read_surface_header(file_name):
+    """Reads the description, L and N from the header of a *.surf file.
+
+    Files ending in `.surfb` are read with read_surface_binary_header.
+
+    Returns
+    -------
+    description : string
+        Descriptive string of data.
+    L : int
+        Number of slices.
+    N : int or ndarray(dtype=int, ndim=1)
+        Number of data points per slice, or of each slice for the variable
+        format.
+
+    """
+    if os.fspath(file_name).endswith(".surfb"):
+        return read_surface_binary_header(file_name)
+
+    with _open_surf(file_name) as f:
+        description = f.readline().rstrip("\n")
+        L, N = _parse_counts(f.readline())
+
+    return description, L, N
+
+
+def iter_surface_slices(file_name):
+    """Yields the slices of a *.surf file one at a time.
+
+    Only one slice is held in memory at once, which keeps the cost of
+    reading a very large file proportional to a single slice rather than
+    to the whole file.
+
+    Parameters
+    ----------
+    file_name : string
+        Filename for surface data.
 
-        # generate data vertex array
-        n_vertex = L*N+2
-        n_faces = 2*N*L
-        verts = np.zeros((n_vertex, 3), float)
-        faces = np.zeros((n_faces, 3), int)
+    Yields
+    ------
+    slice_verts : ndarray(dtype=float, ndim=2)
+        The `N` points of the next slice with shape (`N`, 3), with y and z
+        switched as in the vertex matrix of read_surface.
+
+    """
+    with _open_surf(file_name) as f:
+        f.readline()
+        L, N = _parse_counts(f.readline())
+
+        for tl, n_points in enumerate(np.broadcast_to(N, (L,))):
+            data = np.loadtxt(f, dtype=float, max_rows=n_points, ndmin=2)
+            if data.shape != (n_points, 3):
+                raise ValueError(f"slice {tl} of {file_name} has shape "
+                                 f"{data.shape}, expected ({n_points}, 3)")
 
-        # load in vertices
-        for ti in range(0, (L*N)):
             # switch y and z
-            verts[ti, 0], verts[ti, 2], verts[ti, 1] = map(float, lines[ti+2].split(' '))
-
-        # generate last 2 ''ghost points''
-        first_gp_ind = L*N
-        last_gp_ind = L*N+1
-        for ti in range(3):
-            verts[first_gp_ind, ti] = np.mean(verts[0:N-1, ti])
-            verts[last_gp_ind, ti] = np.mean(verts[(L-1)*N:L*N, ti])
-
-        # generate edges for data in 'middle' slices
-        # for the love of god don't modify the indices here
-        for tl in range(L-1):
-            for tn in range(N):
-                ind1 = 2*(tn + tl*N)
-                ind2 = ind1 + 1
-
-                val1 = tl*N + tn
-                val2 = (tl+1)*N + (tn+1) % N
-                val3 = (tl+1)*N + tn
-                val4 = tl*N + (tn+1) % N
-
-                faces[ind1, 0] = val1
-                faces[ind1, 1] = val2
-                faces[ind1, 2] = val3
-                faces[ind2, 0] = val1
-                faces[ind2, 1] = val4
-                faces[ind2, 2] = val2
-
-        # last 2*N faces are to 'cap off' closed surface
-        # first face
-        for tn in range(N):
-            ind = 2*(L-1)*N + tn
-            faces[ind, 0] = tn
-            faces[ind, 1] = first_gp_ind
-            faces[ind, 2] = (tn+1) % N
-
-        # last face
-        for tn in range(N):
-            ind = 2*(L-1)*N + N + tn
-            faces[ind, 0] = (L-1)*N + tn
-            faces[ind, 1] = (L-1)*N + (tn + 1) % N
-            faces[ind, 2] = last_gp_ind
+            yield data[:, [0, 2, 1]]
+
+
+def _surface_verts(data, L, N):
+    """Builds the vertex matrix from the raw (`L*N`, 3) slice data.
+
+    The y and z columns are swapped and the 2 ''ghost points'' closing off
+    the first and last slice are appended.
+    """
+    n_points = data.shape[0]
+    verts = np.zeros((n_points+2, 3), float)
+
+    # switch y and z
+    verts[0:n_points, 0] = data[:, 0]
+    verts[0:n_points, 1] = data[:, 2]
+    verts[0:n_points, 2] = data[:, 1]
+
+    _add_ghost_points(verts, L, N)
+
+    return verts
+
+
+def _add_ghost_points(verts, L, N):
+    """Fills in the 2 ''ghost points'' at the end of the vertex matrix."""
+    starts = _slice_starts(L, N)
+
+    # generate last 2 ''ghost points''
+    first_gp_ind = starts[-1]
+    last_gp_ind = starts[-1]+1
+    for ti in range(3):
+        verts[first_gp_ind, ti] = np.mean(verts[0:starts[1]-1, ti])
+        verts[last_gp_ind, ti] = np.mean(verts[starts[-2]:starts[-1], ti])
+
+
+def _surface_faces(L, N):
+    """Builds the face indices of a closed surface of `L` slices by `N` points.
+
+    Each pair of neighbouring slices is joined by a strip of 2*N triangles,
+    and the first and last slice are capped off by fanning N triangles each
+    around the 2 ''ghost points'' at indices L*N and L*N+1.
+    """
+    first_gp_ind = L*N
+    last_gp_ind = L*N+1
+
+    # generate edges for data in 'middle' slices
+    # for the love of god don't modify the indices here
+    tl = np.arange(L-1)[:, np.newaxis]
+    tn = np.arange(N)[np.newaxis, :]
+    tn_next = (tn+1) % N
+
+    val1 = tl*N + tn
+    val2 = (tl+1)*N + tn_next
+    val3 = (tl+1)*N + tn
+    val4 = tl*N + tn_next
+
+    # faces 2*(tn + tl*N) and 2*(tn + tl*N) + 1
+    middle = np.stack((np.stack((val1, val2, val3), axis=-1),
+                       np.stack((val1, val4, val2), axis=-1)), axis=2)
+
+    # last 2*N faces are to 'cap off' closed surface
+    tn = np.arange(N)
+    tn_next = (tn+1) % N
+    first = np.stack((tn, np.full(N, first_gp_ind), tn_next), axis=-1)
+    last = np.stack(((L-1)*N + tn, (L-1)*N + tn_next,
+                     np.full(N, last_gp_ind)), axis=-1)
+
+    faces = np.concatenate((middle.reshape(-1, 3), first, last)).astype(int)
+
+    return faces
+
+
+# number of distinct (L, N) face topologies kept by surface_faces
+FACE_CACHE_SIZE = 16
+
+
+@functools.lru_cache(maxsize=FACE_CACHE_SIZE)
+def surface_faces(L, N):
+    """Gets the face indices of a closed surface of `L` slices by `N` points.
+
+    The faces depend only on L and N, so every surface of the same shape
+    shares one cached, read-only array. Its dtype is the smallest unsigned
+    integer type that can index all L*N+2 vertices.
+
+    Parameters
+    ----------
+    L : int
+        Number of slices.
+    N : int
+        Number of data points per slice.
+
+    Returns
+    -------
+    faces : ndarray(dtype=uint16 or uint32, ndim=2)
+        Read-only face indices matrix with shape (`2*N*L`, 3).
+
+    """
+    faces = _surface_faces(L, N).astype(_index_dtype(L*N+2))
+    faces.flags.writeable = False
+
+    return faces
+
+
+def _index_dtype(n_vertex):
+    """Gets the smallest unsigned integer type that indexes n_vertex."""
+    if n_vertex <= np.iinfo(np.uint16).max + 1:
+        return np.uint16
+    if n_vertex <= np.iinfo(np.uint32).max + 1:
+        return np.uint32
+    return np.uint64
+
+
+def stitch_surface_faces(verts, N):
+    """Builds the face indices of a closed surface whose slices have
+    different numbers of points.
+
+    Neighbouring slices are stitched together by walking around both at
+    once and always advancing along the slice whose next point comes first
+    by fraction of perimeter, so that rings of any sizes Na and Nb are
+    joined by a strip of Na+Nb triangles. The first and last slice are
+    capped off around the ''ghost points'' as in surface_faces.
+
+    Parameters
+    ----------
+    verts : ndarray(dtype=float, ndim=2)
+        Vertex matrix as returned by read_surface.
+    N : ndarray(dtype=int, ndim=1)
+        Number of data points of each slice.
+
+    Returns
+    -------
+    faces : ndarray(dtype=uint16 or uint32, ndim=2)
+        Face indices matrix with shape (2*sum(N), 3).
+
+    """
+    N = np.asarray(N)
+    L = len(N)
+    starts = _slice_starts(L, N)
+    first_gp_ind = starts[-1]
+    last_gp_ind = starts[-1]+1
+
+    # fraction of the perimeter at which each point of each slice sits
+    params = []
+    for tl in range(L):
+        ring = verts[starts[tl]:starts[tl+1]]
+        edges = np.linalg.norm(np.roll(ring, -1, axis=0) - ring, axis=1)
+        params.append(np.concatenate(([0], np.cumsum(edges)[:-1]))
+                      / max(edges.sum(), np.finfo(float).tiny))
+
+    strips = []
+    for tl in range(L-1):
+        a0, na = starts[tl], N[tl]
+        b0, nb = starts[tl+1], N[tl+1]
+
+        # each step advances one slice to its next point, in the order in
+        # which those points come around the perimeter
+        steps = np.concatenate((np.r_[params[tl][1:], 1.0],
+                                np.r_[params[tl+1][1:], 1.0]))
+        advance_a = np.argsort(steps, kind='stable') < na
+        ia = np.cumsum(advance_a) - advance_a
+        ib = np.cumsum(~advance_a) - ~advance_a
+
+        val_a = a0 + ia % na
+        val_a_next = a0 + (ia+1) % na
+        val_b = b0 + ib % nb
+        val_b_next = b0 + (ib+1) % nb
+
+        strips.append(np.where(advance_a[:, np.newaxis],
+                               np.stack((val_a, val_a_next, val_b), axis=-1),
+                               np.stack((val_a, val_b_next, val_b), axis=-1)))
+
+    # cap off first and last slice
+    tn = np.arange(N[0])
+    first = np.stack((tn, np.full(N[0], first_gp_ind), (tn+1) % N[0]),
+                     axis=-1)
+    tn = np.arange(N[-1])
+    last = np.stack((starts[-2] + tn, starts[-2] + (tn+1) % N[-1],
+                     np.full(N[-1], last_gp_ind)), axis=-1)
+
+    faces = np.concatenate(strips + [first, last])
+
+    return faces.astype(_index_dtype(starts[-1]+2))
+
+
+# (slice step, point step) of each level of detail built by surface_lods,
+# from full resolution down, and the fewest points kept per slice
+LOD_STEPS = ((1, 1), (1, 2), (2, 4), (2, 8))
+LOD_MIN_POINTS = 8
+
+# projected edge length (pixels) that select_lod aims for, and the
+# fraction by which it must be crossed before the level changes
+LOD_EDGE_PIXELS = 6.0
+LOD_HYSTERESIS = 0.25
+
+
+def surface_lods(verts, L, N, steps=LOD_STEPS):
+    """Builds a pyramid of coarser versions of a surface.
+
+    Each level keeps every n-th slice and every m-th point of each kept
+    slice of the structured L x N grid, as given by `steps`. The first and
+    last slice and the 2 ''ghost points'' are always kept, so that every
+    level closes off the same volume.
+
+    Parameters
+    ----------
+    verts : ndarray(dtype=float, ndim=2)
+        Vertex matrix as returned by read_surface.
+    L : int
+        Number of slices.
+    N : int or ndarray(dtype=int, ndim=1)
+        Number of data points per slice, or of each slice.
+    steps : sequence of tuple, optional
+        (slice step, point step) of each level, see LOD_STEPS.
+
+    Returns
+    -------
+    lods : list of tuple
+        (verts, faces) of each level, in the order of steps. Levels with
+        a constant number of points per slice share their faces as in
+        read_surface.
+
+    """
+    starts = _slice_starts(L, N)
+
+    lods = []
+    for slice_step, point_step in steps:
+        slices = np.unique(np.r_[np.arange(0, L, slice_step), L-1])
+        rings = []
+        for tl in slices:
+            n_points = starts[tl+1] - starts[tl]
+            step = max(1, min(point_step, n_points // LOD_MIN_POINTS))
+            rings.append(np.arange(starts[tl], starts[tl+1], step))
+        counts = np.array([len(ring) for ring in rings])
+
+        index = np.concatenate(rings + [[starts[-1], starts[-1]+1]])
+        lod_verts = np.ascontiguousarray(verts[index])
+        if np.all(counts == counts[0]):
+            lod_faces = surface_faces(len(slices), int(counts[0]))
+        else:
+            lod_faces = stitch_surface_faces(lod_verts, counts)
+        lods.append((lod_verts, lod_faces))
+
+    return lods
+
+
+def edge_length(verts, faces):
+    """Gets the typical length of the edges of the triangles `faces`.
+
+    The median is used, so that the long edges of the caps around the
+    ''ghost points'' do not dominate.
+    """
+    corners = verts[faces.astype(np.intp)]
+    edges = corners - np.roll(corners, 1, axis=1)
+    return np.median(np.sqrt((edges**2).sum(axis=-1)))
+
+
+def select_lod(edge_pixels, current, target=LOD_EDGE_PIXELS,
+               hysteresis=LOD_HYSTERESIS):
+    """Chooses the level of detail to draw a surface at.
+
+    The coarsest level whose edges are at most `target` pixels long on
+    screen is chosen. A level only becomes finer once its edges exceed
+    target by the fraction `hysteresis`, and only becomes coarser once the
+    coarser level's edges are that fraction below target, so that the
+    level does not flicker while zooming around a threshold.
+
+    Parameters
+    ----------
+    edge_pixels : sequence of float
+        Projected edge length of each level in pixels, finest first.
+    current : int
+        Level drawn now.
+
+    Returns
+    -------
+    level : int
+        Level to draw.
+
+    """
+    level = current
+    while level > 0 and edge_pixels[level] > target*(1 + hysteresis):
+        level -= 1
+    while (level+1 < len(edge_pixels)
+           and edge_pixels[level+1] < target*(1 - hysteresis)):
+        level += 1
+    return level
+
+
+def surface_normals(verts, faces):
+    """Computes the vertex normals of a triangle mesh.
+
+    Each vertex gets the sum of the normals of its faces, weighted by their
+    area, scaled to unit length. This is what pyqtgraph's MeshData computes
+    in a Python loop over the vertices, here done for all of them at once.
+
+    Parameters
+    ----------
+    verts : ndarray(dtype=float, ndim=2)
+        Vertex matrix with shape (n, 3).
+    faces : ndarray(dtype=int, ndim=2)
+        Face indices matrix with shape (m, 3).
+
+    Returns
+    -------
+    normals : ndarray(dtype=float32, ndim=2)
+        Unit vertex normals with shape (n, 3), zero for unused vertices.
+
+    """
+    faces = faces.astype(np.intp)
+    corners = verts[faces]
+    face_normals = np.cross(corners[:, 1] - corners[:, 0],
+                            corners[:, 2] - corners[:, 0])
+
+    normals = np.zeros((len(verts), 3), float)
+    for tk in range(3):
+        normals[:, tk] = sum(np.bincount(faces[:, tc],
+                                         weights=face_normals[:, tk],
+                                         minlength=len(verts))
+                             for tc in range(3))
+
+    return _unit_normals(normals)
+
+
+def grid_normals(verts, L, N):
+    """Computes the vertex normals of a surface of `L` slices by `N` points.
+
+    Gives the same normals as surface_normals with the faces of
+    surface_faces(L, N), but works on the (L, N) grid of points directly:
+    the faces of each quad between two slices, and the faces of the caps,
+    are added to their corners by shifting whole arrays, without building
+    or indexing with the faces.
+
+    Parameters
+    ----------
+    verts : ndarray(dtype=float, ndim=2)
+        Vertex matrix as returned by read_surface.
+    L : int
+        Number of slices.
+    N : int
+        Number of data points per slice.
+
+    Returns
+    -------
+    normals : ndarray(dtype=float32, ndim=2)
+        Unit vertex normals with shape (`L*N+2`, 3).
+
+    """
+    grid = np.asarray(verts[0:L*N], dtype=float).reshape(L, N, 3)
+    first_gp = np.asarray(verts[L*N], dtype=float)
+    last_gp = np.asarray(verts[L*N+1], dtype=float)
+
+    # quad (l, n) has corners a = (l, n), b = (l+1, n+1), c = (l+1, n) and
+    # d = (l, n+1), and faces (a, b, c) and (a, d, b), see surface_faces
+    a = grid[:-1]
+    c = grid[1:]
+    b = np.roll(c, -1, axis=1)
+    d = np.roll(a, -1, axis=1)
+    abc = np.cross(b - a, c - a)
+    adb = np.cross(d - a, b - a)
+
+    acc = np.zeros((L, N, 3), float)
+    acc[:-1] += abc + adb
+    acc[1:] += abc
+    acc[:-1] += np.roll(adb, 1, axis=1)
+    acc[1:] += np.roll(abc + adb, 1, axis=1)
+
+    # caps (n, first ghost point, n+1) and (n, n+1, last ghost point)
+    ring = grid[0]
+    first = np.cross(first_gp - ring, np.roll(ring, -1, axis=0) - ring)
+    acc[0] += first + np.roll(first, 1, axis=0)
+    ring = grid[-1]
+    last = np.cross(np.roll(ring, -1, axis=0) - ring, last_gp - ring)
+    acc[-1] += last + np.roll(last, 1, axis=0)
+
+    normals = np.zeros((L*N+2, 3), float)
+    normals[0:L*N] = acc.reshape(L*N, 3)
+    normals[L*N] = first.sum(axis=0)
+    normals[L*N+1] = last.sum(axis=0)
+
+    return _unit_normals(normals)
+
+
+def _unit_normals(normals):
+    """Scales normals to unit length as float32, leaving zeros alone."""
+    length = np.sqrt((normals**2).sum(axis=1, keepdims=True))
+    return (normals/np.where(length > 0, length, 1)).astype(np.float32)
+
+
+# largest fraction of the faces for which plane_section only looks at the
+# faces of the bands the plane passes through
+SECTION_BAND_FRACTION = 0.25
+
+
+def section_bands(verts, L, N):
+    """Splits the faces of a surface into bands along its slices, for
+    plane_section.
+
+    The faces of surface_faces and stitch_surface_faces come as one strip
+    per pair of neighbouring slices, followed by the 2 caps. Each of these
+    bands gets the bounding box of its vertices and its range of faces, so
+    that a plane only needs to be tested against the bands it passes
+    through.
+
+    Parameters
+    ----------
+    verts : ndarray(dtype=float, ndim=2)
+        Vertex matrix as returned by read_surface.
+    L : int
+        Number of slices.
+    N : int or ndarray(dtype=int, ndim=1)
+        Number of data points per slice, or of each slice.
+
+    Returns
+    -------
+    lo, hi : ndarray(dtype=float, ndim=2)
+        Corners of the bounding box of each band, with shape (`L+1`, 3).
+    start, stop : ndarray(dtype=int, ndim=1)
+        Range of the faces of each band.
+
+    """
+    counts = np.broadcast_to(N, (L,))
+    starts = _slice_starts(L, N)
+    points = np.asarray(verts[0:starts[-1]], dtype=float)
+    first_gp = np.asarray(verts[starts[-1]], dtype=float)
+    last_gp = np.asarray(verts[starts[-1]+1], dtype=float)
+
+    ring_lo = np.minimum.reduceat(points, starts[:-1], axis=0)
+    ring_hi = np.maximum.reduceat(points, starts[:-1], axis=0)
+    lo = np.concatenate((np.minimum(ring_lo[:-1], ring_lo[1:]),
+                         np.minimum(ring_lo[[0]], first_gp),
+                         np.minimum(ring_lo[[-1]], last_gp)))
+    hi = np.concatenate((np.maximum(ring_hi[:-1], ring_hi[1:]),
+                         np.maximum(ring_hi[[0]], first_gp),
+                         np.maximum(ring_hi[[-1]], last_gp)))
+
+    sizes = np.concatenate((counts[:-1] + counts[1:], counts[[0, -1]]))
+    stop = np.cumsum(sizes)
+    return lo, hi, stop - sizes, stop
+
+
+def plane_section(verts, faces, point, normal, bands=None):
+    """Cuts a triangle mesh with a plane.
+
+    Every face with corners on both sides of the plane contributes the
+    segment between the points where two of its edges cross it. All faces
+    are cut at once; with `bands` from section_bands, only the faces of the
+    bands whose bounding box the plane passes through are looked at.
+
+    Parameters
+    ----------
+    verts : ndarray(dtype=float, ndim=2)
+        Vertex matrix with shape (n, 3).
+    faces : ndarray(dtype=int, ndim=2)
+        Face indices matrix with shape (m, 3).
+    point : array_like
+        A point of the plane.
+    normal : array_like
+        Normal of the plane.
+    bands : tuple, optional
+        Bands of the faces as returned by section_bands.
+
+    Returns
+    -------
+    segments : ndarray(dtype=float, ndim=3)
+        Segments of the cross-section with shape (k, 2, 3), each running
+        the same way round the faces it cuts.
+
+    """
+    point = np.asarray(point, dtype=float)
+    normal = np.asarray(normal, dtype=float)
+
+    near_faces = None
+    if bands is not None:
+        lo, hi, start, stop = bands
+        near = (np.abs(((lo + hi)/2 - point) @ normal)
+                <= ((hi - lo)/2) @ np.abs(normal))
+        start, stop = start[near], stop[near]
+        sizes = stop - start
+        # when the plane runs along the slices it passes through most
+        # bands, and it is faster to look at all faces from their vertices
+        if sizes.sum() < SECTION_BAND_FRACTION*len(faces):
+            # indices of the faces of the near bands, concatenated
+            offsets = np.repeat(start - np.cumsum(sizes) + sizes, sizes)
+            near_faces = faces[offsets + np.arange(sizes.sum())]
+
+    if near_faces is None:
+        dist = (verts @ normal - point @ normal)[faces]
+    else:
+        faces = near_faces
+        dist = verts[faces] @ normal - point @ normal
+    above = dist >= 0
+    n_above = above.sum(axis=1)
+    cut = (n_above == 1) | (n_above == 2)
+    corners, dist, above = verts[faces[cut]], dist[cut], above[cut]
+
+    # the corner alone on its side of the plane, and the other two in the
+    # order of the face
+    alone = n_above[cut] == 1
+    ta = np.argmax(above == alone[:, np.newaxis], axis=1)
+    rows = np.arange(len(ta))
+    ends = []
+    for tb in ((ta+1) % 3, (ta+2) % 3):
+        da, db = dist[rows, ta], dist[rows, tb]
+        pa, pb = corners[rows, ta], corners[rows, tb]
+        ends.append(pa + (da/(da - db))[:, np.newaxis]*(pb - pa))
+
+    segments = np.where(alone[:, np.newaxis, np.newaxis],
+                        np.stack(ends, axis=1), np.stack(ends[::-1], axis=1))
+    return segments
+
+
+# header of the binary *.surfb format: magic, version, L, N, length of the
+# description, vertex and face block offsets, vertex and face dtypes.
+# Version 2 follows it with the offset and dtype of the vertex normals
+# block, which is 0 and empty if the file has no normals
+SURFB_MAGIC = b"ZFSURFB\x00"
+SURFB_VERSION = 2
+_SURFB_HEADER = struct.Struct("<8sHIIIQQ4s4s")
+_SURFB_NORMALS = struct.Struct("<Q4s")
+_SURFB_ALIGN = 64
+
+
+def _surfb_align(offset):
+    """Rounds offset up to the next multiple of _SURFB_ALIGN bytes."""
+    return -(-offset // _SURFB_ALIGN) * _SURFB_ALIGN
+
+
+def write_surfb(verts, faces, L, N, out_filename, description=" ",
+                normals=None):
+    """Writes *.surfb data file (binary format) into out_filename.surfb.
+
+    Note
+    ----
+    Unlike the ASCII `*.surf` format, the `*.surfb` format stores the final
+    `verts` and `faces` arrays returned by read_surface (including the 2
+    ''ghost points''), so that they can be memory-mapped without any
+    parsing. The file layout is:
+
+    .. code-block:: python
+        :linenos:
+
+        header (magic, version, L, N, len(description),
+                vertex offset, face offset, vertex dtype, face dtype)
+        normals header (normals offset, normals dtype)   # version 2
+        description (utf-8)
+        vertex block, (L*N+2, 3) little-endian
+        face block, (2*N*L, 3) little-endian
+        normals block, (L*N+2, 3) little-endian          # if any
+
+    All blocks start on a 64 byte boundary.
+
+    Parameters
+    ----------
+    verts : ndarray(dtype=float, ndim=2)
+        Vertex matrix as returned by read_surface.
+    faces : ndarray(dtype=int, ndim=2)
+        Face indices matrix as returned by read_surface.
+    L : int
+        Number of slices.
+    N : int
+        Number of data points per slice.
+    out_filename : string
+        Output filename, without the `.surfb` extension.
+    description : string
+        Descriptive string of data.
+    normals : ndarray(dtype=float32, ndim=2), optional
+        Vertex normals to store with the surface, see surface_normals.
+
+    """
+    if np.ndim(N) != 0:
+        raise ValueError("*.surfb does not support a variable number of "
+                         "points per slice")
+    if verts.shape != (L*N+2, 3) or faces.shape != (2*N*L, 3):
+        raise ValueError(f"verts {verts.shape} and faces {faces.shape} are "
+                         f"inconsistent with L={L}, N={N}")
+    if normals is not None and normals.shape != verts.shape:
+        raise ValueError(f"normals {normals.shape} do not match verts "
+                         f"{verts.shape}")
+
+    verts = np.ascontiguousarray(verts, dtype=verts.dtype.newbyteorder("<"))
+    faces = np.ascontiguousarray(faces, dtype=faces.dtype.newbyteorder("<"))
+    desc = description.encode("utf-8")
+
+    header_size = _SURFB_HEADER.size + _SURFB_NORMALS.size
+    vert_offset = _surfb_align(header_size + len(desc))
+    face_offset = _surfb_align(vert_offset + verts.nbytes)
+    if normals is not None:
+        normals = np.ascontiguousarray(normals, dtype="<f4")
+        normals_offset = _surfb_align(face_offset + faces.nbytes)
+        normals_dtype = normals.dtype.str.encode("ascii")
+    else:
+        normals_offset = 0
+        normals_dtype = b""
+
+    header = _SURFB_HEADER.pack(SURFB_MAGIC, SURFB_VERSION, L, N, len(desc),
+                                vert_offset, face_offset,
+                                verts.dtype.str.encode("ascii"),
+                                faces.dtype.str.encode("ascii"))
+    header += _SURFB_NORMALS.pack(normals_offset, normals_dtype)
+
+    with _atomic_open(fr"{out_filename}.surfb", "wb") as f:
+        f.write(header)
+        f.write(desc)
+        f.write(bytes(vert_offset - f.tell()))
+        f.write(verts.tobytes())
+        f.write(bytes(face_offset - f.tell()))
+        f.write(faces.tobytes())
+        if normals is not None:
+            f.write(bytes(normals_offset - f.tell()))
+            f.write(normals.tobytes())
+
+
+def _read_surfb_header(file_name):
+    """Reads the header of a *.surfb file.
+
+    Returns the description, L, N and the (offset, dtype) of the vertex,
+    face and normals blocks, the latter being (0, None) without normals.
+    """
+    with open(file_name, "rb") as f:
+        raw = f.read(_SURFB_HEADER.size)
+        if len(raw) != _SURFB_HEADER.size:
+            raise ValueError(f"{file_name} is too short to be a *.surfb file")
+        (magic, version, L, N, desc_len, vert_offset, face_offset,
+         vert_dtype, face_dtype) = _SURFB_HEADER.unpack(raw)
+        if magic != SURFB_MAGIC:
+            raise ValueError(f"{file_name} is not a *.surfb file")
+        if version > SURFB_VERSION:
+            raise ValueError(f"{file_name} has unsupported *.surfb version "
+                             f"{version}")
+        normals_offset, normals_dtype = 0, b""
+        if version >= 2:
+            normals_offset, normals_dtype = _SURFB_NORMALS.unpack(
+                f.read(_SURFB_NORMALS.size))
+        description = f.read(desc_len).decode("utf-8")
+
+    def dtype(raw_dtype):
+        # dtype strings are null-padded to 4 bytes in the header
+        raw_dtype = raw_dtype.rstrip(b"\x00")
+        return np.dtype(raw_dtype.decode("ascii")) if raw_dtype else None
+
+    return (description, L, N, (vert_offset, dtype(vert_dtype)),
+            (face_offset, dtype(face_dtype)),
+            (normals_offset, dtype(normals_dtype)))
+
+
+def read_surface_binary(file_name, with_normals=False):
+    """Reads in surface data in the *.surfb format without copying.
+
+    The vertex and face blocks are opened read-only with `np.memmap`, so
+    only the pages that are actually used get loaded from disk.
+
+    Parameters
+    ----------
+    file_name : string
+        Filename for surface data.
+    with_normals : bool, optional
+        If True, the stored vertex normals are returned as well.
+
+    Returns
+    -------
+    verts : ndarray(dtype=float, ndim=2)
+        Read-only vertex matrix with shape (`L*N+2`, 3).
+    faces : ndarray(dtype=int, ndim=2)
+        Read-only face indices matrix with shape (`2*N*L`, 3).
+    normals : ndarray(dtype=float32, ndim=2) or None
+        Only with `with_normals`: read-only vertex normals with shape
+        (`L*N+2`, 3), or None if the file has none.
+    description : string
+        Descriptive string of data.
+
+    """
+    (description, L, N, (vert_offset, vert_dtype), (face_offset, face_dtype),
+     (normals_offset, normals_dtype)) = _read_surfb_header(file_name)
+
+    verts = np.memmap(file_name, dtype=vert_dtype, mode="r",
+                      offset=vert_offset, shape=(L*N+2, 3))
+    faces = np.memmap(file_name, dtype=face_dtype, mode="r",
+                      offset=face_offset, shape=(2*N*L, 3))
+
+    if not with_normals:
+        return verts, faces, description
+
+    normals = None
+    if normals_dtype is not None:
+        normals = np.memmap(file_name, dtype=normals_dtype, mode="r",
+                            offset=normals_offset, shape=(L*N+2, 3))
+
+    return verts, faces, normals, description
+
+
+def read_surface_binary_header(file_name):
+    """Reads the description, L and N from the header of a *.surfb file."""
+    description, L, N = _read_surfb_header(file_name)[:3]
+    return description, L, N
+
+
+def convert_surf(file_name, out_filename=None):
+    """Converts an ASCII *.surf file into the binary *.surfb format.
+
+    The vertex normals are computed once here and stored in the file.
+
+    Parameters
+    ----------
+    file_name : string
+        Filename of the `*.surf` file.
+    out_filename : string, optional
+        Output filename, without the `.surfb` extension. Defaults to
+        file_name with its `.surf` extension removed.
+
+    Returns
+    -------
+    out_file : string
+        Filename of the written `*.surfb` file.
+
+    """
+    description, L, N = read_surface_header(file_name)
+    verts, faces = read_surface(file_name)
+
+    if out_filename is None:
+        out_filename = os.path.splitext(file_name)[0]
+    # (write_surfb refuses variable files)
+    normals = grid_normals(verts, L, N) if np.ndim(N) == 0 else None
+    write_surfb(verts, faces, L, N, out_filename, description=description,
+                normals=normals)
+
+    return f"{out_filename}.surfb"
+
+
+def read_surface_left(file_name):
+    """Similar to read_surface(file_name), but leaves the right surface
+    open: the cap of the last slice, which comes last in the faces, is
+    left out. Both the constant and the variable *.surf formats are read.
+    """
+    verts, L, N = _read_surf_verts(file_name)
+    if np.ndim(N) == 0:
+        faces = surface_faces(L, N)[:-N]
+    else:
+        faces = stitch_surface_faces(verts, N)[:-N[-1]]
 
     return verts, faces
 
 
-def get_interpolant(xvals, yvals, Nvals):
-    """Gets Nvals interpolant of periodic values (xvals, yvals)."""
+def get_interpolant(xvals, yvals, Nvals, max_error=None):
+    """Gets Nvals interpolant of periodic values (xvals, yvals).
+
+    If max_error is given, Nvals is not used: the number of points is
+    instead chosen adaptively, up to ADAPTIVE_MAX_POINTS, so that the
+    resampled polygon strays from the spline through (xvals, yvals) by at
+    most max_error (in the units of the coordinates, i.e. um). The points
+    are then spaced more closely where the contour curves more, see
+    _adaptive_parameters. A ValueError is raised if even
+    ADAPTIVE_MAX_POINTS points stray further.
+    """
+    from scipy import interpolate
+
+    tck = _fit_contour(xvals, yvals)
+
+    if max_error is not None:
+        xi, yi = interpolate.splev(
+            _adaptive_parameters(tck, max_error, ADAPTIVE_MAX_POINTS), tck)
+        return xi, yi
+
+    # evaluate the spline fits for Nvals evenly spaced distance values
+    xi, yi = interpolate.splev(np.linspace(0, 1, Nvals+1), tck)
+
+    return xi[0:-1], yi[0:-1]
+
+
+def _fit_contour(xvals, yvals):
+    """Fits the periodic spline through (xvals, yvals) of get_interpolant."""
+    from scipy import interpolate
+
     # append the starting x,y coordinates
     xvals = np.r_[xvals, xvals[0]]
     yvals = np.r_[yvals, yvals[0]]
@@ -187,10 +1059,116 @@ def get_interpolant(xvals, yvals, Nvals):
     # fit to pass through all the input points.
     tck, u = interpolate.splprep([xvals, yvals], s=0, per=True)
 
-    # evaluate the spline fits for Nvals evenly spaced distance values
-    xi, yi = interpolate.splev(np.linspace(0, 1, Nvals+1), tck)
+    return tck
+
+
+# bounds on the number of points per slice, and number of samples along
+# each contour used to measure its curvature, for adaptive resampling; the
+# deviation is measured between points, so there are fewer of them than
+# samples
+ADAPTIVE_MIN_POINTS = 8
+ADAPTIVE_MAX_POINTS = 1024
+ADAPTIVE_SAMPLES = 2048
+
+
+def _adaptive_parameters(tck, max_error, max_points):
+    """Chooses spline parameters of the fewest points (between
+    ADAPTIVE_MIN_POINTS and max_points) whose polygon stays within
+    max_error of the spline tck, or raises a ValueError if there are
+    none."""
+    from scipy import interpolate
+
+    u_dense = np.linspace(0, 1, ADAPTIVE_SAMPLES, endpoint=False)
+    x, y = interpolate.splev(u_dense, tck)
+    dx, dy = interpolate.splev(u_dense, tck, der=1)
+    ddx, ddy = interpolate.splev(u_dense, tck, der=2)
+
+    # a chord of length h across a curve of curvature k strays from it by
+    # about k*h**2/8, so keeping that below max_error takes a density of
+    # sqrt(k/(8*max_error)) points per unit length of the curve
+    speed = np.hypot(dx, dy)
+    curvature = np.abs(dx*ddy - dy*ddx)/np.maximum(speed**3, 1e-300)
+    density = np.sqrt(curvature/(8*max_error))*speed + 1e-9
+    cdf = np.concatenate(([0], np.cumsum(density)))/ADAPTIVE_SAMPLES
+    u_cdf = np.linspace(0, 1, ADAPTIVE_SAMPLES+1)
+
+    # place points at equal steps of the density, and add more until the
+    # measured deviation is small enough
+    n_points = int(np.clip(np.ceil(cdf[-1]), ADAPTIVE_MIN_POINTS, max_points))
+    while True:
+        u_new = np.interp(np.arange(n_points)/n_points*cdf[-1], cdf, u_cdf)
+        deviation = _max_deviation(tck, u_new, u_dense, x, y)
+        if deviation <= max_error:
+            return u_new
+        if n_points >= max_points:
+            raise ValueError(f"cannot resample a contour to within "
+                             f"{max_error:g} um in {max_points} points "
+                             f"({deviation:.3g} um)")
+        n_points = min(max_points, int(np.ceil(1.2*n_points)))
+
+
+def _max_deviation(tck, u_new, u_dense, x, y):
+    """Gets the largest distance from the spline points (x, y) at u_dense
+    to the closed polygon through the spline points at u_new."""
+    from scipy import interpolate
+
+    px, py = interpolate.splev(u_new, tck)
+
+    # segment of the polygon spanning each dense sample
+    seg = np.searchsorted(u_new, u_dense, side='right') - 1
+    nxt = (seg+1) % len(u_new)
+    ex = px[nxt] - px[seg]
+    ey = py[nxt] - py[seg]
+    t = ((x - px[seg])*ex + (y - py[seg])*ey)/np.maximum(ex**2 + ey**2, 1e-300)
+    t = np.clip(t, 0, 1)
+
+    return np.hypot(x - px[seg] - t*ex, y - py[seg] - t*ey).max()
+
+
+def get_interpolants(nodes, points, Nvals, max_error=None):
+    """Gets Nvals interpolants of many periodic contours in one call.
 
-    return xi[0:-1], yi[0:-1]
+    Parameters
+    ----------
+    nodes : ndarray(dtype=float, ndim=2)
+        Points of all contours stacked one after another, with the x and y
+        coordinates in the first 2 columns.
+    points : list of int
+        Number of points of each contour in nodes.
+    Nvals : int
+        Number of points to resample each contour to.
+    max_error : float, optional
+        If given, each contour is resampled adaptively instead, to as many
+        points as it needs, see get_interpolant.
+
+    Returns
+    -------
+    xi, yi : ndarray(dtype=float, ndim=2)
+        Resampled x and y coordinates with shape (len(points), Nvals), one
+        row per contour. With max_error, lists with one array per contour
+        are returned instead, since their lengths differ.
+
+    """
+    # start of each contour in nodes
+    offsets = np.concatenate(([0], np.cumsum(points)))
+
+    if max_error is not None:
+        xi, yi = [], []
+        for ti in range(len(points)):
+            contour = nodes[offsets[ti]:offsets[ti+1]]
+            x, y = get_interpolant(contour[:, 0], contour[:, 1], Nvals,
+                                   max_error=max_error)
+            xi.append(x)
+            yi.append(y)
+        return xi, yi
+
+    xi = np.zeros((len(points), Nvals), dtype=float)
+    yi = np.zeros((len(points), Nvals), dtype=float)
+    for ti in range(len(points)):
+        contour = nodes[offsets[ti]:offsets[ti+1]]
+        xi[ti], yi[ti] = get_interpolant(contour[:, 0], contour[:, 1], Nvals)
+
+    return xi, yi
 
 
 #def show_interpolate(xvals, yvals, Nvals):
@@ -207,27 +1185,113 @@ def get_interpolant(xvals, yvals, Nvals):
 #    plt.show()
 
 
-def write_surf(A, L, N, out_filename, description=" "):
-    """ Writes *.surf data file (ASCII format) into out_filename.surf.
-    `description` is the description, N is the number of points on each
-    slice (a constant!), L is the number of slices, and A is a N*L x 3
-    numpy array containing all data points. """
-
-    # add test that checks L, N and shape of A are consistent
-
-    file = open(fr"{out_filename}.surf", "w")
-
-    # write description
-    file.write(description + "\n")
+# number of rows of data formatted at once by write_surf
+WRITE_CHUNK_ROWS = 1 << 16
 
-    # write L (number of slice of data) N (number of data points per slice)
-    file.write(f"{L} {N}\n")
 
-    # write data
-    for row in range(A.shape[0]):
-        file.write(f"{A[row,0]} {A[row,1]} {A[row,2]}\n")
-
-    file.close()
+def write_surf(A, L, N, out_filename, description=" ", binary=False,
+               compress=False):
+    """ Writes *.surf data file (ASCII format) into out_filename.surf.
+    `description` is the description, N is the number of points on each
+    slice (a constant!, or a list with the number of points of each slice
+    for the variable format), L is the number of slices, and A is a N*L x 3
+    numpy array containing all data points.
+
+    With `binary`, the surface is written in the *.surfb format into
+    out_filename.surfb instead (see write_surfb), and with `compress` the
+    ASCII file is gzip-compressed into out_filename.surf.gz, which
+    read_surface reads as well.
+
+    The file is written under a temporary name and renamed into place once
+    complete, so that readers never see a partly written file. Returns the
+    name of the written file. """
+    if np.ndim(N) != 0 and len(N) != L:
+        raise ValueError(f"len(N) != L: expected L={L} slice sizes, "
+                         f"got {len(N)}")
+    n_points = _slice_starts(L, N)[-1]
+    if A.shape != (n_points, 3):
+        raise ValueError(f"A has shape {A.shape}, expected ({n_points}, 3) "
+                         f"for L={L}, N={N}")
+
+    if binary:
+        if compress:
+            raise ValueError("*.surfb files cannot be compressed, since "
+                             "they are memory-mapped")
+        if np.ndim(N) != 0:
+            raise ValueError("*.surfb does not support a variable number of "
+                             "points per slice")
+        verts = _surface_verts(A, L, N)
+        write_surfb(verts, surface_faces(L, N), L, N, out_filename,
+                    description=description,
+                    normals=grid_normals(verts, L, N))
+        return f"{out_filename}.surfb"
+
+    out_file = f"{out_filename}.surf.gz" if compress else f"{out_filename}.surf"
+    with _atomic_open(out_file, "wb") as raw:
+        if compress:
+            import gzip
+            file = gzip.GzipFile(filename="", mode="wb", fileobj=raw,
+                                 compresslevel=6, mtime=0)
+        else:
+            file = raw
+
+        # write description
+        header = description + "\n"
+
+        # write L (number of slice of data) N (number of data points per
+        # slice), or the number of data points of each slice for variable N
+        if np.ndim(N) == 0:
+            header += f"{L} {N}\n"
+        else:
+            header += f"{L} " + " ".join(str(n) for n in N) + "\n"
+        file.write(header.encode("utf-8"))
+
+        # write data, formatting a whole chunk of rows at once. %r of a
+        # Python float gives the same shortest repr as the f-string of
+        # each element did, so files are unchanged byte for byte
+        for start in range(0, n_points, WRITE_CHUNK_ROWS):
+            chunk = A[start:start+WRITE_CHUNK_ROWS]
+            lines = ("%r %r %r\n"*len(chunk)) % tuple(chunk.ravel().tolist())
+            file.write(lines.encode("ascii"))
+
+        if compress:
+            file.close()
+
+    return out_file
+
+
+@contextlib.contextmanager
+def _atomic_open(file_name, mode="wb"):
+    """Opens a temporary file next to file_name, which replaces file_name
+    once the block exits without error and is removed otherwise.
+
+    The file gets the mode of the file it replaces, or else 0644, rather
+    than the 0600 of temporary files, see _file_mode."""
+    import tempfile
+
+    directory, base = os.path.split(os.path.abspath(file_name))
+    fd, tmp_name = tempfile.mkstemp(prefix=f".{base}.", suffix=".tmp",
+                                    dir=directory)
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+        os.chmod(tmp_name, _file_mode(file_name))
+        os.replace(tmp_name, file_name)
+    except BaseException:
+        os.remove(tmp_name)
+        raise
+
+
+def _file_mode(file_name):
+    """Gets the permission bits of file_name, or 0o644 for a new file.
+
+    The umask is not used, since it can only be read by setting it for
+    the whole process, which races with files opened by other threads.
+    """
+    try:
+        return stat.S_IMODE(os.stat(file_name).st_mode)
+    except FileNotFoundError:
+        return 0o644
 
 
 def generate_brainexterior_surf(input_file):
@@ -244,44 +1308,17 @@ def generate_brainexterior_surf(input_file):
     N_interp = 100
 
     output_filename = "whole_brain"
-    filename = input_file
-    tree = ET.parse(filename)
-    root = tree.getroot()
-    ATTRIB = 'Dendritic extension'
-
-    # ----------------------------------------------
-    # 1. first pass, get number of slices and points
-    # ----------------------------------------------
-
-    points = []
-
-    ti = 0
-    weird_url = '{http://www.mbfbioscience.com/2007/neurolucida}'
-    contour_str = weird_url + 'contour'
-    point_str = weird_url + 'point'
-    for contour in root.iter(contour_str):
-        points.append(0)
-        for point in contour.iter(point_str):
-            points[ti] += 1
-        ti += 1
-
-    N_points = sum(points)
-    nodes = np.zeros((N_points, 3), dtype=float)
-
-    # -------------------------------
-    # 2. second pass, get actual data
-    # -------------------------------
-
-    ti = 0
-    for contour in root.iter(contour_str):
-        for point in contour.iter(point_str):
-            nodes[ti, 0] = point.attrib['x']
-            nodes[ti, 1] = point.attrib['y']
-            nodes[ti, 2] = point.attrib['z']
-            ti += 1
+
+    # -----------------------------------------
+    # 1. get data of every contour, of any name
+    # -----------------------------------------
+
+    slices = [coords for _, coords in iter_contours(input_file)]
+    points = [len(coords) for coords in slices]
+    nodes = np.concatenate(slices)
 
     # --------------------------------------------------------------
-    # 3. interpolate values so each slice has equal number of points
+    # 2. interpolate values so each slice has equal number of points
     # --------------------------------------------------------------
 
     num_slices = len(points)
@@ -289,41 +1326,29 @@ def generate_brainexterior_surf(input_file):
     num_final_slices = 2*num_slices - 1
     N_final_points = num_final_slices*N_interp
 
-    z_adj = np.zeros((num_slices*N_interp), dtype=float)
     new_nodes = np.zeros((N_final_points, 3), dtype=float)
 
-    for ti in range(num_slices):
-        ind_start = sum(points[0:ti])
-        ind_end = ind_start + points[ti]
-        xvals = nodes[ind_start:ind_end, 0]
-        yvals = nodes[ind_start:ind_end, 1]
-
-        xi, yi = get_interpolant(xvals, yvals, N_interp)
-
-        for tj in range(N_interp-1, -1, -1):
-            new_nodes[ti*N_interp + tj, 0] = xi[tj]
-            new_nodes[ti*N_interp + tj, 1] = yi[tj]
-            new_nodes[ti*N_interp + tj, 2] = DELTA_Z*ti
-            z_adj[ti*N_interp + tj] = MID_Z - DELTA_Z*ti
-
-        # uncomment this line to display slices and interpolant
-        # icc.show_interpolate(xvals, yvals, N_interp)
+    xi, yi = get_interpolants(nodes, points, N_interp)
+    start_id = num_slices*N_interp
+    new_nodes[0:start_id, 0] = xi.ravel()
+    new_nodes[0:start_id, 1] = yi.ravel()
+    new_nodes[0:start_id, 2] = np.repeat(DELTA_Z*np.arange(num_slices),
+                                         N_interp)
+    z_adj = np.repeat(MID_Z - DELTA_Z*np.arange(num_slices), N_interp)
 
     # -----------------------------
-    # 4. extend data beyond midline
+    # 3. extend data beyond midline
     # -----------------------------
 
-    start_id = num_slices*N_interp
-    tj = N_interp + 1
-    for ti in range(start_id, N_final_points):
-        old_ind = ti - tj
-        new_nodes[ti, 0] = new_nodes[old_ind, 0]
-        new_nodes[ti, 1] = new_nodes[old_ind, 1]
-        new_nodes[ti, 2] = MID_Z + z_adj[old_ind]
-        tj += 2
+    # points beyond the midline copy the first hemisphere in reverse,
+    # skipping the midline slice itself
+    old_ind = start_id - N_interp - 1 - np.arange(N_final_points - start_id)
+    new_nodes[start_id:, 0] = new_nodes[old_ind, 0]
+    new_nodes[start_id:, 1] = new_nodes[old_ind, 1]
+    new_nodes[start_id:, 2] = MID_Z + z_adj[old_ind]
 
     # --------------------------
-    # 5. write data to surf file
+    # 4. write data to surf file
     # --------------------------
 
     L = num_final_slices
@@ -334,270 +1359,303 @@ def generate_brainexterior_surf(input_file):
     print(f"Output file {output_filename}")
 
 
-def generate_brainexterior_surf_new(input_file):
-    """New function to generate 2 hemispheres of exterior surface."""
+# needs to be hard-coded right now
+DELTA_Z = 40
+MID_Z = DELTA_Z*18  # there are 18 total slices per hemisphere
 
-    # needs to be hard-coded right now
-    DELTA_Z = 40
-    MID_Z = DELTA_Z*18  # there are 18 total slices per hemisphere
-    N_interp = 100
-    OFFSET = 0*DELTA_Z
+# regions generated from the Neurolucida XML, keyed on contour name.
+# `offset` is the z position of the first slice, `N_interp` the number of
+# points per slice and `output` the base name of the _L and _R surf files.
+# An optional `max_error` (um) resamples each slice adaptively to as many
+# points as it needs instead, see get_interpolant
+REGION_TABLE = {
+    'Dendritic extension': dict(offset=0*DELTA_Z, N_interp=100,
+                                output="whole_brain"),
+    'HVC L': dict(offset=9*DELTA_Z, N_interp=100, output="HVC"),
+    'RA': dict(offset=7*DELTA_Z, N_interp=100, output="RA"),
+    'Area X': dict(offset=6*DELTA_Z, N_interp=100, output="AreaX"),
+}
 
-    output_filename = "whole_brain"
-    filename = input_file
-    tree = ET.parse(filename)
-    root = tree.getroot()
-    ATTRIB = 'Dendritic extension'
-
-    # ----------------------------------------------
-    # 1. first pass, get number of slices and points
-    # ----------------------------------------------
-
-    points = []
-
-    ti = 0
-    elID = 0
-    weird_url = '{http://www.mbfbioscience.com/2007/neurolucida}'
-    contour_str = weird_url + 'contour'
-    point_str = weird_url + 'point'
-    for contour in root.iter(contour_str):
-        if (contour.attrib['name'] == ATTRIB):
-            points.append(0)
-            for point in contour.iter(point_str):
-                points[ti] += 1
-            ti += 1
-        elID += 1
-
-    N_points = sum(points)
-    nodes = np.zeros((N_points, 3), dtype=float)
-
-    # -------------------------------
-    # 2. second pass, get actual data
-    # -------------------------------
-
-    ti = 0
-    for contour in root.iter(contour_str):
-        if (contour.attrib['name'] == ATTRIB):
-            for point in contour.iter(point_str):
-                nodes[ti, 0] = point.attrib['x']
-                nodes[ti, 1] = point.attrib['y']
-                nodes[ti, 2] = point.attrib['z']
-                ti += 1
+NEUROLUCIDA_NS = '{http://www.mbfbioscience.com/2007/neurolucida}'
 
-    # --------------------------------------------------------------
-    # 3. interpolate values so each slice has equal number of points
-    # --------------------------------------------------------------
 
-    num_slices = len(points)
-    new_nodes = np.zeros((num_slices*N_interp, 3), dtype=float)
+def iter_contours(input_file):
+    """Yields the contours of a Neurolucida XML file one at a time.
 
-    for ti in range(num_slices):
-        ind_start = sum(points[0:ti])
-        ind_end = ind_start + points[ti]
-        xvals = nodes[ind_start:ind_end, 0]
-        yvals = nodes[ind_start:ind_end, 1]
+    The file is parsed incrementally with `iterparse` and every element is
+    cleared once it has been read, so memory stays flat however large the
+    file (and its `<image>` block) is.
 
-        xi, yi = get_interpolant(xvals, yvals, N_interp)
+    Parameters
+    ----------
+    input_file : string
+        Filename of the Neurolucida XML file.
 
-        for tj in range(N_interp-1, -1, -1):
-            new_nodes[ti*N_interp + tj, 0] = xi[tj]
-            new_nodes[ti*N_interp + tj, 1] = yi[tj]
-            new_nodes[ti*N_interp + tj, 2] = DELTA_Z*ti + OFFSET
+    Yields
+    ------
+    name : string
+        Name attribute of the contour, e.g. 'HVC L'.
+    points : ndarray(dtype=float, ndim=2)
+        The x, y, z coordinates of the contour's points, with shape
+        (number of points, 3).
 
-        # uncomment this line to display slices and interpolant
-        # icc.show_interpolate(xvals, yvals, N_interp)
+    """
+    import xml.etree.ElementTree as ET
 
-    # -----------------------------------------
-    # 4. generate other hemisphere by mirroring
-    # -----------------------------------------
+    contour_str = NEUROLUCIDA_NS + 'contour'
+    point_str = NEUROLUCIDA_NS + 'point'
 
-    new_nodes_R = mirror_nodes(new_nodes, N_interp, num_slices,
-                               MID_Z, DELTA_Z, OFFSET)
+    # name of the contour being read, None outside of contours
+    name = None
+    coords = []
 
-    # --------------------------
-    # 4. write data to surf file
-    # --------------------------
+    context = ET.iterparse(input_file, events=("start", "end"))
+    _, root = next(context)
+    for event, elem in context:
+        if event == "start":
+            if elem.tag == contour_str:
+                name = elem.attrib['name']
+                coords = []
+            continue
 
-    L = num_slices
-    N = N_interp
-    left_filename = output_filename + "_L"
-    write_surf(new_nodes, L, N, left_filename,
-               description=f"This is the {left_filename}")
-    right_filename = output_filename + "_R"
-    write_surf(new_nodes_R, L, N, right_filename,
-               description=f"This is the {right_filename}")
+        if elem.tag == point_str and name is not None:
+            attrib = elem.attrib
+            coords.append((float(attrib['x']), float(attrib['y']),
+                           float(attrib['z'])))
+        elif elem.tag == contour_str:
+            yield name, np.array(coords, dtype=float).reshape(-1, 3)
+            name = None
 
-    print(f"Output file {output_filename}")
+        # drop everything read so far, except the contour being read
+        elem.clear()
+        if name is None:
+            root.clear()
 
 
-def generate_HVC_surf(input_file):
-    """Generates two HVC surf files for hemispheres."""
+def read_contours(input_file):
+    """Reads every contour of a Neurolucida XML file in a single pass.
 
-    # needs to be hard-coded right now
-    DELTA_Z = 40
-    MID_Z = DELTA_Z*18  # there are 18 total slices per hemisphere
-    N_interp = 100
-    OFFSET = 9*DELTA_Z
-
-    output_filename = "HVC"
-    filename = input_file
-    tree = ET.parse(filename)
-    root = tree.getroot()
-    ATTRIB = 'HVC L'
-
-    # ----------------------------------------------
-    # 1. first pass, get number of slices and points
-    # ----------------------------------------------
-
-    points = []
-
-    ti = 0
-    elID = 0
-    weird_url = '{http://www.mbfbioscience.com/2007/neurolucida}'
-    contour_str = weird_url + 'contour'
-    point_str = weird_url + 'point'
-    for contour in root.iter(contour_str):
-        if (contour.attrib['name'] == ATTRIB):
-            points.append(0)
-            for point in contour.iter(point_str):
-                points[ti] += 1
-            ti += 1
-        elID += 1
-
-    N_points = sum(points)
-    nodes = np.zeros((N_points, 3), dtype=float)
-
-    # -------------------------------
-    # 2. second pass, get actual data
-    # -------------------------------
-
-    ti = 0
-    for contour in root.iter(contour_str):
-        if (contour.attrib['name'] == ATTRIB):
-            for point in contour.iter(point_str):
-                nodes[ti, 0] = point.attrib['x']
-                nodes[ti, 1] = point.attrib['y']
-                nodes[ti, 2] = point.attrib['z']
-                ti += 1
+    Parameters
+    ----------
+    input_file : string
+        Filename of the Neurolucida XML file.
 
-    # --------------------------------------------------------------
-    # 3. interpolate values so each slice has equal number of points
-    # --------------------------------------------------------------
+    Returns
+    -------
+    contours : dict
+        Maps each contour name to a tuple (points, nodes), where `points`
+        lists the number of points of each contour with that name (in file
+        order) and `nodes` is a (sum(points), 3) array of their x, y, z
+        coordinates.
 
-    num_slices = len(points)
-    new_nodes = np.zeros((num_slices*N_interp, 3), dtype=float)
+    """
+    grouped = {}
+    for name, coords in iter_contours(input_file):
+        grouped.setdefault(name, []).append(coords)
 
-    for ti in range(num_slices):
-        ind_start = sum(points[0:ti])
-        ind_end = ind_start + points[ti]
-        xvals = nodes[ind_start:ind_end, 0]
-        yvals = nodes[ind_start:ind_end, 1]
+    contours = {}
+    for name, slices in grouped.items():
+        points = [len(coords) for coords in slices]
+        nodes = np.concatenate(slices)
+        contours[name] = (points, nodes)
 
-        xi, yi = get_interpolant(xvals, yvals, N_interp)
+    return contours
 
-        for tj in range(N_interp-1, -1, -1):
-            new_nodes[ti*N_interp + tj, 0] = xi[tj]
-            new_nodes[ti*N_interp + tj, 1] = yi[tj]
-            new_nodes[ti*N_interp + tj, 2] = DELTA_Z*ti + OFFSET
 
-        # uncomment this line to display slices and interpolant
-        # icc.show_interpolate(xvals, yvals, N_interp)
+def generate_surfaces(input_file, regions=None, out_dir="", cache_dir=None):
+    """Generates the _L and _R surf files of several regions at once.
 
-    # -----------------------------------------
-    # 4. generate other hemisphere by mirroring
-    # -----------------------------------------
+    The XML file is parsed a single time, however many regions are
+    generated.
 
-    new_nodes_R = mirror_nodes(new_nodes, N_interp, num_slices,
-                               MID_Z, DELTA_Z, OFFSET)
+    Parameters
+    ----------
+    input_file : string
+        Filename of the Neurolucida XML file.
+    regions : dict, optional
+        Regions to generate, in the format of REGION_TABLE (the default).
+    out_dir : string, optional
+        Directory the surf files are written to, created if needed.
+        Defaults to the current working directory.
+    cache_dir : string, optional
+        If given, the build is incremental: resampled contours are cached
+        in cache_dir under the hash of their points (see contour_hash) and
+        only contours that changed since the last build are re-fitted.
+        Regions whose contours are all unchanged are not rewritten.
 
-    # --------------------------
-    # 4. write data to surf file
-    # --------------------------
+    Returns
+    -------
+    written : list of string
+        Output names (e.g. "HVC") of the regions whose surf files were
+        written.
 
-    L = num_slices
-    N = N_interp
-    left_filename = output_filename + "_L"
-    write_surf(new_nodes, L, N, left_filename,
-               description=f"This is the {left_filename}")
-    right_filename = output_filename + "_R"
-    write_surf(new_nodes_R, L, N, right_filename,
-               description=f"This is the {right_filename}")
+    """
+    if regions is None:
+        regions = REGION_TABLE
 
-    print(f"Output file {output_filename}")
+    contours = read_contours(input_file)
+    for name in regions:
+        if name not in contours:
+            raise ValueError(f"no contours named {name!r} in {input_file}")
 
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
 
-def generate_RA_surf(input_file):
-    """Generates two RA surf files for hemispheres."""
+    if cache_dir is not None:
+        return _generate_surfaces_incremental(contours, regions, out_dir,
+                                              cache_dir)
+
+    written = []
+    for name, region in regions.items():
+        points, nodes = contours[name]
+        generate_region_surf(points, nodes, region['offset'],
+                             region['N_interp'],
+                             os.path.join(out_dir, region['output']),
+                             max_error=region.get('max_error'))
+        written.append(region['output'])
+
+    return written
+
+
+def contour_hash(name, coords, N_interp, max_error=None):
+    """Gets the hash identifying one contour resampled to N_interp points.
+
+    The hash covers the contour name, its point coordinates, N_interp and
+    max_error, so that it changes whenever the resampled contour would.
+    """
+    h = hashlib.sha1()
+    h.update(name.encode("utf-8"))
+    h.update(str(N_interp).encode("ascii"))
+    if max_error is not None:
+        h.update(f"/{max_error!r}".encode("ascii"))
+    h.update(np.ascontiguousarray(coords, dtype="<f8").tobytes())
+    return h.hexdigest()
+
+
+# manifest of an incremental build, kept in its cache_dir
+BUILD_MANIFEST = "manifest.json"
 
-    # needs to be hard-coded right now
-    DELTA_Z = 40
-    MID_Z = DELTA_Z*18  # there are 18 total slices per hemisphere
-    N_interp = 100
-    OFFSET = 7*DELTA_Z
-
-    output_filename = "RA"
-    filename = input_file
-    tree = ET.parse(filename)
-    root = tree.getroot()
-    ATTRIB = 'RA'
-
-    # ----------------------------------------------
-    # 1. first pass, get number of slices and points
-    # ----------------------------------------------
-
-    points = []
-
-    ti = 0
-    elID = 0
-    weird_url = '{http://www.mbfbioscience.com/2007/neurolucida}'
-    contour_str = weird_url + 'contour'
-    point_str = weird_url + 'point'
-    for contour in root.iter(contour_str):
-        if (contour.attrib['name'] == ATTRIB):
-            points.append(0)
-            for point in contour.iter(point_str):
-                points[ti] += 1
-            ti += 1
-        elID += 1
-
-    N_points = sum(points)
-    nodes = np.zeros((N_points, 3), dtype=float)
-
-    # -------------------------------
-    # 2. second pass, get actual data
-    # -------------------------------
-
-    ti = 0
-    for contour in root.iter(contour_str):
-        if (contour.attrib['name'] == ATTRIB):
-            for point in contour.iter(point_str):
-                nodes[ti, 0] = point.attrib['x']
-                nodes[ti, 1] = point.attrib['y']
-                nodes[ti, 2] = point.attrib['z']
-                ti += 1
 
+def _generate_surfaces_incremental(contours, regions, out_dir, cache_dir):
+    """Incremental build of generate_surfaces with a contour cache.
+
+    Each resampled contour is stored as cache_dir/<hash>.npy, and the
+    manifest records the contour hashes each region was last written
+    from.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    manifest_file = os.path.join(cache_dir, BUILD_MANIFEST)
+    try:
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+
+    new_manifest = {}
+    written = []
+    n_fitted = 0
+    for name, region in regions.items():
+        points, nodes = contours[name]
+        N_interp = region['N_interp']
+        max_error = region.get('max_error')
+        output_filename = os.path.join(out_dir, region['output'])
+
+        # ---------------------------------------------
+        # 1. resample changed contours, reuse the rest
+        # ---------------------------------------------
+
+        offsets = np.concatenate(([0], np.cumsum(points)))
+        hashes = []
+        xi, yi = [], []
+        for ti in range(len(points)):
+            coords = nodes[offsets[ti]:offsets[ti+1]]
+            key = contour_hash(name, coords, N_interp, max_error)
+            cache_file = os.path.join(cache_dir, key + ".npy")
+            try:
+                x, y = np.load(cache_file)
+            except (OSError, ValueError):
+                x, y = get_interpolant(coords[:, 0], coords[:, 1], N_interp,
+                                       max_error=max_error)
+                np.save(cache_file, np.stack((x, y)))
+                n_fitted += 1
+            xi.append(x)
+            yi.append(y)
+            hashes.append(key)
+
+        # -----------------------------------------------
+        # 2. only write regions whose output has changed
+        # -----------------------------------------------
+
+        entry = dict(contours=hashes, offset=region['offset'],
+                     N_interp=N_interp, output=output_filename)
+        if max_error is not None:
+            entry['max_error'] = max_error
+        new_manifest[name] = entry
+        up_to_date = (manifest.get(name) == entry
+                      and os.path.exists(output_filename + "_L.surf")
+                      and os.path.exists(output_filename + "_R.surf"))
+        if up_to_date:
+            continue
+
+        _write_region_surf(xi, yi, region['offset'], output_filename)
+        written.append(region['output'])
+
+    # drop cached contours that no region uses any more
+    used = {key for entry in new_manifest.values()
+            for key in entry['contours']}
+    for name, entry in manifest.items():
+        if name in new_manifest:
+            continue
+        # keep regions that were not part of this build
+        new_manifest[name] = entry
+        used.update(entry['contours'])
+    for cache_file in os.listdir(cache_dir):
+        key, ext = os.path.splitext(cache_file)
+        if ext == ".npy" and key not in used:
+            os.remove(os.path.join(cache_dir, cache_file))
+
+    with open(manifest_file, "w") as f:
+        json.dump(new_manifest, f, indent=1)
+
+    print(f"Re-fitted {n_fitted} contours, wrote {len(written)} of "
+          f"{len(regions)} regions")
+
+    return written
+
+
+def generate_region_surf(points, nodes, OFFSET, N_interp, output_filename,
+                         max_error=None):
+    """Generates two surf files for hemispheres from one region's contours.
+
+    `points` and `nodes` are as returned for the region by read_contours.
+    With `max_error`, slices are resampled adaptively (see get_interpolant)
+    and the variable format of the surf file is written.
+    """
     # --------------------------------------------------------------
     # 3. interpolate values so each slice has equal number of points
     # --------------------------------------------------------------
 
-    num_slices = len(points)
-    new_nodes = np.zeros((num_slices*N_interp, 3), dtype=float)
+    xi, yi = get_interpolants(nodes, points, N_interp, max_error=max_error)
 
-    for ti in range(num_slices):
-        ind_start = sum(points[0:ti])
-        ind_end = ind_start + points[ti]
-        xvals = nodes[ind_start:ind_end, 0]
-        yvals = nodes[ind_start:ind_end, 1]
+    _write_region_surf(xi, yi, OFFSET, output_filename)
 
-        xi, yi = get_interpolant(xvals, yvals, N_interp)
 
-        for tj in range(N_interp-1, -1, -1):
-            new_nodes[ti*N_interp + tj, 0] = xi[tj]
-            new_nodes[ti*N_interp + tj, 1] = yi[tj]
-            new_nodes[ti*N_interp + tj, 2] = DELTA_Z*ti + OFFSET
+def _write_region_surf(xi, yi, OFFSET, output_filename):
+    """Writes the _L and _R surf files of a region from its resampled
+    slices, `xi` and `yi` being as returned by get_interpolants (one
+    sequence of coordinates per slice)."""
+    num_slices = len(xi)
+    counts = np.array([len(x) for x in xi])
+    if np.all(counts == counts[0]):
+        N_interp = int(counts[0])
+    else:
+        N_interp = counts
+    new_nodes = np.zeros((counts.sum(), 3), dtype=float)
 
-        # uncomment this line to display slices and interpolant
-        # icc.show_interpolate(xvals, yvals, N_interp)
+    new_nodes[:, 0] = np.concatenate(xi)
+    new_nodes[:, 1] = np.concatenate(yi)
+    new_nodes[:, 2] = np.repeat(DELTA_Z*np.arange(num_slices) + OFFSET,
+                                N_interp)
 
     # -----------------------------------------
     # 4. generate other hemisphere by mirroring
@@ -607,121 +1665,71 @@ def generate_RA_surf(input_file):
                                MID_Z, DELTA_Z, OFFSET)
 
     # --------------------------
-    # 4. write data to surf file
+    # 5. write data to surf file
     # --------------------------
 
     L = num_slices
     N = N_interp
     left_filename = output_filename + "_L"
     write_surf(new_nodes, L, N, left_filename,
-               description=f"This is the {left_filename}")
+               description=f"This is the {os.path.basename(left_filename)}")
     right_filename = output_filename + "_R"
     write_surf(new_nodes_R, L, N, right_filename,
-               description=f"This is the {right_filename}")
+               description=f"This is the {os.path.basename(right_filename)}")
 
     print(f"Output file {output_filename}")
 
 
-def generate_X_surf(input_file):
-    """Generates two Area X surf files for hemispheres."""
-
-    # needs to be hard-coded right now
-    DELTA_Z = 40
-    MID_Z = DELTA_Z*18  # there are 18 total slices per hemisphere
-    N_interp = 100
-    OFFSET = 6*DELTA_Z
-
-    output_filename = "AreaX"
-    filename = input_file
-    tree = ET.parse(filename)
-    root = tree.getroot()
-    ATTRIB = 'Area X'
-
-    # ----------------------------------------------
-    # 1. first pass, get number of slices and points
-    # ----------------------------------------------
-
-    points = []
-
-    ti = 0
-    elID = 0
-    weird_url = '{http://www.mbfbioscience.com/2007/neurolucida}'
-    contour_str = weird_url + 'contour'
-    point_str = weird_url + 'point'
-    for contour in root.iter(contour_str):
-        if (contour.attrib['name'] == ATTRIB):
-            points.append(0)
-            for point in contour.iter(point_str):
-                points[ti] += 1
-            ti += 1
-        elID += 1
-
-    N_points = sum(points)
-    nodes = np.zeros((N_points, 3), dtype=float)
-
-    # -------------------------------
-    # 2. second pass, get actual data
-    # -------------------------------
-
-    ti = 0
-    for contour in root.iter(contour_str):
-        if (contour.attrib['name'] == ATTRIB):
-            for point in contour.iter(point_str):
-                nodes[ti, 0] = point.attrib['x']
-                nodes[ti, 1] = point.attrib['y']
-                nodes[ti, 2] = point.attrib['z']
-                ti += 1
-
-    # --------------------------------------------------------------
-    # 3. interpolate values so each slice has equal number of points
-    # --------------------------------------------------------------
+def generate_brainexterior_surf_new(input_file):
+    """New function to generate 2 hemispheres of exterior surface."""
+    generate_surfaces(input_file, regions={
+        'Dendritic extension': REGION_TABLE['Dendritic extension']})
 
-    num_slices = len(points)
-    new_nodes = np.zeros((num_slices*N_interp, 3), dtype=float)
 
-    for ti in range(num_slices):
-        ind_start = sum(points[0:ti])
-        ind_end = ind_start + points[ti]
-        xvals = nodes[ind_start:ind_end, 0]
-        yvals = nodes[ind_start:ind_end, 1]
+def generate_HVC_surf(input_file):
+    """Generates two HVC surf files for hemispheres."""
+    generate_surfaces(input_file, regions={'HVC L': REGION_TABLE['HVC L']})
 
-        xi, yi = get_interpolant(xvals, yvals, N_interp)
 
-        for tj in range(N_interp-1, -1, -1):
-            new_nodes[ti*N_interp + tj, 0] = xi[tj]
-            new_nodes[ti*N_interp + tj, 1] = yi[tj]
-            new_nodes[ti*N_interp + tj, 2] = DELTA_Z*ti + OFFSET
+def generate_RA_surf(input_file):
+    """Generates two RA surf files for hemispheres."""
+    generate_surfaces(input_file, regions={'RA': REGION_TABLE['RA']})
 
-        # uncomment this line to display slices and interpolant
-        # icc.show_interpolate(xvals, yvals, N_interp)
 
-    # -----------------------------------------
-    # 4. generate other hemisphere by mirroring
-    # -----------------------------------------
+def generate_X_surf(input_file):
+    """Generates two Area X surf files for hemispheres."""
+    generate_surfaces(input_file, regions={'Area X': REGION_TABLE['Area X']})
 
-    new_nodes_R = mirror_nodes(new_nodes, N_interp, num_slices,
-                               MID_Z, DELTA_Z, OFFSET)
 
-    # --------------------------
-    # 4. write data to surf file
-    # --------------------------
+def mirror_nodes(new_nodes, N_interp, num_slices, MID_Z, DELTA_Z, OFFSET):
+    """Generates mirror nodes across hemispheres.
 
-    L = num_slices
-    N = N_interp
-    left_filename = output_filename + "_L"
-    write_surf(new_nodes, L, N, left_filename,
-               description=f"This is the {left_filename}")
-    right_filename = output_filename + "_R"
-    write_surf(new_nodes_R, L, N, right_filename,
-               description=f"This is the {right_filename}")
+    N_interp may also be an array with the number of nodes of each slice.
+    """
+    new_nodes_R = np.copy(new_nodes)
+    # note that the mirrored z values go into new_nodes, while the copy
+    # keeps the original ones; the shipped _L/_R files depend on this
+    z = np.repeat(2*MID_Z - DELTA_Z*np.arange(num_slices) - OFFSET, N_interp)
+    new_nodes[0:len(z), 2] = z
+    return new_nodes_R
 
-    print(f"Output file {output_filename}")
 
+def mirror_verts(verts, mid_z=MID_Z):
+    """Reflects a vertex matrix across the midline between hemispheres.
 
-def mirror_nodes(new_nodes, N_interp, num_slices, MID_Z, DELTA_Z, OFFSET):
-    """Generates mirror nodes across hemispheres."""
-    new_nodes_R = np.copy(new_nodes)
-    for ti in range(num_slices):
-        for tj in range(N_interp-1, -1, -1):
-            new_nodes[ti*N_interp + tj, 2] = 2*MID_Z - DELTA_Z*ti - OFFSET
-    return new_nodes_R
+    The _R surfaces written by generate_surfaces are exactly the _L ones
+    reflected across the plane z = mid_z of the *.surf files, which is the
+    y column of the vertex matrix of read_surface.
+    """
+    mirrored = np.array(verts, dtype=float)
+    mirrored[:, 1] = 2*mid_z - mirrored[:, 1]
+    return mirrored
+
+
+def mirror_matrix(mid_z=MID_Z):
+    """Gets the 4x4 transform of mirror_verts, so that a hemisphere can be
+    drawn from the vertices of the other one."""
+    matrix = np.eye(4)
+    matrix[1, 1] = -1
+    matrix[1, 3] = 2*mid_z
+    return matrix
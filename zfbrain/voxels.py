@@ -0,0 +1,361 @@
+"""
+.. module:: voxels
+   :synopsis: voxelized atlas of the regions, for lookups by array indexing.
+
+The regions are rasterized onto one grid of cubic voxels over their
+bounding box, in the coordinates of the *.surf files (um), into
+
+* a label volume holding, for each voxel centre, 1 + the index of the first
+  region containing it, or 0 outside all of them, as query.classify does,
+* the signed distance (um) from each voxel centre to the surface of the
+  labelled volume, negative inside, so that the depth of a point below the
+  surface of the brain is minus its distance.
+
+Both are indexed [x, y, z] and saved as *.npy files in a directory per
+voxel size, in the user's cache directory rather than the package data,
+and memory-mapped when loaded:
+
+>>> from zfbrain import voxels
+>>> atlas = voxels.load_atlas(voxel_size=10)
+>>> labels = atlas.classify(points)
+
+A region is rasterized a column of voxels at a time, along x like the rays
+of query.RegionIndex: each face adds a crossing to every column whose
+centre it covers, and a voxel is inside if an odd number of crossings lies
+beyond it, which cumulative sums give for all voxels at once. Regions are
+rasterized in parallel processes. Lookups snap points to the nearest voxel
+centre, so they agree with query.classify except within half a voxel of a
+surface.
+
+This module is headless like surface_plotting; SciPy is only imported for
+building the signed distance field.
+"""
+
+import json
+import os
+import time
+
+import numpy as np
+
+try:
+    from zfbrain import metrics as mt
+    from zfbrain import query
+    from zfbrain import surface_plotting as sp
+    from zfbrain.resources import surface_path
+except ImportError:
+    # run as a script or from a PyInstaller bundle with --paths zfbrain
+    import metrics as mt
+    import query
+    import surface_plotting as sp
+    from resources import surface_path
+
+# edge of a voxel (um)
+VOXEL_SIZE = 10.0
+# voxels added around the bounding box of the regions, so that the surface
+# lies within the grid and has distances on both sides of it
+PAD_VOXELS = 2
+# (face, column) pairs tested at once while rasterizing
+PAIR_CHUNK = 1 << 20
+# bumped whenever the format of the saved atlas changes
+ATLAS_VERSION = 1
+ATLAS_MANIFEST = "atlas.json"
+
+
+class VoxelAtlas(object):
+    """ label volume and signed distance field of the regions on one grid
+
+    Parameters
+    ----------
+    labels : ndarray(dtype=uint8, ndim=3)
+        1 + index in `regions` of the region of each voxel, or 0.
+    sdf : ndarray(dtype=float32, ndim=3)
+        Signed distance (um) of each voxel centre to the labelled volume.
+    origin : array_like
+        Centre of voxel [0, 0, 0], in *.surf coordinates.
+    voxel_size : float
+        Edge of a voxel (um).
+    regions : list of str
+        Names of the labelled regions.
+    """
+    def __init__(self, labels, sdf, origin, voxel_size, regions):
+        self.labels = labels
+        self.sdf = sdf
+        self.origin = np.asarray(origin, dtype=float)
+        self.voxel_size = float(voxel_size)
+        self.regions = list(regions)
+
+    def voxel_of(self, points):
+        """ get the voxel (M, 3) nearest to each of `points` (M, 3), and
+        whether it lies in the grid """
+        points = np.asarray(points, dtype=float).reshape(-1, 3)
+        voxel = np.rint((points - self.origin)/self.voxel_size)
+        within = np.all((voxel >= 0) & (voxel < self.labels.shape), axis=1)
+        voxel = np.where(within[:, None], voxel, 0).astype(np.intp)
+        return voxel, within
+
+    def label_indices(self, points):
+        """ get the label of each of `points`, 0 for outside """
+        voxel, within = self.voxel_of(points)
+        return np.where(within, self.labels[tuple(voxel.T)], 0)
+
+    def classify(self, points):
+        """ label each of `points` (M, 3), in *.surf coordinates, with the
+        name of its region or query.OUTSIDE, see query.classify """
+        names = np.array([query.OUTSIDE] + self.regions)
+        return names[self.label_indices(points)]
+
+    def signed_distance(self, points):
+        """ get the signed distance (um) of each of `points` to the surface
+        of the labelled volume, negative inside, or nan off the grid """
+        voxel, within = self.voxel_of(points)
+        return np.where(within, self.sdf[tuple(voxel.T)], np.nan)
+
+
+def atlas_dir(voxel_size=VOXEL_SIZE):
+    """ get the directory of the atlas of `voxel_size`, in
+    $XDG_CACHE_HOME/zfbrain (default: ~/.cache/zfbrain) """
+    cache_dir = (os.environ.get("XDG_CACHE_HOME")
+                 or os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(cache_dir, "zfbrain", f"atlas_{voxel_size:g}um")
+
+
+def atlas_grid(regions, voxel_size=VOXEL_SIZE, pad=PAD_VOXELS,
+               data_dir=None):
+    """ get the origin and shape of the grid over `regions`, from their
+    cached metrics if they are up to date, without writing any """
+    bounds = []
+    for name in regions:
+        path = surface_path(name, data_dir)
+        metrics = mt.read_metrics(path)
+        if metrics is None:
+            metrics = mt.surface_metrics(*sp.read_surface(path))
+        bounds.append(metrics)
+    # metrics are in vertex matrix coordinates (see sp.read_surface)
+    lo = np.min([m.lo for m in bounds], axis=0)[[0, 2, 1]]
+    hi = np.max([m.hi for m in bounds], axis=0)[[0, 2, 1]]
+    origin = lo - pad*voxel_size
+    shape = np.ceil((hi - origin)/voxel_size).astype(int) + pad + 1
+    return origin, tuple(shape.tolist())
+
+
+def rasterize(verts, faces, origin, voxel_size, shape):
+    """ test which voxel centres of a grid lie inside a closed surface
+
+    Parameters
+    ----------
+    verts, faces : ndarray
+        Surface as returned by sp.read_surface.
+    origin : array_like
+        Centre of voxel [0, 0, 0], in *.surf coordinates.
+    voxel_size : float
+        Edge of a voxel (um).
+    shape : tuple of int
+        Number of voxels along x, y and z.
+
+    Returns
+    -------
+    inside : ndarray(dtype=bool, ndim=3)
+        Whether each voxel centre lies inside, with shape `shape`.
+    """
+    # the faces in the (u, v, w) = (y, z, x) axes of query, with the rule
+    # deciding which face a ray through a shared edge crosses
+    index = query.RegionIndex(verts, faces)
+    axes = query.RAY_AXES
+    o_uvw = np.asarray(origin, dtype=float)[axes]
+    n_u, n_v, n_w = np.asarray(shape)[axes]
+
+    # columns whose centre may lie in the (u, v) box of each face, one
+    # more on each side so that rounding cannot drop a column on its edge
+    uv = index.corners[:, :, :2]
+    first = np.floor((uv.min(axis=1) - o_uvw[:2])/voxel_size).astype(int)
+    last = np.ceil((uv.max(axis=1) - o_uvw[:2])/voxel_size).astype(int)
+    first = np.maximum(first, 0)
+    last = np.minimum(last, [n_u - 1, n_v - 1])
+    width = np.maximum(last - first + 1, 0)
+    counts = width.prod(axis=1)
+
+    # crossings per column, at the number of voxels before them along w
+    crossings = np.zeros((n_w + 1)*n_u*n_v, dtype=np.uint8)
+    chunk_start = np.searchsorted(np.cumsum(counts),
+                                  np.arange(0, counts.sum(), PAIR_CHUNK),
+                                  side='right')
+    chunk_start = np.unique(np.r_[0, chunk_start, len(counts)])
+    for f0, f1 in zip(chunk_start[:-1], chunk_start[1:]):
+        c = counts[f0:f1]
+        face = f0 + np.repeat(np.arange(f1 - f0), c)
+        offset = np.arange(c.sum()) - np.repeat(np.cumsum(c) - c, c)
+        cu = first[face, 0] + offset % width[face, 0]
+        cv = first[face, 1] + offset // width[face, 0]
+        u = o_uvw[0] + cu*voxel_size
+        v = o_uvw[1] + cv*voxel_size
+
+        coefs = index.coefs[face]
+        values = (coefs[:, :, 0]*u[:, None] + coefs[:, :, 1]*v[:, None]
+                  + coefs[:, :, 2])
+        weights = values[:, :3]
+        covered = np.all((weights > 0)
+                         | ((weights == 0) & index.top_left[face]), axis=1)
+        w = values[covered, 3]
+        # voxels k with o + k*h < w are crossed beyond their centre
+        before = np.clip(np.ceil((w - o_uvw[2])/voxel_size), 0, n_w)
+        cells = ((before.astype(np.intp)*n_u + cu[covered])*n_v
+                 + cv[covered])
+        np.bitwise_xor.at(crossings, cells, 1)
+
+    # voxel k is inside if the crossings at k+1, k+2, ... are odd
+    crossings = crossings.reshape(n_w + 1, n_u, n_v)
+    # (w, u, v) is (x, y, z), the order of the grid
+    inside = np.bitwise_xor.accumulate(crossings[::-1], axis=0)[::-1][1:]
+    return inside.astype(bool)
+
+
+def signed_distance_field(inside, voxel_size):
+    """ get the signed distance (um) of each voxel centre to the surface
+    of the voxels `inside`, negative inside
+
+    The surface is taken to lie halfway between the centres of voxels on
+    either side of it, so this is accurate to about half a voxel. The
+    voxels next to the surface on both sides are found first, so that
+    one distance transform covers both signs. """
+    from scipy import ndimage
+
+    near = np.zeros_like(inside)
+    for axis in range(3):
+        differs = np.diff(inside, axis=axis)
+        lower = [slice(None)]*3
+        lower[axis] = slice(None, -1)
+        upper = [slice(None)]*3
+        upper[axis] = slice(1, None)
+        near[tuple(lower)] |= differs
+        near[tuple(upper)] |= differs
+
+    distance = ndimage.distance_transform_edt(~near, sampling=voxel_size)
+    distance += voxel_size/2
+    return np.where(inside, -distance, distance).astype(np.float32)
+
+
+def _rasterize_region(path, origin, voxel_size, shape):
+    """ rasterize the surface file `path`, packed into bits for sending
+    between processes """
+    verts, faces = sp.read_surface(path)
+    return np.packbits(rasterize(verts, faces, origin, voxel_size, shape))
+
+
+def _file_stamp(path):
+    stat = os.stat(path)
+    return [path, stat.st_size, stat.st_mtime_ns]
+
+
+def build_atlas(voxel_size=VOXEL_SIZE, regions=query.QUERY_REGIONS,
+                out_dir=None, processes=None, report=False, data_dir=None):
+    """ rasterize `regions` into a VoxelAtlas and save it
+
+    Parameters
+    ----------
+    voxel_size : float, optional
+        Edge of a voxel (um).
+    regions : list of str, optional
+        Names of the regions to label, the first containing a voxel
+        labelling it.
+    out_dir : str, optional
+        Directory to save the atlas to, by default atlas_dir(voxel_size).
+    processes : int, optional
+        Number of worker processes rasterizing regions, by default one per
+        CPU. With 1, all regions are rasterized in this process.
+    report : bool, optional
+        If True, prints the time spent in each step.
+    data_dir : str, optional
+        Directory of the surface files (default: zfbrain/data).
+
+    Returns
+    -------
+    atlas : VoxelAtlas
+        The saved atlas, memory-mapped.
+    """
+    import concurrent.futures
+
+    if out_dir is None:
+        out_dir = atlas_dir(voxel_size)
+    regions = list(regions)
+    start = time.perf_counter()
+    origin, shape = atlas_grid(regions, voxel_size, data_dir=data_dir)
+
+    paths = [surface_path(name, data_dir) for name in regions]
+    args = [(path, origin, voxel_size, shape) for path in paths]
+    if processes is None:
+        processes = os.cpu_count()
+    processes = min(processes, len(regions))
+    if processes <= 1:
+        packed = [_rasterize_region(*arg) for arg in args]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+            packed = list(executor.map(_rasterize_region, *zip(*args)))
+    rasterized = time.perf_counter()
+
+    # later regions first, so that earlier ones win where they overlap
+    n_voxels = int(np.prod(shape))
+    labels = np.zeros(shape, dtype=np.uint8)
+    for label in range(len(regions), 0, -1):
+        inside = np.unpackbits(packed[label-1], count=n_voxels)
+        labels[inside.reshape(shape).view(bool)] = label
+
+    sdf = signed_distance_field(labels != 0, voxel_size)
+    done = time.perf_counter()
+
+    os.makedirs(out_dir, exist_ok=True)
+    with sp._atomic_open(os.path.join(out_dir, "labels.npy")) as f:
+        np.save(f, labels)
+    with sp._atomic_open(os.path.join(out_dir, "sdf.npy")) as f:
+        np.save(f, sdf)
+    # the manifest goes last, so that a partly written atlas is not used
+    manifest = {"version": ATLAS_VERSION, "voxel_size": voxel_size,
+                "origin": origin.tolist(), "regions": regions,
+                "stamps": {name: _file_stamp(path)
+                           for name, path in zip(regions, paths)}}
+    with sp._atomic_open(os.path.join(out_dir, ATLAS_MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=1)
+
+    if report:
+        print(f"Rasterized {len(regions)} regions onto {shape} voxels of "
+              f"{voxel_size:g} um in {rasterized - start:.3f} s "
+              f"({max(processes, 1)} processes)")
+        print(f"Labels and signed distances in {done - rasterized:.3f} s, "
+              f"saved in {time.perf_counter() - done:.3f} s to {out_dir}")
+    return read_atlas(out_dir)
+
+
+def read_atlas(out_dir):
+    """ read the atlas saved in `out_dir`, memory-mapped, or None if there
+    is none or its surfaces changed since """
+    try:
+        with open(os.path.join(out_dir, ATLAS_MANIFEST)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("version") != ATLAS_VERSION:
+        return None
+    try:
+        if any(_file_stamp(stamp[0]) != stamp
+               for stamp in manifest["stamps"].values()):
+            return None
+    except OSError:
+        return None
+
+    labels = np.load(os.path.join(out_dir, "labels.npy"), mmap_mode='r')
+    sdf = np.load(os.path.join(out_dir, "sdf.npy"), mmap_mode='r')
+    return VoxelAtlas(labels, sdf, manifest["origin"],
+                      manifest["voxel_size"], manifest["regions"])
+
+
+def load_atlas(voxel_size=VOXEL_SIZE, regions=query.QUERY_REGIONS,
+               out_dir=None, processes=None, data_dir=None):
+    """ read the atlas of `voxel_size` and `regions`, building it first if
+    it is missing or out of date; see build_atlas """
+    if out_dir is None:
+        out_dir = atlas_dir(voxel_size)
+    atlas = read_atlas(out_dir)
+    if (atlas is None or atlas.voxel_size != voxel_size
+            or atlas.regions != list(regions)):
+        atlas = build_atlas(voxel_size, regions, out_dir=out_dir,
+                            processes=processes, data_dir=data_dir)
+    return atlas